@@ -0,0 +1,392 @@
+from typing import List, Dict
+from tinkoff.invest import (
+    CandleInterval, OrderDirection, OrderType,
+    StopOrderDirection, StopOrderType, StopOrderExpirationType,
+    InstrumentIdType,
+    )
+from tinkoff.invest.utils import decimal_to_quotation, quotation_to_decimal, money_to_decimal, now
+from decimal import Decimal
+
+import abc
+import asyncio
+import uuid
+
+from candle_store import candles_to_records
+from client_pool import AsyncClientPool
+from portfolio_manager import (
+    BaseOrderManager, STOP_ORDER_EXPIRE_DURATION,
+    get_stock_info, get_take_profit_price, get_stop_loss_price,
+    )
+
+
+class AsyncBaseOrderManager(abc.ABC):
+    """
+    Асинхронный вариант BaseOrderManager для event loop бота.
+    Локальное состояние (база тикеров, кэш инструментов, свечи, баланс)
+    берётся у синхронного менеджера, сетевые вызовы идут через AsyncClient.
+    """
+
+    def __init__(self, order_manager: BaseOrderManager, client_pool=None):
+        self.order_manager = order_manager
+        self.client_pool = client_pool or AsyncClientPool(order_manager.api_key)
+
+    @property
+    def capital(self):
+        return self.order_manager.capital
+
+    @property
+    def account_id(self):
+        return self.order_manager.account_id
+
+    def get_balance(self):
+        return self.order_manager.get_balance()
+
+    def get_client(self):
+        return self.client_pool.get_client()
+
+    def get_figi_by_ticker(self, ticker: str):
+        return self.order_manager.get_figi_by_ticker(ticker)
+
+    def get_tickers_by_figis(self, figis: List[str]) -> Dict:
+        return self.order_manager.get_tickers_by_figis(figis)
+
+    async def get_info_by_figi(self, figi: str) -> Dict:
+        stock_info = self.order_manager.instruments.get(figi)
+        if stock_info:
+            return stock_info
+        async with self.get_client() as client:
+            try:
+                share_response = await client.instruments.share_by(
+                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI,
+                    id=figi
+                )
+            except:
+                return {}
+        stock_info = get_stock_info(share_response.instrument)
+        self.order_manager.instruments.update(figi, stock_info)
+        return stock_info
+
+    async def get_info_by_ticker(self, ticker: str) -> Dict:
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return await self.get_info_by_figi(figi)
+
+    async def get_last_price(self, client, figi: str) -> Decimal:
+        return quotation_to_decimal((await client.market_data.get_last_prices(figi=[figi])).last_prices[0].price)
+
+    async def get_last_prices(self, figis: List[str]) -> Dict:
+        """
+        Последние цены по всем figi одним запросом: figi -> Decimal.
+        """
+        if not figis:
+            return {}
+        async with self.get_client() as client:
+            response = await client.market_data.get_last_prices(figi=list(figis))
+        return {last_price.figi: quotation_to_decimal(last_price.price) for last_price in response.last_prices}
+
+    async def get_order_book_top(self, figi: str) -> Dict:
+        async with self.get_client() as client:
+            order_book = await client.market_data.get_order_book(figi=figi, depth=1)
+        if not order_book.asks:
+            return {'ask_price': None, 'ask_quantity': 0}
+        return {'ask_price': quotation_to_decimal(order_book.asks[0].price), 'ask_quantity': order_book.asks[0].quantity}
+
+    async def get_quotes(self, figis: List[str]) -> Dict:
+        """
+        Котировки по нескольким инструментам: последние цены одним запросом,
+        верх стакана -- конкурентными запросами.
+        figi -> {'last_price', 'ask_price', 'ask_quantity'}
+        """
+        figis = list(dict.fromkeys(figis))
+        if not figis:
+            return {}
+        last_prices, *order_books = await asyncio.gather(
+            self.get_last_prices(figis),
+            *(self.get_order_book_top(figi) for figi in figis),
+        )
+        return {
+            figi: {'last_price': last_prices.get(figi), **order_book}
+            for figi, order_book in zip(figis, order_books)
+        }
+
+    async def buy_stocks_for_amount(self, amounts: Dict[str, float]) -> Dict:
+        """
+        Покупка нескольких тикеров (ticker -> сумма) с общим запросом котировок.
+        """
+        figis = {ticker: self.get_figi_by_ticker(ticker) for ticker in amounts}
+        try:
+            quotes = await self.get_quotes([figi for figi in figis.values() if figi])
+        except Exception as e:
+            print(e)
+            quotes = {}
+        results = {}
+        for ticker, amount in amounts.items():
+            results[ticker] = await self.buy_stock_for_amount(ticker, amount, quotes.get(figis[ticker]))
+        return results
+
+    async def get_candles(self, figi, days, interval):
+        """
+        Свечи через синхронный менеджер в отдельном потоке: общий CandleStore,
+        общий лимит запросов свечей и повтор неудавшихся загрузок.
+        """
+        return await asyncio.to_thread(self.order_manager.get_candles, figi, days, interval)
+
+    async def get_historical_data(self, ticker, days) -> List:
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return candles_to_records(await self.get_candles(figi, days, CandleInterval.CANDLE_INTERVAL_2_MIN))
+
+    async def get_close_prices(self, ticker, days) -> List:
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return (await self.get_candles(figi, days, CandleInterval.CANDLE_INTERVAL_15_MIN))['close'].tolist()
+
+    async def close(self):
+        await self.client_pool.close()
+        self.order_manager.close()
+
+    @abc.abstractmethod
+    async def buy_stock_now(self, ticker: str, quantity: int, atr=None):
+        pass
+
+    @abc.abstractmethod
+    async def buy_stock_for_amount(self, ticker: str, amount: float, quote=None):
+        pass
+
+    @abc.abstractmethod
+    async def sell_stock_now(self, ticker: str, quantity: int):
+        pass
+
+    @abc.abstractmethod
+    async def get_portfolio_stocks(self):
+        pass
+
+
+class AsyncTinkoffOrderManager(AsyncBaseOrderManager):
+    """
+    Асинхронный менеджер для реального счёта, обёртка над TinkoffOrderManager.
+    """
+
+    async def sell_stock_now(self, ticker: str, quantity: int) -> Decimal:
+        """
+        Возращается число -- суммарное цена всей заявки
+        """
+        async with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            post_order_response = await client.orders.post_order(
+                figi=figi,
+                order_id=uuid.uuid4().hex,
+                quantity=quantity,
+                account_id=self.account_id,
+                direction=OrderDirection.ORDER_DIRECTION_SELL,
+                order_type=OrderType.ORDER_TYPE_MARKET
+            )
+
+        return round(money_to_decimal(post_order_response.total_order_amount),2)
+
+    async def buy_stock_now(self, ticker: str, quantity: int, atr=None) -> Decimal:
+        """
+        Возращается число -- суммарное цена всей заявки
+        """
+        async with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            post_order_response = await client.orders.post_order(
+                figi=figi,
+                order_id=uuid.uuid4().hex,
+                quantity=quantity,
+                account_id=self.account_id,
+                direction=OrderDirection.ORDER_DIRECTION_BUY,
+                order_type=OrderType.ORDER_TYPE_MARKET
+            )
+
+            executed_order_price = money_to_decimal(post_order_response.executed_order_price)
+            info = await self.get_info_by_figi(figi)
+            if not info:
+                return Decimal(0)
+            try:
+                await self.set_take_profit(client, figi, executed_order_price, quantity, info, atr)
+                await self.set_stop_loss(client, figi, executed_order_price, quantity, info, atr)
+            except Exception as e:
+                print(e)
+
+        return round(money_to_decimal(post_order_response.total_order_amount),2)
+
+    async def set_take_profit(self, client, figi, executed_order_price, quantity, stock_info, atr=None):
+        take_profit_price = get_take_profit_price(executed_order_price, stock_info['price_step'], atr)
+        await client.stop_orders.post_stop_order(
+            quantity=quantity,
+            price=decimal_to_quotation(take_profit_price),
+            stop_price=decimal_to_quotation(take_profit_price),
+            direction=StopOrderDirection.STOP_ORDER_DIRECTION_SELL,
+            account_id=self.account_id,
+            stop_order_type=StopOrderType.STOP_ORDER_TYPE_TAKE_PROFIT,
+            instrument_id=figi,
+            expire_date=now() + STOP_ORDER_EXPIRE_DURATION,
+            expiration_type=StopOrderExpirationType.STOP_ORDER_EXPIRATION_TYPE_GOOD_TILL_DATE,
+        )
+
+    async def set_stop_loss(self, client, figi, executed_order_price, quantity, stock_info, atr=None):
+        stop_loss_price = get_stop_loss_price(executed_order_price, stock_info['price_step'], atr)
+        await client.stop_orders.post_stop_order(
+            quantity=quantity,
+            stop_price=decimal_to_quotation(stop_loss_price),
+            direction=StopOrderDirection.STOP_ORDER_DIRECTION_SELL,
+            account_id=self.account_id,
+            stop_order_type=StopOrderType.STOP_ORDER_TYPE_STOP_LOSS,
+            instrument_id=figi,
+            expire_date=now() + STOP_ORDER_EXPIRE_DURATION,
+            expiration_type=StopOrderExpirationType.STOP_ORDER_EXPIRATION_TYPE_GOOD_TILL_DATE,
+        )
+
+    async def buy_stock_for_amount(self, ticker: str, amount: float, quote=None) -> Decimal:
+        async with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            try:
+                tink_info = await self.get_info_by_figi(figi)
+                if not tink_info:
+                    return Decimal(0)
+                if quote is None:
+                    quote = (await self.get_quotes([figi]))[figi]
+                last_price = quote['last_price']
+                quantity = int(int(amount)//(last_price * tink_info['lot']))
+                quantity = min(quote['ask_quantity'], quantity)
+                if quantity == 0:
+                    return 0.0
+                post_order_response = await client.orders.post_order(
+                    figi=figi,
+                    order_id=uuid.uuid4().hex,
+                    quantity=quantity,
+                    account_id=self.account_id,
+                    direction=OrderDirection.ORDER_DIRECTION_BUY,
+                    order_type=OrderType.ORDER_TYPE_MARKET
+                )
+                executed_order_price = money_to_decimal(post_order_response.executed_order_price)
+                await self.set_take_profit(client, figi, executed_order_price, quantity, tink_info)
+                await self.set_stop_loss(client, figi, executed_order_price, quantity, tink_info)
+            except Exception as e:
+                print(e)
+                return str(e)
+        return round(money_to_decimal(post_order_response.total_order_amount),2)
+
+    async def get_portfolio_stocks(self) -> List[Dict]:
+        async with self.get_client() as client:
+            stocks = []
+            positions = (await client.operations.get_portfolio(account_id=self.account_id)).positions
+            tickers = self.get_tickers_by_figis([position.figi for position in positions])
+            for position in positions:
+                stock = {}
+                stock['ticker'] = tickers[position.figi]
+                stock['worth_current'] = round(money_to_decimal(position.current_price) * quotation_to_decimal(position.quantity),2)
+                stock['quantity'] = int(quotation_to_decimal(position.quantity_lots))
+                stock['profit_current'] = round(quotation_to_decimal(position.expected_yield)/stock['worth_current'] * 100, 2)
+                stocks.append(stock)
+            return stocks
+
+
+class AsyncTinkoffSandboxOrderManager(AsyncBaseOrderManager):
+    """
+    Асинхронный менеджер-эмулятор, обёртка над TinkoffSandboxOrderManager.
+    Портфель и баланс хранятся в синхронном менеджере.
+    """
+
+    async def sell_stock_now(self, ticker: str, quantity: int) -> Decimal:
+        sandbox = self.order_manager
+        worth_total = 0
+        async with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            tink_info = await self.get_info_by_figi(figi)
+            if not tink_info:
+                return Decimal(0)
+            last_price = await self.get_last_price(client, figi)
+        for stock in list(sandbox.portfolio_stocks):
+            if quantity == 0:
+                break
+            if stock['ticker'] == ticker:
+                if stock['quantity'] <= quantity:
+                    worth_total += stock['quantity'] * last_price * tink_info['lot']
+                    sandbox.balance += worth_total
+                    quantity -= stock['quantity']
+                    sandbox.portfolio_stocks.remove(stock)
+        return worth_total
+
+    async def buy_stock_now(self, ticker: str, quantity: int, atr=None) -> Decimal:
+        """
+        Эмулирует покупку quantity лотов по последней цене.
+        Возращается число -- суммарное цена всей заявки
+        """
+        sandbox = self.order_manager
+        async with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            tink_info = await self.get_info_by_figi(figi)
+            if not tink_info:
+                return Decimal(0)
+            last_price = await self.get_last_price(client, figi)
+        worth = quantity * last_price * tink_info['lot']
+        sandbox.balance -= worth
+        sandbox._add_stock_to_portfolio({'ticker': ticker, 'quantity': quantity, 'origin_price': last_price})
+        return round(worth, 2)
+
+    async def buy_stock_for_amount(self, ticker: str, amount: float, quote=None) -> Decimal:
+        sandbox = self.order_manager
+        async with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            try:
+                tink_info = await self.get_info_by_figi(figi)
+                if not tink_info:
+                    return Decimal(0)
+                if quote is None:
+                    quote = (await self.get_quotes([figi]))[figi]
+                last_price = quote['last_price']
+                quantity = int(int(amount)//(last_price * tink_info['lot']))
+                quantity = min(quote['ask_quantity'], quantity)
+                if quantity == 0:
+                    return Decimal(0)
+                sandbox.balance -= quantity * last_price * tink_info['lot']
+                stock = {}
+                stock['ticker'] = ticker
+                stock['quantity'] = quantity
+                stock['origin_price'] = last_price
+                sandbox._add_stock_to_portfolio(stock)
+            except Exception as e:
+                print(e)
+                return str(e)
+
+        return round(quantity * last_price * tink_info['lot'],2)
+
+    async def get_portfolio_stocks(self) -> List[Dict]:
+        stocks = []
+        portfolio_stocks = self.order_manager.portfolio_stocks
+        figis = {stock['ticker']: self.get_figi_by_ticker(stock['ticker']) for stock in portfolio_stocks}
+        if not all(figis.values()):
+            return Decimal(0)
+        last_prices = await self.get_last_prices(list(figis.values()))
+        for stock in portfolio_stocks:
+            stock_display = stock
+            figi = figis[stock['ticker']]
+            tink_info = await self.get_info_by_figi(figi)
+            if not tink_info:
+                return Decimal(0)
+            last_price = last_prices.get(figi)
+            if last_price is None:
+                # API не вернул цену: позиция попадёт в список в следующий раз
+                print(f"Нет последней цены по {stock['ticker']}")
+                continue
+            stock_display['worth_current'] = round(last_price * stock['quantity'] * tink_info['lot'],2)
+            stock_display['profit_current'] = round((last_price - stock['origin_price'])/stock['origin_price']*100, 2)
+            stocks.append(stock_display)
+        return stocks
@@ -0,0 +1,305 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from tinkoff.invest import CandleInterval
+
+from config import Config
+from candle_store import CandleStore
+from data_handler import JsonDBHandler
+from data_reciever import generate_signals_panel
+from portfolio_manager import TAKE_PROFIT_PERCENTAGE, STOP_LOSS_PERCENTAGE
+
+
+def load_panel(store: CandleStore, instruments, interval=CandleInterval.CANDLE_INTERVAL_2_MIN, from_time=None):
+    """
+    Читает свечи из хранилища и выравнивает их по общей временной шкале.
+
+    :param instruments: Словарь ticker -> figi.
+    :return: Словарь: 'tickers', 'time' (unix time, с), матрицы (тикеры x бары)
+        'open', 'high', 'low', 'close', 'volume' и 'mask' -- есть ли у тикера бар в этот момент.
+    """
+    tickers = list(instruments)
+    columns = [store.read(instruments[ticker], interval, from_time) for ticker in tickers]
+    times = np.unique(np.concatenate([data['time'] for data in columns] + [np.empty(0, dtype=np.int64)]))
+
+    panel = {'tickers': tickers, 'time': times, 'mask': np.zeros((len(tickers), len(times)), dtype=bool)}
+    for column in ('open', 'high', 'low', 'close', 'volume'):
+        panel[column] = np.full((len(tickers), len(times)), np.nan)
+    for i, data in enumerate(columns):
+        positions = np.searchsorted(times, data['time'])
+        panel['mask'][i, positions] = True
+        for column in ('open', 'high', 'low', 'close', 'volume'):
+            panel[column][i, positions] = data[column]
+    return panel
+
+
+class Backtester:
+    """
+    Бэктест NadarayaWatsonStrategy на сохранённых свечах, без обращения к API.
+
+    Бары проходят по одному, но все тикеры на баре обрабатываются одним набором
+    операций numpy. Сигнал считается по закрытию бара, сделка -- по открытию
+    следующего бара тикера. Правила повторяют бота:
+    - покупка на зелёном сигнале Надарая-Уотсона, на сумму amount, не больше max_positions позиций;
+    - продажа как в check_sell: красный сигнал или MoneyFlow >= mfi_exit;
+    - тейк-профит и стоп-лосс в процентах или, при use_atr, на ATR от цены входа.
+    Если за бар задеты оба уровня, считается, что первым сработал стоп-лосс.
+    """
+    def __init__(self, bandwith=23, r=20, x0=25, lag=2, capital=Config.CAPITAL, amount=300, max_positions=12,
+                 take_profit=TAKE_PROFIT_PERCENTAGE, stop_loss=STOP_LOSS_PERCENTAGE, use_atr=False,
+                 atr_period=14, mfi_period=14, mfi_exit=80, commission=0.0):
+        self.bandwith = bandwith
+        self.r = r
+        self.x0 = x0
+        self.lag = lag
+        self.capital = capital
+        self.amount = amount
+        self.max_positions = max_positions
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.use_atr = use_atr
+        self.atr_period = atr_period
+        self.mfi_period = mfi_period
+        self.mfi_exit = mfi_exit
+        self.commission = commission
+
+    @classmethod
+    def from_strategy(cls, strategy, **kwargs):
+        """
+        Бэктестер с параметрами ядра из NadarayaWatsonStrategy.
+        """
+        return cls(bandwith=strategy.bandwith, r=strategy.r, x0=strategy.x0, **kwargs)
+
+    def get_signals(self, panel, cache=None):
+        """
+        Сигналы входа и выхода на каждом баре (тикеры x бары).
+        :param cache: Кэш для повторных вызовов на той же панели, см. generate_signals_panel.
+        """
+        if cache is None:
+            cache = {}
+        mask = panel['mask']
+        signals = generate_signals_panel(panel['close'], h=self.bandwith, r=self.r, x_0=self.x0,
+                                         smooth_colors=True, lag=self.lag, mask=mask, cache=cache)
+        if ('atr', self.atr_period) not in cache or ('mfi', self.mfi_period) not in cache:
+            order, inverse = _get_order(mask)
+            compact = {column: np.take_along_axis(panel[column], order, axis=1) for column in ('high', 'low', 'close', 'volume')}
+            cache[('atr', self.atr_period)] = np.take_along_axis(_calculate_atr(compact, self.atr_period), inverse, axis=1)
+            cache[('mfi', self.mfi_period)] = np.take_along_axis(_calculate_mfi(compact, self.mfi_period), inverse, axis=1)
+        atr = cache[('atr', self.atr_period)]
+        mfi = cache[('mfi', self.mfi_period)]
+        return {
+            'entry': signals['plotColor'] == 'green',
+            'exit_signal': signals['plotColor'] == 'red',
+            'exit_mfi': mfi >= self.mfi_exit,
+            'atr': atr,
+        }
+
+    def run(self, panel, entries=None, lots=None, cache=None):
+        """
+        :param panel: Результат load_panel.
+        :param entries: Своя булева матрица сигналов входа вместо сигналов Надарая-Уотсона.
+        :param lots: Словарь ticker -> размер лота, по умолчанию 1.
+        :param cache: Кэш для прогонов с разными параметрами на той же панели.
+        :return: Словарь: 'pnl', 'return', 'max_drawdown', 'n_trades', 'win_rate',
+            'trades' (DataFrame) и 'equity' (Series по времени).
+        """
+        tickers = panel['tickers']
+        times = panel['time']
+        mask = panel['mask']
+        n_tickers, n_bars = mask.shape
+        signals = self.get_signals(panel, cache)
+        if entries is not None:
+            signals['entry'] = np.asarray(entries, dtype=bool) & mask
+
+        # Решение принимается по предыдущему бару того же тикера
+        if cache is None or 'order' not in cache:
+            order, inverse = _get_order(mask)
+            if cache is not None:
+                cache['order'] = (order, inverse)
+        else:
+            order, inverse = cache['order']
+        # Цикл идёт по барам, поэтому матрицы транспонируются в (бары x тикеры)
+        previous = {
+            key: np.ascontiguousarray(np.take_along_axis(_shift_right(np.take_along_axis(values, order, axis=1)), inverse, axis=1).T)
+            for key, values in signals.items()
+        }
+        bars = {column: np.ascontiguousarray(panel[column].T) for column in ('open', 'high', 'low')}
+        active_bars = np.ascontiguousarray(mask.T)
+        last_close = pd.DataFrame(panel['close'].T).ffill().to_numpy()
+        lot = np.array([(lots or {}).get(ticker, 1) for ticker in tickers], dtype=np.float64)
+
+        cash = float(self.capital)
+        held = np.zeros(n_tickers, dtype=bool)
+        quantity = np.zeros(n_tickers)
+        entry_price = np.zeros(n_tickers)
+        entry_bar = np.zeros(n_tickers, dtype=np.int64)
+        take_profit = np.zeros(n_tickers)
+        stop_loss = np.zeros(n_tickers)
+        equity = np.empty(n_bars)
+        trades = []
+
+        def close_positions(selected, prices, reason, bar):
+            nonlocal cash
+            if not selected.any():
+                return
+            for i in np.nonzero(selected)[0]:
+                value = quantity[i] * prices[i]
+                cash += value - value * self.commission
+                trades.append({
+                    'ticker': tickers[i],
+                    'entry_time': times[entry_bar[i]],
+                    'exit_time': times[bar],
+                    'entry_price': entry_price[i],
+                    'exit_price': prices[i],
+                    'quantity': quantity[i],
+                    'pnl': quantity[i] * (prices[i] - entry_price[i]) - self.commission * quantity[i] * (prices[i] + entry_price[i]),
+                    'reason': reason,
+                })
+            held[selected] = False
+            quantity[selected] = 0
+
+        for bar in range(n_bars):
+            active = active_bars[bar]
+            open_, high, low = bars['open'][bar], bars['high'][bar], bars['low'][bar]
+
+            # Продажа по сигналу -- по открытию бара
+            exit_signal = held & active & previous['exit_signal'][bar]
+            exit_mfi = held & active & previous['exit_mfi'][bar] & ~exit_signal
+            close_positions(exit_signal, open_, 'signal', bar)
+            close_positions(exit_mfi, open_, 'mfi', bar)
+
+            # Покупка по открытию бара, в порядке тикеров, пока есть слоты и деньги
+            candidates = active & ~held & ~exit_signal & ~exit_mfi & previous['entry'][bar]
+            free_slots = self.max_positions - int(held.sum())
+            for i in np.nonzero(candidates)[0][:max(free_slots, 0)]:
+                count = np.floor(self.amount / (open_[i] * lot[i])) * lot[i]
+                cost = count * open_[i]
+                if count <= 0 or cost * (1 + self.commission) > cash:
+                    continue
+                cash -= cost * (1 + self.commission)
+                held[i] = True
+                quantity[i] = count
+                entry_price[i] = open_[i]
+                entry_bar[i] = bar
+                atr = previous['atr'][bar, i]
+                if self.use_atr and atr > 0:
+                    take_profit[i] = open_[i] + atr
+                    stop_loss[i] = open_[i] - atr
+                else:
+                    take_profit[i] = open_[i] * (1 + self.take_profit)
+                    stop_loss[i] = open_[i] * (1 + self.stop_loss)
+
+            # Стоп-заявки внутри бара; при гэпе исполнение по цене открытия
+            watched = held & active
+            hit_stop = watched & (low <= stop_loss)
+            hit_take = watched & ~hit_stop & (high >= take_profit)
+            close_positions(hit_stop, np.minimum(open_, stop_loss), 'sl', bar)
+            close_positions(hit_take, np.maximum(open_, take_profit), 'tp', bar)
+
+            equity[bar] = cash + np.dot(quantity[held], last_close[bar, held])
+
+        if n_bars:
+            close_positions(held.copy(), last_close[-1], 'end', n_bars - 1)
+            equity[-1] = cash
+        return self._get_report(times, equity, trades)
+
+    def _get_report(self, times, equity, trades):
+        trades = pd.DataFrame(trades, columns=['ticker', 'entry_time', 'exit_time', 'entry_price',
+                                               'exit_price', 'quantity', 'pnl', 'reason'])
+        for column in ('entry_time', 'exit_time'):
+            trades[column] = pd.to_datetime(trades[column], unit='s', utc=True)
+        equity = pd.Series(equity, index=pd.to_datetime(times, unit='s', utc=True), name='equity')
+        peak = np.maximum.accumulate(equity.to_numpy()) if len(equity) else np.empty(0)
+        drawdown = (peak - equity.to_numpy()) / peak if len(equity) else np.zeros(1)
+        final = equity.iloc[-1] if len(equity) else self.capital
+        return {
+            'pnl': final - self.capital,
+            'return': (final - self.capital) / self.capital,
+            'max_drawdown': float(np.max(drawdown, initial=0)),
+            'n_trades': len(trades),
+            'win_rate': float((trades['pnl'] > 0).mean()) if len(trades) else 0.0,
+            'trades': trades,
+            'equity': equity,
+        }
+
+
+def _get_order(mask):
+    """
+    Перестановка, прижимающая валидные бары каждого тикера влево, и обратная к ней.
+    """
+    order = np.argsort(~mask, axis=1, kind='stable')
+    return order, np.argsort(order, axis=1)
+
+
+def _shift_right(values):
+    shifted = np.empty_like(values)
+    shifted[:, 1:] = values[:, :-1]
+    shifted[:, :1] = False if values.dtype == bool else np.nan
+    return shifted
+
+
+def _rolling_sum(values, window):
+    """
+    Скользящая сумма по строкам; NaN, пока в окне есть пропуски.
+    """
+    valid = ~np.isnan(values)
+    total = np.cumsum(np.where(valid, values, 0), axis=1)
+    count = np.cumsum(valid, axis=1)
+    result = np.full(values.shape, np.nan)
+    if values.shape[1] < window:
+        return result
+    total = np.concatenate((np.zeros((len(values), 1)), total), axis=1)
+    count = np.concatenate((np.zeros((len(values), 1)), count), axis=1)
+    window_total = total[:, window:] - total[:, :-window]
+    window_count = count[:, window:] - count[:, :-window]
+    result[:, window - 1:] = np.where(window_count == window, window_total, np.nan)
+    return result
+
+
+def _calculate_atr(compact, period):
+    """
+    ATR как простое среднее true range за period баров.
+    """
+    previous_close = _shift_right(compact['close'])
+    true_range = np.fmax(compact['high'] - compact['low'],
+                         np.fmax(np.abs(compact['high'] - previous_close), np.abs(compact['low'] - previous_close)))
+    return _rolling_sum(true_range, period) / period
+
+
+def _calculate_mfi(compact, period):
+    """
+    Money Flow Index за period баров (аналог MoneyFlow скринера, но на интервале бэктеста).
+    """
+    typical_price = (compact['high'] + compact['low'] + compact['close']) / 3
+    money_flow = typical_price * compact['volume']
+    previous_price = _shift_right(typical_price)
+    changed = ~np.isnan(previous_price) & ~np.isnan(typical_price)
+    positive = _rolling_sum(np.where(changed, np.where(typical_price > previous_price, money_flow, 0), np.nan), period)
+    negative = _rolling_sum(np.where(changed, np.where(typical_price < previous_price, money_flow, 0), np.nan), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + positive / negative)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест NadarayaWatsonStrategy по свечам из CandleStore")
+    parser.add_argument('--db', default=Config.DB_FILE_PATH, help="База ticker -> figi")
+    parser.add_argument('--candles', default=Config.CANDLES_PATH)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--atr', action='store_true', help="Тейк-профит и стоп-лосс на ATR")
+    args = parser.parse_args()
+
+    instruments = {
+        ticker: figi for ticker, figi in JsonDBHandler(args.db).get_data().items()
+        if isinstance(figi, str) and ticker != 'last_update_time'
+    }
+    panel = load_panel(CandleStore(args.candles), instruments, from_time=datetime.now(timezone.utc) - timedelta(days=args.days))
+    report = Backtester(use_atr=args.atr).run(panel)
+    print(report['trades'])
+    print(f"PnL: {report['pnl']:.2f} ({report['return']:.2%}), сделок: {report['n_trades']}, "
+          f"доля прибыльных: {report['win_rate']:.2%}, макс. просадка: {report['max_drawdown']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
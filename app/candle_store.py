@@ -0,0 +1,293 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+class CandleStore:
+    """
+    Локальное колоночное хранилище свечей.
+    Для каждой пары (figi, interval) -- отдельный каталог, по файлу на колонку.
+    Файлы только дописываются и читаются через np.memmap, поэтому
+    обновление стоит O(новых баров), а не O(всей истории).
+
+    Потокобезопасен: операции с одной парой (figi, interval) идут по очереди.
+    Запись устойчива к падению процесса: длина ряда -- минимум по колонкам,
+    а слияние сначала пишет все колонки во временные файлы и подменяет их
+    после отметки о готовности (при следующем обращении подмена доводится до конца).
+    """
+    COLUMNS = {
+        'time': np.int64,  # unix time в секундах, UTC
+        'open': np.float64,
+        'high': np.float64,
+        'low': np.float64,
+        'close': np.float64,
+        'volume': np.int64,
+    }
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.last_times = {}
+        self.first_times = {}
+        # Самое раннее время, с которого бары уже запрашивались у API
+        self.covered_from = {}
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def _get_lock(self, figi, interval):
+        key = (figi, int(interval))
+        with self.locks_lock:
+            if key not in self.locks:
+                self.locks[key] = threading.RLock()
+            return self.locks[key]
+
+    def _get_dir(self, figi, interval):
+        return os.path.join(self.root_dir, f"{figi}_{int(interval)}")
+
+    def _get_column_path(self, figi, interval, column):
+        return os.path.join(self._get_dir(figi, interval), f"{column}.bin")
+
+    def _get_merge_marker_path(self, figi, interval):
+        return os.path.join(self._get_dir(figi, interval), "merge")
+
+    def _recover(self, figi, interval):
+        """
+        Доводит до конца слияние, прерванное после записи всех временных файлов,
+        или удаляет временные файлы недописанного слияния.
+        """
+        marker = self._get_merge_marker_path(figi, interval)
+        is_complete = os.path.exists(marker)
+        for column in self.COLUMNS:
+            path = self._get_column_path(figi, interval, column)
+            if os.path.exists(path + '.tmp'):
+                if is_complete:
+                    os.replace(path + '.tmp', path)
+                else:
+                    os.remove(path + '.tmp')
+        if is_complete:
+            os.remove(marker)
+
+    def _get_size(self, figi, interval):
+        """
+        Число полностью записанных баров (минимум по всем колонкам):
+        бары, которые успели дописаться не во все колонки, не читаются.
+        """
+        self._recover(figi, interval)
+        size = None
+        for column, dtype in self.COLUMNS.items():
+            path = self._get_column_path(figi, interval, column)
+            column_size = os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+            size = column_size if size is None else min(size, column_size)
+        return size
+
+    def _load_column(self, figi, interval, column, size):
+        if size == 0:
+            return np.empty(0, dtype=self.COLUMNS[column])
+        return np.memmap(self._get_column_path(figi, interval, column), dtype=self.COLUMNS[column], mode='r', shape=(size,))
+
+    def get_last_time(self, figi, interval):
+        key = (figi, int(interval))
+        with self._get_lock(figi, interval):
+            if key not in self.last_times:
+                size = self._get_size(figi, interval)
+                self.last_times[key] = int(self._load_column(figi, interval, 'time', size)[-1]) if size else None
+            return self.last_times[key]
+
+    def _read_column(self, figi, interval, column, start, size):
+        dtype = np.dtype(self.COLUMNS[column])
+        if start >= size:
+            return np.empty(0, dtype=dtype)
+        return np.fromfile(self._get_column_path(figi, interval, column), dtype=dtype, count=size - start, offset=start * dtype.itemsize)
+
+    def read(self, figi, interval, from_time=None):
+        """
+        Возвращает словарь колонка -> массив для баров с time >= from_time.
+        Поиск начала окна идёт по memmap колонки времени, с диска читается только окно.
+        """
+        with self._get_lock(figi, interval):
+            return self._read(figi, interval, from_time)
+
+    def _read(self, figi, interval, from_time):
+        size = self._get_size(figi, interval)
+        start = 0
+        if from_time is not None and size:
+            times = self._load_column(figi, interval, 'time', size)
+            start = int(np.searchsorted(times, to_timestamp(from_time), side='left'))
+            del times
+        return {
+            column: self._read_column(figi, interval, column, start, size)
+            for column in self.COLUMNS
+        }
+
+    def get_first_time(self, figi, interval):
+        key = (figi, int(interval))
+        with self._get_lock(figi, interval):
+            if key not in self.first_times:
+                size = self._get_size(figi, interval)
+                self.first_times[key] = int(self._load_column(figi, interval, 'time', size)[0]) if size else None
+            return self.first_times[key]
+
+    def write(self, figi, interval, columns):
+        """
+        Записывает отсортированные по времени бары.
+        Если новые бары продолжают сохранённые, перезаписывается только хвост
+        с time >= первого нового (последняя свеча обычно ещё не закрыта).
+        Если новые бары начинаются раньше или не доходят до конца сохранённых,
+        ряды сливаются, при совпадении времени остаётся новый бар.
+        """
+        with self._get_lock(figi, interval):
+            self._write(figi, interval, columns)
+
+    def _write(self, figi, interval, columns):
+        times = np.asarray(columns['time'], dtype=np.int64)
+        if not len(times):
+            return
+
+        os.makedirs(self._get_dir(figi, interval), exist_ok=True)
+        size = self._get_size(figi, interval)
+        stored_times = self._load_column(figi, interval, 'time', size)
+        if size and (times[0] < stored_times[0] or times[-1] < stored_times[-1]):
+            del stored_times
+            self._merge(figi, interval, columns, size)
+            return
+        keep = int(np.searchsorted(stored_times, times[0], side='left'))
+        # memmap нужно отпустить до усечения файла
+        del stored_times
+
+        # Сначала все колонки усекаются, потом дописываются: при падении между шагами
+        # первые min(длин) баров во всех колонках -- одни и те же бары
+        for column, dtype in self.COLUMNS.items():
+            path = self._get_column_path(figi, interval, column)
+            with open(path, 'ab') as file:
+                file.truncate(keep * np.dtype(dtype).itemsize)
+        for column, dtype in self.COLUMNS.items():
+            path = self._get_column_path(figi, interval, column)
+            with open(path, 'ab') as file:
+                file.write(np.asarray(columns[column], dtype=dtype).tobytes())
+
+        key = (figi, int(interval))
+        self.last_times[key] = int(times[-1])
+        if not keep:
+            self.first_times[key] = int(times[0])
+
+    def _merge(self, figi, interval, columns, size):
+        """
+        Сливает новые бары с сохранёнными и переписывает колонки целиком.
+        """
+        stored = {column: self._read_column(figi, interval, column, 0, size) for column in self.COLUMNS}
+        merged = {
+            column: np.concatenate((np.asarray(columns[column], dtype=dtype), stored[column]))
+            for column, dtype in self.COLUMNS.items()
+        }
+        # Новые бары идут первыми, устойчивая сортировка оставляет их при совпадении времени
+        order = np.argsort(merged['time'], kind='stable')
+        times = merged['time'][order]
+        unique = np.concatenate(([True], times[1:] != times[:-1]))
+        for column in self.COLUMNS:
+            path = self._get_column_path(figi, interval, column)
+            with open(path + '.tmp', 'wb') as file:
+                file.write(merged[column][order][unique].tobytes())
+        # После отметки слияние считается выполненным, см. _recover
+        marker = self._get_merge_marker_path(figi, interval)
+        open(marker + '.tmp', 'wb').close()
+        os.replace(marker + '.tmp', marker)
+        self._recover(figi, interval)
+
+        key = (figi, int(interval))
+        self.first_times[key] = int(times[0])
+        self.last_times[key] = int(times[-1])
+
+    def sync(self, figi, interval, from_time, fetch):
+        """
+        Догружает недостающие бары и возвращает окно с from_time.
+        Если окно начинается раньше сохранённых баров, сначала догружается начало окна.
+
+        :param fetch: Функция fetch(from_time, to_time=None) -> словарь колонок
+            или None, если запрос не удался (тогда ничего не записывается
+            и следующий sync повторит запрос с того же места).
+        """
+        # Два sync одной пары из разных потоков иначе перемешали бы усечение и дозапись колонок
+        with self._get_lock(figi, interval):
+            return self._sync(figi, interval, from_time, fetch)
+
+    def _sync(self, figi, interval, from_time, fetch):
+        key = (figi, int(interval))
+        backfill_to = self.get_backfill_to(figi, interval, from_time)
+        if backfill_to is not None:
+            columns = fetch(from_time, backfill_to)
+            if columns is not None:
+                self.write(figi, interval, columns)
+                self.covered_from[key] = to_timestamp(from_time)
+
+        fetch_from = self.get_fetch_from(figi, interval, from_time)
+        columns = fetch(fetch_from)
+        if columns is not None:
+            self.write(figi, interval, columns)
+            if to_timestamp(fetch_from) == to_timestamp(from_time):
+                self.covered_from[key] = to_timestamp(from_time)
+        return self.read(figi, interval, from_time)
+
+    def get_fetch_from(self, figi, interval, from_time):
+        """
+        С какого момента запрашивать новые бары у API: последний сохранённый бар или from_time.
+        """
+        last_time = self.get_last_time(figi, interval)
+        if last_time is not None and last_time > to_timestamp(from_time):
+            return datetime.fromtimestamp(last_time, tz=timezone.utc)
+        return from_time
+
+    def get_backfill_to(self, figi, interval, from_time):
+        """
+        Если начало окна [from_time, первый сохранённый бар) ещё не запрашивалось,
+        возвращает его конец, иначе None.
+        """
+        first_time = self.get_first_time(figi, interval)
+        if first_time is None or self.get_last_time(figi, interval) <= to_timestamp(from_time):
+            return None
+        # В начале окна может не быть баров (рынок закрыт): запрошенное начало запоминается,
+        # чтобы не спрашивать API заново на каждом цикле
+        covered_from = min(first_time, self.covered_from.get((figi, int(interval)), first_time))
+        if to_timestamp(from_time) < covered_from:
+            return datetime.fromtimestamp(covered_from, tz=timezone.utc)
+        return None
+
+    def clean(self, figi, interval):
+        with self._get_lock(figi, interval):
+            self._clean(figi, interval)
+
+    def _clean(self, figi, interval):
+        for column in self.COLUMNS:
+            path = self._get_column_path(figi, interval, column)
+            if os.path.exists(path):
+                os.remove(path)
+        self.last_times.pop((figi, int(interval)), None)
+        self.first_times.pop((figi, int(interval)), None)
+        self.covered_from.pop((figi, int(interval)), None)
+
+
+def to_timestamp(time):
+    if isinstance(time, datetime):
+        return int(time.timestamp())
+    return int(time)
+
+
+def candles_to_records(columns):
+    """
+    Колонки хранилища -> список свечей в формате get_historical_data.
+    """
+    return [
+        {
+            'close': close,
+            'open': open_,
+            'high': high,
+            'low': low,
+            'volume': volume,
+            'time': datetime.fromtimestamp(time, tz=timezone.utc),
+        }
+        for time, open_, high, low, close, volume in zip(
+            columns['time'].tolist(), columns['open'].tolist(), columns['high'].tolist(),
+            columns['low'].tolist(), columns['close'].tolist(), columns['volume'].tolist(),
+        )
+    ]
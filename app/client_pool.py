@@ -0,0 +1,220 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import grpc
+from tinkoff.invest import AsyncClient
+from tinkoff.invest.channels import create_channel
+from tinkoff.invest.constants import INVEST_GRPC_API
+from tinkoff.invest.exceptions import RequestError
+from tinkoff.invest.services import Services
+
+from metrics import CountingServices
+
+# Коды, после которых канал пересоздаётся при следующем обращении
+RECONNECT_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.UNKNOWN,
+    grpc.StatusCode.INTERNAL,
+)
+
+
+class ClientPool:
+    """
+    Долгоживущий gRPC-канал к API Тинькофф, общий для всех вызовов менеджера.
+    get_client() используется так же, как Client(token): `with pool.get_client() as client`,
+    но канал не закрывается после каждого вызова. Потокобезопасен.
+
+    services_factory -- функция без аргументов, возвращающая объект вместо Services
+    (например, FakeTinkoffAPI.get_services для работы без сети). Канал тогда не открывается.
+    metrics -- Metrics, в котором считаются вызовы методов API.
+    """
+    def __init__(self, api_key, target=INVEST_GRPC_API, secure=True, health_check_interval=60, connect_timeout=10,
+                 services_factory=None, metrics=None):
+        self.api_key = api_key
+        self.target = target
+        self.secure = secure
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.services_factory = services_factory
+        self.metrics = metrics
+        self.channel = None
+        self.services = None
+        self.last_check_time = 0
+        self.reconnects = 0
+        self.lock = threading.Lock()
+
+    def _create_channel(self):
+        if self.secure:
+            return create_channel(target=self.target)
+        return grpc.insecure_channel(self.target)
+
+    def _connect(self):
+        if self.services_factory is not None:
+            self.services = self.services_factory()
+        else:
+            self.channel = self._create_channel()
+            self.services = Services(self.channel, token=self.api_key)
+        if self.metrics is not None:
+            self.services = CountingServices(self.services, self.metrics)
+        self.last_check_time = time.monotonic()
+
+    def _disconnect(self):
+        if self.channel is not None:
+            self.channel.close()
+        self.channel = None
+        self.services = None
+
+    def _is_healthy(self, channel):
+        if channel is None:
+            return True
+        try:
+            grpc.channel_ready_future(channel).result(timeout=self.connect_timeout)
+        except grpc.FutureTimeoutError:
+            return False
+        return True
+
+    def acquire(self) -> Services:
+        with self.lock:
+            if self.services is None:
+                self._connect()
+                return self.services
+            services = self.services
+            if time.monotonic() - self.last_check_time <= self.health_check_interval:
+                return services
+            # Канал проверяет один поток и без блокировки: проверка ждёт до connect_timeout,
+            # остальные потоки пока работают со старым каналом
+            self.last_check_time = time.monotonic()
+            channel = self.channel
+        if self._is_healthy(channel):
+            return services
+        with self.lock:
+            # Канал могли уже пересоздать через invalidate()
+            if self.channel is channel:
+                self._disconnect()
+                self.reconnects += 1
+            if self.services is None:
+                self._connect()
+            return self.services
+
+    def invalidate(self):
+        """
+        Помечает канал сломанным, следующий acquire() откроет новый.
+        """
+        with self.lock:
+            self._disconnect()
+            self.reconnects += 1
+
+    @contextmanager
+    def get_client(self):
+        services = self.acquire()
+        try:
+            yield services
+        except (RequestError, grpc.RpcError) as e:
+            if _get_status_code(e) in RECONNECT_CODES:
+                self.invalidate()
+            raise
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+
+class RateLimiter:
+    """
+    Потокобезопасный token bucket: не больше rate запросов за period секунд.
+    """
+    def __init__(self, rate, period=60):
+        self.rate = rate
+        self.period = period
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Неблокирующий вариант acquire: False, если лимит исчерпан.
+        """
+        with self.lock:
+            current_time = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (current_time - self.updated) * self.rate / self.period)
+            self.updated = current_time
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                current_time = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (current_time - self.updated) * self.rate / self.period)
+                self.updated = current_time
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) * self.period / self.rate
+            time.sleep(wait_time)
+
+
+class AsyncClientPool:
+    """
+    Асинхронный аналог ClientPool поверх AsyncClient.
+    Клиент открывается лениво, внутри работающего event loop.
+    services_factory и metrics -- как в ClientPool, но объект должен быть асинхронным.
+    """
+    def __init__(self, api_key, target=INVEST_GRPC_API, services_factory=None, metrics=None):
+        self.api_key = api_key
+        self.target = target
+        self.services_factory = services_factory
+        self.metrics = metrics
+        self.client = None
+        self.services = None
+        self.reconnects = 0
+        self.lock = None
+
+    async def acquire(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.services is None and self.services_factory is not None:
+                self.services = self.services_factory()
+            elif self.services is None:
+                self.client = AsyncClient(self.api_key, target=self.target)
+                self.services = await self.client.__aenter__()
+            if self.metrics is not None and not isinstance(self.services, CountingServices):
+                self.services = CountingServices(self.services, self.metrics)
+            return self.services
+
+    async def _disconnect(self):
+        client = self.client
+        self.client = None
+        self.services = None
+        if client is not None:
+            await client.__aexit__(None, None, None)
+
+    async def invalidate(self):
+        await self._disconnect()
+        self.reconnects += 1
+
+    @asynccontextmanager
+    async def get_client(self):
+        services = await self.acquire()
+        try:
+            yield services
+        except (RequestError, grpc.RpcError) as e:
+            if _get_status_code(e) in RECONNECT_CODES:
+                await self.invalidate()
+            raise
+
+    async def close(self):
+        await self._disconnect()
+
+
+def _get_status_code(error):
+    if isinstance(error, RequestError):
+        return error.code
+    if callable(getattr(error, 'code', None)):
+        return error.code()
+    return None
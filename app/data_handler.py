@@ -1,5 +1,6 @@
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from decimal import Decimal
 
 class JsonDBHandler:
     def __init__(self, file_path):
@@ -9,13 +10,27 @@ class JsonDBHandler:
         except FileNotFoundError:
             self.file = open(self.file_path, 'w+')
         self.data = self.load_data_from_file()
+        self.reverse_index = {}
+        self._build_reverse_index()
 
     def __del__(self):
         self.file.close()
 
     def clean_data(self):
         self.data = {}
+        self.reverse_index = {}
         self.save_data_to_file()
+
+    def _build_reverse_index(self):
+        """
+        Обратный индекс info -> ticker. При совпадающих info, как и при
+        линейном поиске, побеждает первый по порядку тикер.
+        Нехешируемые значения (словари, списки) в индекс не попадают.
+        """
+        self.reverse_index = {}
+        for ticker, info in self.data.items():
+            if _is_hashable(info):
+                self.reverse_index.setdefault(info, ticker)
     
     def load_data_from_file(self):
         try:
@@ -38,13 +53,37 @@ class JsonDBHandler:
             return None
     
     def get_ticker_by_info(self, stock_info):
+        if _is_hashable(stock_info):
+            return self.reverse_index.get(stock_info)
         for ticker, info in self.data.items():
             if stock_info == info:
                 return ticker
         return None    
+
+    def get_tickers_by_infos(self, stock_infos):
+        """
+        Пакетный обратный поиск: info -> ticker (None, если не найден).
+        """
+        return {stock_info: self.get_ticker_by_info(stock_info) for stock_info in stock_infos}
     
     def update_data(self, ticker, stock_info):
+        old_info = self.data.get(ticker)
         self.data[ticker] = stock_info
+        if _is_hashable(old_info) and old_info != stock_info and self.reverse_index.get(old_info) == ticker:
+            # Тот же info может быть и у другого тикера -- тогда индекс переходит к нему
+            self._reindex(old_info)
+        if _is_hashable(stock_info) and self.reverse_index.setdefault(stock_info, ticker) != ticker:
+            self._reindex(stock_info)
+
+    def _reindex(self, info):
+        """
+        Пересчитывает запись индекса для info линейным поиском (только при совпадающих info).
+        """
+        ticker = next((ticker for ticker, value in self.data.items() if value == info), None)
+        if ticker is None:
+            self.reverse_index.pop(info, None)
+        else:
+            self.reverse_index[info] = ticker
 
     def get_last_update_time(self):
         last_update_str = self.data.get('last_update_time')
@@ -54,7 +93,63 @@ class JsonDBHandler:
 
     def save_last_update_time(self, current_time):
         # Сохраняем дату последнего обновления в базу данных
-        self.data['last_update_time'] = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        self.update_data('last_update_time', current_time.strftime("%Y-%m-%d %H:%M:%S"))
 
     def close(self):
-        self.save_data_to_file()
\ No newline at end of file
+        self.save_data_to_file()
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+class InstrumentCache:
+    """
+    Кэш информации об инструментах (lot, ticker, price_step) по figi.
+    Хранится в JSON рядом с базой тикер -> figi, поиск -- по словарю в памяти.
+    Устаревший кэш продолжает отдавать значения, обновляется он через refresh_instruments менеджера
+    (в боте -- периодической задачей планировщика).
+    """
+    def __init__(self, file_path, ttl=timedelta(days=1)):
+        self.db = JsonDBHandler(file_path)
+        self.ttl = ttl
+        self.instruments = {
+            figi: self._from_json(info)
+            for figi, info in self.db.get_data().items()
+            if isinstance(info, dict)
+        }
+
+    def _from_json(self, info):
+        stock_info = dict(info)
+        stock_info['price_step'] = Decimal(stock_info['price_step'])
+        return stock_info
+
+    def _to_json(self, stock_info):
+        info = dict(stock_info)
+        info['price_step'] = str(info['price_step'])
+        return info
+
+    def get(self, figi):
+        return self.instruments.get(figi)
+
+    def update(self, figi, stock_info):
+        self.instruments[figi] = stock_info
+        self.db.update_data(figi, self._to_json(stock_info))
+
+    def is_expired(self, current_time=None):
+        last_update_time = self.db.get_last_update_time()
+        if not last_update_time:
+            return True
+        return ((current_time or datetime.now()) - last_update_time) >= self.ttl
+
+    def save(self, current_time=None):
+        if current_time:
+            self.db.save_last_update_time(current_time)
+        self.db.save_data_to_file()
+
+    def clean(self):
+        self.instruments = {}
+        self.db.clean_data()
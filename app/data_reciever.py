@@ -2,21 +2,37 @@ from tradingview_screener import Query, Column as col
 
 import pandas as pd
 import numpy as np
-import numpy as np
 
-from typing import List
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from typing import List, Dict
+import time
 
 from portfolio_manager import TinkoffOrderManager, TinkoffSandboxOrderManager
-from  predictor import RFPredictor
+from  predictor import RFPredictor, RLSPredictor
 from config import Config
+from screener import LiveScreener
+from metrics import metrics
 
 class TradingStrategy:
     """
     Базовый класс для всех стратегий.
     """
-    def __init__(self, query_limit=10):
+    def __init__(self, query_limit=10, cache_ttl=15, screener=None):
+        """
+        :param screener: Откуда берутся ответы скринера: LiveScreener (по умолчанию),
+            RecordingScreener или ReplayScreener из screener.py.
+        """
         self.data = []
         self.query_limit=query_limit
+        # Кэш данных скринера по тикерам: ticker -> (время запроса, данные)
+        self.cache_ttl = cache_ttl
+        self.stocks_cache = {}
+        # Правила оценки, см. calculate_scores
+        self.score_rules = []
+        self.screener = screener or LiveScreener()
 
     def get_data(self):
         """
@@ -31,23 +47,70 @@ class TradingStrategy:
     def check_sell(self):
         raise NotImplementedError("Метод check_sell должен быть реализован в подклассах.")
     def get_data_stock(self, ticker):
-        raise NotImplementedError("Метод get_data_stock должен быть реализован в подклассах.")
+        return self.get_data_stocks([ticker]).get(ticker)
+
+    def get_data_stocks(self, tickers: List[str]) -> Dict:
+        """
+        Данные по нескольким тикерам одним запросом скринера: ticker -> dict.
+        Ответы кэшируются на cache_ttl секунд.
+        """
+        current_time = time.monotonic()
+        stocks = {}
+        missing = []
+        for ticker in dict.fromkeys(tickers):
+            cached = self.stocks_cache.get(ticker)
+            if cached and current_time - cached[0] < self.cache_ttl:
+                stocks[ticker] = dict(cached[1])
+            else:
+                missing.append(ticker)
+
+        if missing:
+            for ticker, stock in self.query_data_stocks(missing).items():
+                self.stocks_cache[ticker] = (current_time, stock)
+                stocks[ticker] = dict(stock)
+        return stocks
+
+    def calculate_buy_score(self, data: pd.DataFrame) -> np.ndarray:
+        return calculate_scores(data, self.score_rules)
+
+    def query_data_stocks(self, tickers: List[str]) -> Dict:
+        raise NotImplementedError("Метод query_data_stocks должен быть реализован в подклассах.")
+
+    def _scan(self, query):
+        with metrics.span('screener'):
+            return self.screener.get_scanner_data(query)
+
+    def _query_screener_by_names(self, tickers: List[str]) -> pd.DataFrame:
+        return self._scan(Query()
+        .select(*self.indicators)
+        .where(
+        col('name').isin(tickers),
+        )
+        .limit(max(50, len(tickers)))
+        .set_markets('russia'))[1]
         
 
 class MoneyFlowStrategy(TradingStrategy):
     """
     Стратегия, основанная на движении капитала.
     """
-    def __init__(self, query_limit=10):
-        super().__init__(query_limit)
+    def __init__(self, query_limit=10, screener=None):
+        super().__init__(query_limit, screener=screener)
         self.max_score = 4
         self.border_score = 0
         self.indicators = ['name', 'close', 'average_volume_30d_calc|30','relative_volume_10d_calc|30', 'volume|30',\
                 'RSI|30', 'MACD.macd|30', 'MACD.signal|30',  'VWAP|30', 'ChaikinMoneyFlow|30', "ADX|30"]
         self.custom_indicators = ['score', 'vwap_diff']
+        self.score_rules = [
+            # ('ChaikinMoneyFlow|30', '>=', 0.3, 0.5),
+            # ('relative_volume_10d_calc|30', '>=', 1.5, 0.5),
+            # ('relative_volume_10d_calc|30', '>=', 2, 0.5),
+            # ('RSI|30', 'between', (30, 70), 0.5),
+            # ('MACD.macd|30', '>', 'MACD.signal|30', 0.5),
+        ]
         
     def get_data(self):
-        self.data = (Query()
+        self.data = self._scan(Query()
             .select(*self.indicators)
             .where(
             col('relative_volume_10d_calc|30') > 2,
@@ -64,11 +127,11 @@ class MoneyFlowStrategy(TradingStrategy):
             # col('MACD.macd|30') > col('MACD.signal|30')
             )
             .limit(100)
-            .set_markets('russia')).get_scanner_data()[1]
+            .set_markets('russia'))[1]
         
-        self.data['score'] = self.data.apply(self.calculate_buy_score, axis=1)
-        self.data['vwap_diff'] = self.data.apply(self.calculate_vwap_diff, axis=1)
-        self.data['volume_diff'] = self.data.apply(self.calculate_volume_diff, axis=1)
+        self.data['score'] = self.calculate_buy_score(self.data)
+        self.data['vwap_diff'] = self.calculate_vwap_diff(self.data)
+        self.data['volume_diff'] = self.calculate_volume_diff(self.data)
         self.data = self.data.round(3)
         self.sort_data()
         # TODO:
@@ -95,22 +158,6 @@ class MoneyFlowStrategy(TradingStrategy):
         volume_diff = (stock_data['volume|30'] - stock_data['average_volume_30d_calc|30']) / stock_data['average_volume_30d_calc|30'] * 100
         return volume_diff
     
-    def calculate_buy_score(self, stock_data):
-        score = 0
-        # macd_diff = stock_data['MACD.macd|120'] - stock_data['MACD.signal|120']
-        # if stock_data['ChaikinMoneyFlow|120'] >= 0.3:
-        #     score += 0.5
-        # if stock_data['relative_volume_10d_calc|120'] >= 1.5:
-        #     score += 0.5
-        # if stock_data['relative_volume_10d_calc|120'] >= 2:
-        #     score += 0.5
-        # if stock_data['RSI|120'] >= 30 and stock_data['RSI|120'] < 70:
-        #     score += 0.5
-        # if macd_diff >:
-            # score += 0.5
-        
-        return int(score)
-    
     def check_data(self):
         for stock_info in self.data.to_dict(orient="records"):
             print(stock_info)
@@ -123,25 +170,27 @@ class MoneyFlowStrategy(TradingStrategy):
     def get_maxscore(self):
         return self.max_score
 
-    def get_data_stock(self, ticker):
-        self.data = (Query()
-        .select(*self.indicators)
-        .where(
-        col('name') == ticker,
-        )
-        .set_markets('russia')).get_scanner_data()[1]
+    def query_data_stocks(self, tickers):
+        data = self._query_screener_by_names(tickers)
         
-        self.data['score'] = self.data.apply(self.calculate_buy_score, axis=1)
-        self.data['vwap_diff'] = self.data.apply(self.calculate_vwap_diff, axis=1)
-        self.data['volume_diff'] = self.data.apply(self.calculate_volume_diff, axis=1)
-        self.data = self.data.round(3)
-        return self.data.to_dict(orient="records")[0]
+        data['score'] = self.calculate_buy_score(data)
+        data['vwap_diff'] = self.calculate_vwap_diff(data)
+        data['volume_diff'] = self.calculate_volume_diff(data)
+        data = data.round(3)
+        stocks = {}
+        for stock in data.to_dict(orient="records"):
+            stocks.setdefault(stock['name'], stock)
+        return stocks
 
     def get_border_score(self):
         return self.border_score
 
     def check_sell(self, ticker) -> bool:
         stock = self.get_data_stock(ticker)
+        if stock is None:
+            # Скринер не вернул тикер: без данных не продаём, проверим в следующем цикле
+            print(f"Нет данных скринера по {ticker}")
+            return False
         
         if stock['ChaikinMoneyFlow|30'] <= 0:
             return True
@@ -154,8 +203,12 @@ class MoneyFlowStrategy(TradingStrategy):
         return False
 
 class NadarayaWatsonStrategy(TradingStrategy):
-    def __init__(self, tinkObj: TinkoffOrderManager, bandwith=23, r=20, x0=25, query_limit=100):
-        super().__init__(query_limit)
+    def __init__(self, tinkObj: TinkoffOrderManager, bandwith=23, r=20, x0=25, query_limit=100, fetch_workers=8, predictor='rf', screener=None):
+        """
+        :param predictor: 'rf' -- случайный лес (RFPredictor), 'rls' -- онлайн-модель (RLSPredictor).
+        :param screener: Бэкенд скринера, см. TradingStrategy.
+        """
+        super().__init__(query_limit, screener=screener)
         self.max_score = 0
         self.border_score = 0
         self.indicators = ['name', 'relative_volume_10d_calc|15', 'MACD.macd|15', 'MACD.signal|15', 'MoneyFlow|15']
@@ -165,7 +218,13 @@ class NadarayaWatsonStrategy(TradingStrategy):
         self.bandwith = bandwith
         self.r = r
         self.days_back = 1
-        self.predictor = RFPredictor(self.bandwith)
+        if predictor == 'rls':
+            self.predictor = RLSPredictor(self.bandwith)
+        else:
+            self.predictor = RFPredictor(self.bandwith, models_path=Config.MODELS_PATH)
+        self.signals = {}
+        # Сколько тикеров загружать параллельно, лимит запросов соблюдает tinkObj
+        self.fetch_workers = fetch_workers
 
         
         
@@ -173,7 +232,7 @@ class NadarayaWatsonStrategy(TradingStrategy):
         return (self.indicators + self.custom_indicators)
     
     def get_data(self):
-        self.data = (Query()
+        self.data = self._scan(Query()
             .select(*self.indicators)
             .where(
             # col('Recommend.All|60') >= 0.5,
@@ -184,22 +243,62 @@ class NadarayaWatsonStrategy(TradingStrategy):
             # col('MACD.macd|15') > col('MACD.signal|15')
             )
             .limit(100)
-            .set_markets('russia')).get_scanner_data()[1]
+            .set_markets('russia'))[1]
         print(self.data)
         self.data = self.data.round(3)
-        self.data['score'] = self.data.apply(self.calculate_buy_score, axis=1)
+        self.data['score'] = self.calculate_buy_score(self.data)
         self.data = self.data.head(self.query_limit).to_dict(orient="records")
         data_to_buy = []
-        
-        for stock in self.data:
-            historical_data = self.tinkObj.get_historical_data(stock['name'], self.days_back)
-            if not historical_data:
-                continue
-            res = generate_signals(historical_data, x_0=self.x0, r=self.r, lag=2, smooth_colors=True, h=self.bandwith).to_dict(orient="records")[-1]
-            # print(close_prices, res, stock['name'])
-            if res['plotColor'] == 'green' and self.predictor.get_prediction_next_close(stock['name'], historical_data) > historical_data[-1]['close']:
-                data_to_buy.append(stock)
-        return data_to_buy
+        if not self.data:
+            return data_to_buy
+
+        # Свечи грузятся параллельно, сигналы считаются пачками по мере готовности.
+        # Каждая задача получает копию контекста, чтобы вызовы API попали в метрики цикла
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+            pending = {
+                executor.submit(contextvars.copy_context().run, self._get_historical_data, stock['name']): stock
+                for stock in self.data
+            }
+            stocks = dict(pending)
+            green = []
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                green += self._get_green([(stocks[future], future.result()) for future in done])
+        return self._check_buy(green)
+
+    def _get_historical_data(self, ticker):
+        with metrics.span('candles', ticker=ticker):
+            return self.tinkObj.get_historical_data(ticker, self.days_back)
+
+    def _get_green(self, fetched):
+        candidates = [(stock, historical_data) for stock, historical_data in fetched if historical_data]
+        if not candidates:
+            return []
+
+        histories = [historical_data for _, historical_data in candidates]
+        with metrics.span('signals'):
+            signals = generate_signals_batch(build_close_panel(histories), x_0=self.x0, r=self.r, lag=2, smooth_colors=True, h=self.bandwith)
+        return [candidate for candidate, plot_color in zip(candidates, signals['plotColor']) if plot_color == 'green']
+
+    def _check_buy(self, green):
+        # Модели для всех зелёных кандидатов обучаются одной пачкой на всех ядрах
+        with metrics.span('prediction'):
+            predictions = self.predictor.get_predictions_next_close(
+                [(stock['name'], historical_data) for stock, historical_data in green]
+            )
+        return [stock for stock, historical_data in green if predictions[stock['name']] > historical_data[-1]['close']]
+
+    def get_signal(self, ticker, historical_data):
+        """
+        Последний сигнал по тикеру. Состояние хранится между вызовами,
+        пересчитываются только новые бары.
+        """
+        signal = self.signals.get(ticker)
+        if signal is None:
+            signal = NadarayaWatsonSignal(h=self.bandwith, r=self.r, x_0=self.x0, smooth_colors=True, lag=2)
+            self.signals[ticker] = signal
+        with metrics.span('signals', ticker=ticker):
+            return signal.update_bars(historical_data)
 
     def get_border_score(self):
         return self.border_score
@@ -208,13 +307,17 @@ class NadarayaWatsonStrategy(TradingStrategy):
         return self.max_score
 
     def check_sell(self, ticker):
-        historical_data = self.tinkObj.get_historical_data(ticker, self.days_back)
+        historical_data = self._get_historical_data(ticker)
         if not historical_data:
             return True
-        res = generate_signals(historical_data, x_0=self.x0, r=self.r, lag=2, smooth_colors=True, h=self.bandwith).to_dict(orient="records")[-1]
+        res = self.get_signal(ticker, historical_data)
         if res['plotColor'] == 'red':
             return True
-        if self.get_data_stock(ticker)['MoneyFlow|15'] >= 80:
+        stock = self.get_data_stock(ticker)
+        if stock is None:
+            print(f"Нет данных скринера по {ticker}")
+            return False
+        if stock['MoneyFlow|15'] >= 80:
             return True
         
         return False
@@ -232,34 +335,62 @@ class NadarayaWatsonStrategy(TradingStrategy):
             else:
                 print(f"--> продать ", stock)
     
-    def get_data_stock(self, ticker):
-        data = (Query()
-        .select(*self.indicators)
-        .where(
-        col('name') == ticker,
-        )
-        .set_markets('russia')).get_scanner_data()[1].to_dict(orient="records")[0]
-        
-        data['score'] = self.border_score
-        historical_data = self.tinkObj.get_historical_data(data['name'], self.days_back)
-        if not historical_data:
-            return data 
-        
-        res = generate_signals(historical_data, x_0=self.x0, r=self.r, lag=2, smooth_colors=True, h=self.bandwith).to_dict(orient="records")[-1]
-        data['close'] = historical_data[-1]['close']
-        return data
-
-    def calculate_buy_score(self, stock_data):
-        score = 0
+    def query_data_stocks(self, tickers):
+        stocks = {}
+        for data in self._query_screener_by_names(tickers).to_dict(orient="records"):
+            if data['name'] in stocks:
+                continue
+            data['score'] = self.border_score
+            stocks[data['name']] = data
+        if not stocks:
+            return stocks
+
+        # Свечи грузятся параллельно, как в get_data
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+            futures = {
+                ticker: executor.submit(contextvars.copy_context().run, self._get_historical_data, ticker)
+                for ticker in stocks
+            }
+        for ticker, future in futures.items():
+            historical_data = future.result()
+            if historical_data:
+                stocks[ticker]['close'] = historical_data[-1]['close']
+        return stocks
+
+SCORE_OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+}
+
+def calculate_scores(data, rules):
+    """
+    Векторная оценка строк скринера по декларативным правилам.
 
-        return int(score)
+    :param data: DataFrame скринера.
+    :param rules: Список (column, op, value, weight). value -- число, имя другой колонки
+        или (min, max) для op 'between' (min <= x < max). Выполненное правило добавляет weight.
+    :return: np.ndarray целых оценок, по одной на строку.
+    """
+    scores = np.zeros(len(data))
+    for column, op, value, weight in rules:
+        values = data[column].to_numpy(dtype=np.float64)
+        if op == 'between':
+            mask = (values >= value[0]) & (values < value[1])
+        else:
+            other = data[value].to_numpy(dtype=np.float64) if isinstance(value, str) else value
+            mask = SCORE_OPERATORS[op](values, other)
+        scores += weight * mask
+    return scores.astype(int)
 
 def generate_signals(data_array, h=8, r=8, x_0=25, smooth_colors=False, lag=2):
     """
     Generates buy/sell signals based on kernel regression.
 
     Args:
-        close_prices (pd.Series): Series of closing prices.
+        data_array (list): Candles (dicts with 'close') or plain closing prices.
         h (float): Lookback window.
         r (float): Relative weighting of time frames.
         x_0 (int): Bar index to start regression.
@@ -270,39 +401,316 @@ def generate_signals(data_array, h=8, r=8, x_0=25, smooth_colors=False, lag=2):
         pd.DataFrame: DataFrame with buy/sell signals and colors.
     """
 
-    df = pd.DataFrame(data_array)
-    size = len(data_array)
+    close = _get_close_array(data_array)
 
     # Kernel Regression Calculation
-    df['yhat1'] = df['close'].rolling(window=h).apply(lambda x: kernel_regression(src=x, h=h, x_0=x_0, r=r), raw=True)
-    df['yhat2'] = df['close'].rolling(window=h - lag).apply(lambda x: kernel_regression(x, h=h - lag, x_0=x_0, r=r), raw=True)
+    yhat1 = kernel_regression_series(close, h=h, x_0=x_0, r=r)
+    yhat2 = kernel_regression_series(close, h=h - lag, x_0=x_0, r=r)
+
+    signals = _signals_from_yhat(yhat1, yhat2, smooth_colors)
+
+    df = pd.DataFrame({'close': close, 'yhat1': yhat1, 'yhat2': yhat2})
+    df['plotColor'] = signals['plotColor']
+    df['alertBullish'] = signals['alertBullish']
+    df['alertBearish'] = signals['alertBearish']
+    return df
+
+
+def generate_signals_batch(close_panel, h=8, r=8, x_0=25, smooth_colors=False, lag=2, mask=None):
+    """
+    Последние сигналы сразу по нескольким тикерам за один векторный проход.
+
+    Args:
+        close_panel (np.ndarray): Матрица цен закрытия (тикеры x бары).
+        h, r, x_0, smooth_colors, lag: Как в generate_signals.
+        mask (np.ndarray): Маска валидных баров той же формы. По умолчанию -- все не-NaN.
+            Невалидные бары выбрасываются, история каждого тикера прижимается вправо,
+            так что разная длина истории не влияет на результат.
+
+    Returns:
+        dict: Массивы длины n_tickers: 'close', 'yhat1', 'yhat2', 'plotColor',
+            'alertBullish', 'alertBearish' для последнего бара каждого тикера и 'length'.
+    """
+    panel = np.atleast_2d(np.asarray(close_panel, dtype=np.float64))
+    if mask is None:
+        mask = ~np.isnan(panel)
+    else:
+        mask = np.atleast_2d(np.asarray(mask, dtype=bool))
+    if panel.shape[1] == 0:
+        panel = np.full((panel.shape[0], 1), np.nan)
+        mask = np.zeros(panel.shape, dtype=bool)
+
+    # Стабильная сортировка по маске переносит валидные бары вправо, сохраняя порядок
+    order = np.argsort(mask, axis=1, kind='stable')
+    panel = np.take_along_axis(np.where(mask, panel, np.nan), order, axis=1)
+
+    # Для сигналов последнего бара нужны три последних значения yhat1
+    tail = panel[:, -(h + 2):]
+    yhat1 = kernel_regression_series(tail, h=h, x_0=x_0, r=r)
+    yhat2 = kernel_regression_series(tail, h=h - lag, x_0=x_0, r=r)
+    signals = _signals_from_yhat(yhat1, yhat2, smooth_colors)
+
+    return {
+        'close': tail[:, -1],
+        'yhat1': yhat1[:, -1],
+        'yhat2': yhat2[:, -1],
+        'plotColor': signals['plotColor'][:, -1],
+        'alertBullish': signals['alertBullish'][:, -1],
+        'alertBearish': signals['alertBearish'][:, -1],
+        'length': mask.sum(axis=1),
+    }
+
+
+def generate_signals_panel(close_panel, h=8, r=8, x_0=25, smooth_colors=False, lag=2, mask=None, cache=None):
+    """
+    Сигналы на каждом баре сразу по нескольким тикерам (для бэктеста).
+    Ряд каждого тикера считается только по его валидным барам, так что
+    результат на баре совпадает с generate_signals по истории до этого бара.
+
+    Args:
+        close_panel (np.ndarray): Матрица цен закрытия (тикеры x бары).
+        h, r, x_0, smooth_colors, lag: Как в generate_signals.
+        mask (np.ndarray): Маска валидных баров той же формы. По умолчанию -- все не-NaN.
+        cache (dict): Кэш промежуточных рядов для повторных вызовов на той же панели
+            с другими параметрами (перебор параметров): ряд yhat для (h, x_0, r) считается один раз.
+            Хранятся ряды только последних (x_0, r).
+
+    Returns:
+        dict: Массивы формы close_panel: 'yhat1', 'yhat2', 'plotColor',
+            'alertBullish', 'alertBearish'. На невалидных барах plotColor -- None, алерты -- False.
+    """
+    panel = np.atleast_2d(np.asarray(close_panel, dtype=np.float64))
+    if mask is None:
+        mask = ~np.isnan(panel)
+    else:
+        mask = np.atleast_2d(np.asarray(mask, dtype=bool))
+
+    if cache is None:
+        cache = {}
+    # Валидные бары прижимаются влево, после расчёта возвращаются на свои места
+    if 'compact' not in cache:
+        order = np.argsort(~mask, axis=1, kind='stable')
+        cache['inverse'] = np.argsort(order, axis=1)
+        cache['compact'] = np.take_along_axis(np.where(mask, panel, np.nan), order, axis=1)
+    compact, inverse = cache['compact'], cache['inverse']
+    # В кэше держим ряды только для текущих (x_0, r): перебор идёт по ним подряд,
+    # а старые ряды (тикеры x бары каждый) без вытеснения заняли бы гигабайты
+    for key in [key for key in cache if isinstance(key, tuple) and key[0] == 'yhat' and key[2:] != (x_0, r)]:
+        del cache[key]
+    for width in (h, h - lag):
+        if ('yhat', width, x_0, r) not in cache:
+            cache[('yhat', width, x_0, r)] = kernel_regression_series(compact, h=width, x_0=x_0, r=r)
+    yhat1 = cache[('yhat', h, x_0, r)]
+    yhat2 = cache[('yhat', h - lag, x_0, r)]
+    signals = _signals_from_yhat(yhat1, yhat2, smooth_colors)
+
+    result = {'yhat1': yhat1, 'yhat2': yhat2, **signals}
+    for key, values in result.items():
+        values = np.take_along_axis(values, inverse, axis=1)
+        if values.dtype == bool:
+            values &= mask
+        elif values.dtype == object:
+            values[~mask] = None
+        else:
+            values[~mask] = np.nan
+        result[key] = values
+    return result
+
+
+def build_close_panel(histories):
+    """
+    Собирает матрицу цен закрытия (тикеры x бары) из списков свечей разной длины.
+    Истории выровнены по последнему бару, недостающие бары слева -- NaN.
+    """
+    width = max((len(history) for history in histories), default=0)
+    panel = np.full((len(histories), width), np.nan)
+    for i, history in enumerate(histories):
+        if len(history):
+            panel[i, width - len(history):] = _get_close_array(history)
+    return panel
+
+
+def _get_close_array(data_array):
+    if len(data_array) and isinstance(data_array[0], dict):
+        return np.fromiter((bar['close'] for bar in data_array), dtype=np.float64, count=len(data_array))
+    return np.asarray(data_array, dtype=np.float64)
+
+
+def _shift(values, periods):
+    """
+    Аналог pd.Series.shift по последней оси для float-массивов.
+    """
+    shifted = np.full_like(values, np.nan)
+    if periods < values.shape[-1]:
+        shifted[..., periods:] = values[..., :values.shape[-1] - periods]
+    return shifted
+
+
+def _signals_from_yhat(yhat1, yhat2, smooth_colors):
+    """
+    Сигналы по готовым рядам yhat1/yhat2 (по последней оси).
+    Сравнения с NaN дают False, как и в pandas.
+    """
+    yhat1_prev = _shift(yhat1, 1)
+    yhat1_prev2 = _shift(yhat1, 2)
+    yhat2_prev = _shift(yhat2, 1)
 
     # Rates of Change
-    df['wasBearish'] = df['yhat1'].shift(2) > df['yhat1'].shift(1)
-    df['wasBullish'] = df['yhat1'].shift(2) < df['yhat1'].shift(1)
-    df['isBearish'] = df['yhat1'].shift(1) > df['yhat1']
-    df['isBullish'] = df['yhat1'].shift(1) < df['yhat1']
-    df['isBearishChange'] = df['isBearish'] & df['wasBullish']
-    df['isBullishChange'] = df['isBullish'] & df['wasBearish']
+    was_bearish = yhat1_prev2 > yhat1_prev
+    was_bullish = yhat1_prev2 < yhat1_prev
+    is_bullish = yhat1_prev < yhat1
+    is_bullish_change = is_bullish & was_bearish
 
     # Crossovers
-    df['isBullishCross'] = (df['yhat2'].shift(1) < df['yhat1'].shift(1)) & (df['yhat2'] > df['yhat1'])
-    df['isBearishCross'] = (df['yhat2'].shift(1) > df['yhat1'].shift(1)) & (df['yhat2'] < df['yhat1'])
+    is_bullish_cross = (yhat2_prev < yhat1_prev) & (yhat2 > yhat1)
+    is_bearish_cross = (yhat2_prev > yhat1_prev) & (yhat2 < yhat1)
 
     # Smooth Crossovers
-    df['isBullishSmooth'] = df['yhat2'] > df['yhat1']
-    df['isBearishSmooth'] = df['yhat2'] < df['yhat1']
+    is_bullish_smooth = yhat2 > yhat1
+
+    if smooth_colors:
+        plot_color = np.where(is_bullish_smooth, 'green', 'red').astype(object)
+        alert_bullish = is_bearish_cross
+        alert_bearish = is_bullish_cross
+    else:
+        plot_color = np.where(is_bullish, 'green', 'red').astype(object)
+        alert_bullish = is_bullish_change
+        alert_bearish = is_bullish_change
+
+    return {
+        'plotColor': plot_color,
+        'alertBullish': alert_bullish,
+        'alertBearish': alert_bearish,
+    }
+
+
+@lru_cache(maxsize=64)
+def kernel_weights(h, x_0, r):
+    """
+    Веса ядра для окна длины h, те же что в kernel_regression.
+    Нули в начале окна соответствуют барам, которые kernel_regression пропускает.
+    """
+    weights = np.zeros(h, dtype=np.float64)
+    start = max(0, h - x_0)
+    i = np.arange(start, h, dtype=np.float64)
+    weights[start:] = (1 + (i - (h - x_0)) ** 2 / (h ** 2 * 2 * r)) ** (-r)
+    weights.setflags(write=False)
+    return weights
+
+
+def kernel_regression_series(close, h, x_0=25, r=8):
+    """
+    Скользящая ядерная регрессия по всему ряду (или по последней оси 2D-массива).
+    Эквивалент close.rolling(window=h).apply(kernel_regression), первые h-1 значений -- NaN.
+
+    :param close: Цены закрытия, np.ndarray.
+    :param h: Ширина ядра и размер окна.
+    :param x_0: Бар, с которого начинается регрессия.
+    :param r: Параметр, определяющий форму ядра.
+    :return: np.ndarray той же формы, что и close.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    yhat = np.full(close.shape, np.nan)
+    if h <= 0 or close.shape[-1] < h:
+        return yhat
+
+    weights = kernel_weights(h, x_0, r)
+    cumulative_weight = weights.sum()
+    if cumulative_weight == 0:
+        return yhat
+
+    windows = np.lib.stride_tricks.sliding_window_view(close, h, axis=-1)
+    yhat[..., h - 1:] = (windows @ weights) / cumulative_weight
+    return yhat
+
+class NadarayaWatsonSignal:
+    """
+    Потоковый расчёт сигналов Надарая-Уотсона для одного тикера.
+    Бары подаются по одному, на каждый пересчитывается только последнее окно -- O(h).
+    """
+    def __init__(self, h=8, r=8, x_0=25, smooth_colors=False, lag=2):
+        self.h = h
+        self.r = r
+        self.x_0 = x_0
+        self.lag = lag
+        self.smooth_colors = smooth_colors
+        self.weights1 = kernel_weights(h, x_0, r)
+        self.weights2 = kernel_weights(h - lag, x_0, r)
+        # Храним на один элемент больше, чтобы можно было заменить последний бар
+        self.closes = deque(maxlen=h + 1)
+        self.yhat1 = deque([np.nan] * 4, maxlen=4)
+        self.yhat2 = deque([np.nan] * 4, maxlen=4)
+        self.last_time = None
+        self.last_signal = None
+
+    def reset(self):
+        self.closes.clear()
+        self.yhat1.extend([np.nan] * 4)
+        self.yhat2.extend([np.nan] * 4)
+        self.last_time = None
+        self.last_signal = None
+
+    def _window_regression(self, window, weights):
+        if len(window) < len(weights):
+            return np.nan
+        cumulative_weight = weights.sum()
+        if cumulative_weight == 0:
+            return np.nan
+        return float(window[-len(weights):] @ weights / cumulative_weight)
+
+    def update(self, close, time=None):
+        """
+        Добавляет бар и возвращает последний сигнал.
+        Бар с тем же time, что и предыдущий, заменяет его (незакрытая свеча).
+        """
+        if time is not None and time == self.last_time and self.closes:
+            self.closes.pop()
+            self.yhat1.pop()
+            self.yhat2.pop()
+            self.yhat1.appendleft(np.nan)
+            self.yhat2.appendleft(np.nan)
+
+        self.closes.append(float(close))
+        self.last_time = time
+
+        window = np.fromiter(self.closes, dtype=np.float64, count=len(self.closes))
+        yhat1 = self._window_regression(window, self.weights1)
+        yhat2 = self._window_regression(window, self.weights2)
+        self.yhat1.append(yhat1)
+        self.yhat2.append(yhat2)
+
+        signals = _signals_from_yhat(np.array(self.yhat1), np.array(self.yhat2), self.smooth_colors)
+        self.last_signal = {
+            'close': float(close),
+            'yhat1': yhat1,
+            'yhat2': yhat2,
+            'plotColor': signals['plotColor'][-1],
+            'alertBullish': bool(signals['alertBullish'][-1]),
+            'alertBearish': bool(signals['alertBearish'][-1]),
+        }
+        return self.last_signal
+
+    def update_bars(self, historical_data):
+        """
+        Подаёт только бары, пришедшие после последнего обработанного.
+        Без поля 'time' состояние пересчитывается по всей истории.
+        """
+        if not historical_data:
+            return self.last_signal
 
-    # Determine colors based on smoothColors
-    df['colorByCross'] = np.where(df['isBullishSmooth'], 'green', 'red')  # Assuming green for bullish, red for bearish
-    df['colorByRate'] = np.where(df['isBullish'], 'green', 'red')
-    df['plotColor'] = np.where(smooth_colors, df['colorByCross'], df['colorByRate'])
+        if 'time' not in historical_data[-1] or self.last_time is None:
+            self.reset()
+            new_bars = historical_data
+        else:
+            start = len(historical_data)
+            while start > 0 and historical_data[start - 1]['time'] >= self.last_time:
+                start -= 1
+            new_bars = historical_data[start:]
 
-    # Generate alert signals
-    df['alertBullish'] = np.where(smooth_colors, df['isBearishCross'], df['isBullishChange'])
-    df['alertBearish'] = np.where(smooth_colors, df['isBullishCross'], df['isBullishChange'])
+        for bar in new_bars:
+            self.update(bar['close'], bar.get('time'))
+        return self.last_signal
 
-    return df[['close', 'yhat1', 'yhat2', 'plotColor', 'alertBullish', 'alertBearish']]
 
 def kernel_regression(src, h, x_0=25, r=8):
     """
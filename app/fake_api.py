@@ -0,0 +1,346 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import grpc
+import numpy as np
+from tinkoff.invest import OrderDirection
+from tinkoff.invest.exceptions import RequestError
+from tinkoff.invest.utils import decimal_to_quotation
+
+from client_pool import RateLimiter
+
+FAKE_ACCOUNT_ID = "fake-account"
+
+# Методы сервисов, которые использует бот
+SERVICE_METHODS = {
+    'instruments': ['shares', 'share_by'],
+    'users': ['get_accounts'],
+    'operations': ['get_positions', 'get_portfolio'],
+    'market_data': ['get_last_prices', 'get_order_book'],
+    'orders': ['post_order'],
+    'stop_orders': ['post_stop_order'],
+}
+
+
+class FakeTinkoffAPI:
+    """
+    Замена API Тинькофф внутри процесса, без сети и токена.
+
+    Отдаёт инструменты, счёт, портфель, последние цены, стакан и свечи из
+    синтетических или записанных данных, исполняет рыночные и стоп-заявки
+    по текущей цене. На каждый вызов можно добавить задержку, разброс,
+    случайные ошибки UNAVAILABLE и лимиты запросов (RESOURCE_EXHAUSTED),
+    чтобы мерить пропускную способность и хвосты задержек циклов бота.
+
+    Подключение к менеджерам -- через ClientPool:
+        api = FakeTinkoffAPI.synthetic(latency=0.05, jitter=0.02)
+        broker = TinkoffOrderManager(db_path, client_pool=ClientPool(None, services_factory=api.get_services))
+        async_broker = AsyncTinkoffOrderManager(broker, AsyncClientPool(None, services_factory=api.get_async_services))
+    """
+    def __init__(self, instruments, candles, balance=50000, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limits=None, interval=timedelta(minutes=2), seed=None):
+        """
+        :param instruments: Список словарей ticker, figi, lot, price_step.
+        :param candles: figi -> колонки свечей как в CandleStore (time в секундах, open, high, low, close, volume).
+        :param latency: Задержка вызова, с. Число или словарь сервис -> задержка.
+        :param jitter: Средняя случайная добавка к задержке, с. Распределение экспоненциальное, с хвостом.
+        :param error_rate: Доля вызовов, завершающихся ошибкой UNAVAILABLE.
+        :param rate_limits: Словарь сервис -> запросов в минуту, сверх лимита -- RESOURCE_EXHAUSTED.
+        :param interval: Шаг новых баров в step().
+        """
+        self.instruments = {instrument['figi']: instrument for instrument in instruments}
+        self.candles = {figi: {column: np.asarray(values) for column, values in columns.items()} for figi, columns in candles.items()}
+        self.balance = Decimal(balance)
+        self.positions = {}
+        self.stop_orders = []
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limiters = {service: RateLimiter(rate, 60) for service, rate in (rate_limits or {}).items()}
+        self.interval = interval
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        self.stats = {service: {'calls': 0, 'errors': 0, 'throttled': 0} for service in SERVICE_METHODS}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def synthetic(cls, n_instruments=50, n_bars=2000, interval=timedelta(minutes=2), seed=0, **kwargs):
+        """
+        Случайные блуждания цен для n_instruments акций, последний бар -- текущее время.
+        """
+        rng = np.random.default_rng(seed)
+        end = int(datetime.now(timezone.utc).timestamp()) // int(interval.total_seconds()) * int(interval.total_seconds())
+        times = end - int(interval.total_seconds()) * np.arange(n_bars - 1, -1, -1, dtype=np.int64)
+        instruments = []
+        candles = {}
+        for i in range(n_instruments):
+            figi = f"FAKE{i:08d}"
+            instruments.append({'ticker': f"T{i:04d}", 'figi': figi, 'lot': int(rng.choice([1, 10, 100])), 'price_step': Decimal('0.01')})
+            candles[figi] = _make_candles(rng, times, start_price=float(rng.uniform(10, 500)))
+        return cls(instruments, candles, interval=interval, seed=seed, **kwargs)
+
+    @classmethod
+    def from_candle_store(cls, store, instruments, interval, lots=None, **kwargs):
+        """
+        Записанные свечи из CandleStore.
+        :param instruments: Словарь ticker -> figi.
+        :param lots: Словарь ticker -> размер лота, по умолчанию 1.
+        """
+        candles = {figi: store.read(figi, interval) for figi in instruments.values()}
+        return cls(
+            [
+                {'ticker': ticker, 'figi': figi, 'lot': (lots or {}).get(ticker, 1), 'price_step': Decimal('0.01')}
+                for ticker, figi in instruments.items()
+            ],
+            {figi: columns for figi, columns in candles.items() if len(columns['time'])},
+            **kwargs,
+        )
+
+    def get_services(self):
+        return FakeServices(self, is_async=False)
+
+    def get_async_services(self):
+        return FakeServices(self, is_async=True)
+
+    def step(self, n_bars=1):
+        """
+        Добавляет каждому инструменту n_bars новых баров: цены продолжают блуждание.
+        """
+        with self.lock:
+            for figi, columns in self.candles.items():
+                last_time = int(columns['time'][-1]) if len(columns['time']) else int(datetime.now(timezone.utc).timestamp())
+                step = int(self.interval.total_seconds())
+                times = last_time + step * np.arange(1, n_bars + 1, dtype=np.int64)
+                start_price = float(columns['close'][-1]) if len(columns['close']) else 100.0
+                new = _make_candles(self.rng, times, start_price)
+                self.candles[figi] = {column: np.concatenate((columns[column], new[column])) for column in columns}
+
+    def _before_call(self, service):
+        """
+        Учёт вызова: возвращает задержку и ошибку (или None), которую надо бросить после задержки.
+        """
+        with self.lock:
+            stats = self.stats[service]
+            stats['calls'] += 1
+            latency = self.latency.get(service, 0.0) if isinstance(self.latency, dict) else self.latency
+            if self.jitter:
+                latency += self.random.expovariate(1 / self.jitter)
+            limiter = self.rate_limiters.get(service)
+            if limiter and not limiter.try_acquire():
+                stats['throttled'] += 1
+                return latency, RequestError(grpc.StatusCode.RESOURCE_EXHAUSTED, f"fake {service}: rate limit exceeded", None)
+            if self.error_rate and self.random.random() < self.error_rate:
+                stats['errors'] += 1
+                return latency, RequestError(grpc.StatusCode.UNAVAILABLE, f"fake {service}: unavailable", None)
+            return latency, None
+
+    def _get_last_price(self, figi):
+        return Decimal(str(self.candles[figi]['close'][-1]))
+
+    def _get_share(self, instrument):
+        return SimpleNamespace(
+            figi=instrument['figi'],
+            ticker=instrument['ticker'],
+            lot=instrument['lot'],
+            currency="rub",
+            min_price_increment=decimal_to_quotation(instrument['price_step']),
+        )
+
+    def _get_instrument(self, figi):
+        instrument = self.instruments.get(figi)
+        if instrument is None:
+            raise RequestError(grpc.StatusCode.NOT_FOUND, f"fake: instrument {figi} not found", None)
+        return instrument
+
+    # Реализации методов сервисов, вызываются под self.lock
+
+    def _shares(self, **kwargs):
+        return SimpleNamespace(instruments=[self._get_share(instrument) for instrument in self.instruments.values()])
+
+    def _share_by(self, id_type=None, id=None, **kwargs):
+        return SimpleNamespace(instrument=self._get_share(self._get_instrument(id)))
+
+    def _get_accounts(self, **kwargs):
+        return SimpleNamespace(accounts=[SimpleNamespace(id=FAKE_ACCOUNT_ID)])
+
+    def _get_positions(self, account_id=None, **kwargs):
+        return SimpleNamespace(money=[_to_money(self.balance)])
+
+    def _get_portfolio(self, account_id=None, **kwargs):
+        positions = []
+        for figi, position in self.positions.items():
+            lot = self.instruments[figi]['lot']
+            price = self._get_last_price(figi)
+            shares = position['lots'] * lot
+            positions.append(SimpleNamespace(
+                figi=figi,
+                quantity=decimal_to_quotation(Decimal(shares)),
+                quantity_lots=decimal_to_quotation(Decimal(position['lots'])),
+                current_price=_to_money(price),
+                average_position_price=_to_money(position['average_price']),
+                expected_yield=decimal_to_quotation((price - position['average_price']) * shares),
+            ))
+        return SimpleNamespace(positions=positions)
+
+    def _get_last_prices(self, figi=(), **kwargs):
+        return SimpleNamespace(last_prices=[
+            SimpleNamespace(figi=item, price=decimal_to_quotation(self._get_last_price(item)),
+                            time=datetime.fromtimestamp(int(self.candles[item]['time'][-1]), tz=timezone.utc))
+            for item in figi if item in self.candles
+        ])
+
+    def _get_order_book(self, figi=None, depth=1, **kwargs):
+        price = self._get_last_price(figi)
+        step = self._get_instrument(figi)['price_step']
+        return SimpleNamespace(
+            figi=figi,
+            depth=depth,
+            asks=[SimpleNamespace(price=decimal_to_quotation(price + step * (i + 1)), quantity=1000) for i in range(depth)],
+            bids=[SimpleNamespace(price=decimal_to_quotation(price - step * (i + 1)), quantity=1000) for i in range(depth)],
+        )
+
+    def _post_order(self, figi=None, quantity=0, direction=None, account_id=None, order_id=None, **kwargs):
+        instrument = self._get_instrument(figi or kwargs.get('instrument_id'))
+        figi = instrument['figi']
+        step = instrument['price_step']
+        is_buy = direction == OrderDirection.ORDER_DIRECTION_BUY
+        # Рыночная заявка исполняется по лучшей цене стакана
+        price = self._get_last_price(figi) + (step if is_buy else -step)
+        total = price * quantity * instrument['lot']
+        position = self.positions.get(figi, {'lots': 0, 'average_price': Decimal(0)})
+        if is_buy:
+            if total > self.balance:
+                raise RequestError(grpc.StatusCode.INVALID_ARGUMENT, "fake: not enough balance", None)
+            lots = position['lots'] + quantity
+            position['average_price'] = (position['average_price'] * position['lots'] + price * quantity) / lots
+            position['lots'] = lots
+            self.balance -= total
+        else:
+            if quantity > position['lots']:
+                raise RequestError(grpc.StatusCode.INVALID_ARGUMENT, "fake: not enough assets", None)
+            position['lots'] -= quantity
+            self.balance += total
+        if position['lots']:
+            self.positions[figi] = position
+        else:
+            self.positions.pop(figi, None)
+        return SimpleNamespace(
+            order_id=order_id or uuid.uuid4().hex,
+            figi=figi,
+            direction=direction,
+            lots_requested=quantity,
+            lots_executed=quantity,
+            executed_order_price=_to_money(price),
+            total_order_amount=_to_money(total),
+        )
+
+    def _post_stop_order(self, **kwargs):
+        stop_order_id = uuid.uuid4().hex
+        self.stop_orders.append({'stop_order_id': stop_order_id, **kwargs})
+        return SimpleNamespace(stop_order_id=stop_order_id)
+
+    def _get_all_candles(self, figi=None, from_=None, to=None, interval=None, **kwargs):
+        """
+        Свечи инструмента с from_ по to. Интервал не учитывается: у инструмента один ряд.
+        """
+        columns = self.candles.get(figi or kwargs.get('instrument_id'))
+        if columns is None:
+            return []
+        times = columns['time']
+        start = int(np.searchsorted(times, int(from_.timestamp()), side='left')) if from_ else 0
+        end = int(np.searchsorted(times, int(to.timestamp()), side='right')) if to else len(times)
+        return [
+            SimpleNamespace(
+                time=datetime.fromtimestamp(int(times[i]), tz=timezone.utc),
+                open=decimal_to_quotation(Decimal(str(columns['open'][i]))),
+                high=decimal_to_quotation(Decimal(str(columns['high'][i]))),
+                low=decimal_to_quotation(Decimal(str(columns['low'][i]))),
+                close=decimal_to_quotation(Decimal(str(columns['close'][i]))),
+                volume=int(columns['volume'][i]),
+                is_complete=i < len(times) - 1,
+            )
+            for i in range(start, end)
+        ]
+
+
+class FakeServices:
+    """
+    Объект с тем же набором сервисов, что и Services / AsyncServices.
+    """
+    def __init__(self, api: FakeTinkoffAPI, is_async=False):
+        self.api = api
+        self.is_async = is_async
+        for service, methods in SERVICE_METHODS.items():
+            setattr(self, service, SimpleNamespace(**{
+                method: self._make_method(service, getattr(api, f"_{method}")) for method in methods
+            }))
+
+    def _make_method(self, service, implementation):
+        api = self.api
+        if self.is_async:
+            async def call(*args, **kwargs):
+                latency, error = api._before_call(service)
+                await asyncio.sleep(latency)
+                if error:
+                    raise error
+                with api.lock:
+                    return implementation(*args, **kwargs)
+        else:
+            def call(*args, **kwargs):
+                latency, error = api._before_call(service)
+                time.sleep(latency)
+                if error:
+                    raise error
+                with api.lock:
+                    return implementation(*args, **kwargs)
+        return call
+
+    def get_all_candles(self, **kwargs):
+        if self.is_async:
+            return self._get_all_candles_async(**kwargs)
+        return self._get_all_candles(**kwargs)
+
+    def _get_all_candles(self, **kwargs):
+        latency, error = self.api._before_call('market_data')
+        time.sleep(latency)
+        if error:
+            raise error
+        with self.api.lock:
+            candles = self.api._get_all_candles(**kwargs)
+        yield from candles
+
+    async def _get_all_candles_async(self, **kwargs):
+        latency, error = self.api._before_call('market_data')
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        with self.api.lock:
+            candles = self.api._get_all_candles(**kwargs)
+        for candle in candles:
+            yield candle
+
+
+def _to_money(value):
+    quotation = decimal_to_quotation(Decimal(value))
+    return SimpleNamespace(currency="rub", units=quotation.units, nano=quotation.nano)
+
+
+def _make_candles(rng, times, start_price):
+    n_bars = len(times)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, n_bars)) * close
+    return {
+        'time': np.asarray(times, dtype=np.int64),
+        'open': np.round(open_, 2),
+        'high': np.round(np.maximum(open_, close) + spread, 2),
+        'low': np.round(np.minimum(open_, close) - spread, 2),
+        'close': np.round(close, 2),
+        'volume': rng.integers(100, 10000, n_bars),
+    }
@@ -0,0 +1,271 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "bot"
+# Границы корзин гистограмм: секунды и штуки
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Сколько самых медленных тикеров показывать по каждому этапу
+SLOWEST_TOP = 10
+
+# Счётчики текущего цикла. asyncio.to_thread копирует контекст, поэтому
+# вызовы из потоков стратегии попадают в цикл, который их запустил
+_cycle_counts = contextvars.ContextVar('cycle_counts', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Последняя корзина -- +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Оценка квантиля сверху: граница корзины, в которую он попал.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    Тайминги этапов циклов бота, счётчики вызовов API и их экспорт
+    в формате Prometheus (text exposition) или JSON. Потокобезопасен.
+
+        with metrics.cycle('poll_new_actives'):
+            with metrics.span('screener'):
+                ...
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        # Этап -> тикер -> максимальная длительность, с
+        self.slowest = {}
+        self.started = time.time()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.slowest = {}
+            self.started = time.time()
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            counts = _cycle_counts.get()
+            if counts is not None:
+                counts[name] = counts.get(name, 0) + value
+
+    @contextmanager
+    def span(self, stage, ticker=None):
+        """
+        Время этапа. Если указан ticker, запоминается самый медленный вызов по тикеру.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.observe('stage_seconds', duration, stage=stage)
+            if ticker is not None:
+                with self.lock:
+                    slowest = self.slowest.setdefault(stage, {})
+                    slowest[ticker] = max(slowest.get(ticker, 0.0), duration)
+
+    @contextmanager
+    def cycle(self, loop):
+        """
+        Время цикла и число вызовов API за цикл.
+        """
+        counts = {}
+        token = _cycle_counts.set(counts)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            _cycle_counts.reset(token)
+            self.observe('cycle_seconds', time.perf_counter() - start, loop=loop)
+            self.observe('cycle_api_calls', counts.get('api_calls', 0), buckets=COUNT_BUCKETS, loop=loop)
+            self.count('cycles', loop=loop)
+
+    def get_slowest(self, stage):
+        with self.lock:
+            slowest = dict(self.slowest.get(stage, {}))
+        return sorted(slowest.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_TOP]
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            stages = list(self.slowest)
+        types = set()
+        for (name, labels), histogram in histograms:
+            metric = f"{PREFIX}_{name}"
+            if metric not in types:
+                lines.append(f"# TYPE {metric} histogram")
+                types.add(metric)
+            total = 0
+            for bound, count in zip([*histogram.buckets, '+Inf'], histogram.counts):
+                total += count
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', bound),))} {total}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in types:
+                lines.append(f"# TYPE {metric} counter")
+                types.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        if stages:
+            lines.append(f"# TYPE {PREFIX}_slowest_ticker_seconds gauge")
+        for stage in stages:
+            for ticker, duration in self.get_slowest(stage):
+                lines.append(f"{PREFIX}_slowest_ticker_seconds{_format_labels((('stage', stage), ('ticker', ticker)))} {duration}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            stages = list(self.slowest)
+        return {
+            'started': self.started,
+            'time': time.time(),
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'mean': histogram.sum / histogram.count if histogram.count else None,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                    'max': histogram.max,
+                }
+                for (name, labels), histogram in histograms
+            ],
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in counters],
+            'slowest': {stage: self.get_slowest(stage) for stage in stages},
+        }
+
+    def write(self, path):
+        """
+        Сохраняет метрики в файл: .json -- JSON, иначе текстовый формат Prometheus.
+        """
+        text = json.dumps(self.to_dict(), indent=4) if path.endswith('.json') else self.to_prometheus()
+        try:
+            with open(path + '.tmp', 'w') as file:
+                file.write(text)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            print(e)
+
+    def serve(self, port, host='0.0.0.0'):
+        """
+        HTTP-эндпоинт в фоновом потоке: /metrics -- Prometheus, /metrics.json -- JSON.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = metrics.to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.to_dict()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class CountingServices:
+    """
+    Обёртка над Services / AsyncServices: каждый вызов метода сервиса
+    считается в metrics как api_calls{service, method}.
+    """
+    def __init__(self, services, metrics):
+        self.services = services
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attribute = getattr(self.services, name)
+        if callable(attribute):
+            return _counted(attribute, self.metrics, 'services', name)
+        return _CountingService(attribute, name, self.metrics)
+
+
+class _CountingService:
+    def __init__(self, service, name, metrics):
+        self.service = service
+        self.name = name
+        self.metrics = metrics
+
+    def __getattr__(self, method):
+        attribute = getattr(self.service, method)
+        if not callable(attribute):
+            return attribute
+        return _counted(attribute, self.metrics, self.name, method)
+
+
+def _counted(func, metrics, service, method):
+    def call(*args, **kwargs):
+        metrics.count('api_calls', service=service, method=method)
+        return func(*args, **kwargs)
+    return call
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Общий экземпляр для стратегий и бота
+metrics = Metrics()
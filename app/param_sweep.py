@@ -0,0 +1,157 @@
+import argparse
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from candle_store import CandleStore
+from data_handler import JsonDBHandler
+from backtester import Backtester, load_panel
+from shared_arrays import to_shared, attach_shared
+
+PANEL_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume', 'mask')
+METRICS = ('pnl', 'return', 'max_drawdown', 'n_trades', 'win_rate')
+
+# Состояние процесса-воркера: панель из shared memory и кэш промежуточных рядов
+_worker = {}
+
+
+def build_grid(bandwith=(23,), r=(20,), x0=(25,), lag=(2,)):
+    """
+    Полная сетка параметров NadarayaWatsonStrategy.
+    Комбинации с lag >= bandwith пропускаются.
+    """
+    return [
+        {'bandwith': h, 'r': r_, 'x0': x0_, 'lag': lag_}
+        for h, r_, x0_, lag_ in itertools.product(bandwith, r, x0, lag)
+        if lag_ < h
+    ]
+
+
+def random_grid(n, bandwith=(8, 60), r=(2, 40), x0=(5, 60), lag=(1, 5), seed=None):
+    """
+    Случайный поиск: n комбинаций с целыми параметрами из заданных диапазонов (включительно).
+    """
+    rng = np.random.default_rng(seed)
+    grid = []
+    while len(grid) < n:
+        params = {
+            'bandwith': int(rng.integers(bandwith[0], bandwith[1] + 1)),
+            'r': int(rng.integers(r[0], r[1] + 1)),
+            'x0': int(rng.integers(x0[0], x0[1] + 1)),
+            'lag': int(rng.integers(lag[0], lag[1] + 1)),
+        }
+        if params['lag'] < params['bandwith']:
+            grid.append(params)
+    return grid
+
+
+def run_sweep(panel, grid, max_workers=None, sort_by='pnl', **backtester_kwargs):
+    """
+    Прогоняет Backtester по всем комбинациям параметров в пуле процессов.
+
+    Матрицы панели один раз копируются в shared memory, воркеры подключаются
+    к ним без копирования. Комбинации группируются по bandwith: внутри группы
+    ряды ядерной регрессии и индикаторы считаются один раз на (h, x0, r).
+
+    :param panel: Результат load_panel.
+    :param grid: Список словарей параметров (build_grid / random_grid).
+    :param backtester_kwargs: Остальные параметры Backtester (use_atr, commission...).
+    :return: DataFrame: параметры и метрики, отсортированный по sort_by (по убыванию).
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    tasks = _split_tasks(grid, max_workers)
+    blocks = {}
+    try:
+        for column in PANEL_COLUMNS:
+            blocks[column] = to_shared(panel[column])
+        layout = {column: (block.name, panel[column].shape, panel[column].dtype.str) for column, block in blocks.items()}
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(layout, panel['tickers'], backtester_kwargs)) as executor:
+            results = [row for rows in executor.map(_run_task, tasks) for row in rows]
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    table = pd.DataFrame(results, columns=['bandwith', 'r', 'x0', 'lag', *METRICS])
+    return table.sort_values(sort_by, ascending=False, ignore_index=True)
+
+
+def _split_tasks(grid, max_workers):
+    """
+    Группирует комбинации по bandwith и режет группы на куски,
+    чтобы задач было хотя бы в 4 раза больше, чем процессов.
+    """
+    groups = {}
+    for params in grid:
+        groups.setdefault(params['bandwith'], []).append(params)
+    chunk_size = max(1, math.ceil(len(grid) / (max_workers * 4)))
+    tasks = []
+    for group in groups.values():
+        # Внутри куска комбинации с общими (x0, r) идут подряд
+        group.sort(key=lambda params: (params['x0'], params['r'], params['lag']))
+        tasks += [group[i:i + chunk_size] for i in range(0, len(group), chunk_size)]
+    return tasks
+
+
+def _init_worker(layout, tickers, backtester_kwargs):
+    blocks = {}
+    panel = {}
+    for column, (name, shape, dtype) in layout.items():
+        blocks[column], panel[column] = attach_shared(name, shape, dtype)
+    panel['tickers'] = tickers
+    # Ссылки на блоки держим до конца процесса, иначе массивы панели станут невалидны
+    _worker.update(blocks=blocks, panel=panel, backtester_kwargs=backtester_kwargs, cache={})
+
+
+def _run_task(params_list):
+    cache = _worker['cache']
+    # Индикаторы и порядок баров не зависят от параметров ядра и живут весь процесс,
+    # ряды yhat -- только в пределах задачи (одного bandwith) и одних (x0, r),
+    # см. generate_signals_panel
+    for key in [key for key in cache if isinstance(key, tuple) and key[0] == 'yhat']:
+        del cache[key]
+    rows = []
+    for params in params_list:
+        backtester = Backtester(**params, **_worker['backtester_kwargs'])
+        report = backtester.run(_worker['panel'], cache=cache)
+        rows.append({**params, **{metric: report[metric] for metric in METRICS}})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор параметров NadarayaWatsonStrategy на свечах из CandleStore")
+    parser.add_argument('--db', default=Config.DB_FILE_PATH, help="База ticker -> figi")
+    parser.add_argument('--candles', default=Config.CANDLES_PATH)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--bandwith', type=int, nargs='+', default=[15, 19, 23, 27, 31])
+    parser.add_argument('--r', type=int, nargs='+', default=[8, 14, 20, 26])
+    parser.add_argument('--x0', type=int, nargs='+', default=[15, 20, 25, 30])
+    parser.add_argument('--lag', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--random', type=int, help="Случайный поиск из N комбинаций вместо сетки")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--atr', action='store_true', help="Тейк-профит и стоп-лосс на ATR")
+    args = parser.parse_args()
+
+    instruments = {
+        ticker: figi for ticker, figi in JsonDBHandler(args.db).get_data().items()
+        if isinstance(figi, str) and ticker != 'last_update_time'
+    }
+    panel = load_panel(CandleStore(args.candles), instruments, from_time=datetime.now(timezone.utc) - timedelta(days=args.days))
+    if args.random:
+        grid = random_grid(args.random)
+    else:
+        grid = build_grid(args.bandwith, args.r, args.x0, args.lag)
+    table = run_sweep(panel, grid, max_workers=args.workers, use_atr=args.atr)
+    print(table.head(args.top).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,12 @@ from tinkoff.invest import (
 
 from tinkoff.invest.services import SandboxService, InstrumentsService, OperationsService, MarketDataService
 from tinkoff.invest.sandbox.client import SandboxClient
+from tinkoff.invest.exceptions import RequestError
 from tinkoff.invest.utils import decimal_to_quotation, quotation_to_decimal, money_to_decimal, now
 from decimal import Decimal
 
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import abc
 import os, sys
 import uuid 
@@ -21,27 +23,217 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(script_dir, '..'))
 
 from config import Config
-from data_handler import JsonDBHandler
+from data_handler import JsonDBHandler, InstrumentCache
+from candle_store import CandleStore, candles_to_records
+from client_pool import ClientPool, RateLimiter
 
 # Изменить на динамические, в заивисимости от ATR 
 TAKE_PROFIT_PERCENTAGE = 0.05
 STOP_LOSS_PERCENTAGE = -0.02
 MIN_PRICE_STEP = 0.02
 STOP_ORDER_EXPIRE_DURATION = timedelta(weeks=2)
+INSTRUMENTS_CACHE_TTL = timedelta(days=1)
+# Сколько стаканов запрашивать параллельно
+QUOTES_MAX_WORKERS = 8
+# Лимит API на запросы свечей (GetCandles), запросов в минуту
+CANDLES_REQUESTS_PER_MINUTE = 600
+
+def get_instruments_filepath(db_filepath):
+    root, ext = os.path.splitext(db_filepath)
+    return f"{root}Instruments{ext or '.json'}"
+
+def get_stock_info(instrument) -> Dict:
+    stock_info = {}
+    stock_info['lot'] = instrument.lot
+    stock_info['ticker'] = instrument.ticker
+    stock_info['price_step'] = quotation_to_decimal(instrument.min_price_increment)
+    return stock_info
+
+def get_take_profit_price(executed_order_price, price_step, atr=None) -> Decimal:
+    if atr:
+        return round((executed_order_price + Decimal(atr))/price_step, 0) * price_step
+    take_profit_price = executed_order_price * Decimal(1 + TAKE_PROFIT_PERCENTAGE)
+    return take_profit_price - take_profit_price % price_step
+
+def get_stop_loss_price(executed_order_price, price_step, atr=None) -> Decimal:
+    if atr:
+        return round((executed_order_price - Decimal(atr))/price_step, 0) * price_step
+    stop_loss_price = executed_order_price * Decimal(1 + STOP_LOSS_PERCENTAGE)
+    return stop_loss_price - stop_loss_price % price_step
 
 class BaseOrderManager(abc.ABC):
     """
     Абстрактный базовый класс для всех брокеров/эмуляторов.
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, client_pool=None):
         self.api_key = api_key
         self.balance = 0
         self.account_id = None
+        self.client_pool = client_pool or ClientPool(api_key)
+        self.candles_rate_limiter = RateLimiter(CANDLES_REQUESTS_PER_MINUTE, 60)
 
     def get_balance(self):
         return self.balance
 
+    def close(self):
+        """
+        Закрывает общий gRPC-канал. Вызывается при остановке бота.
+        """
+        self.client_pool.close()
+
+    def get_last_prices(self, figis: List[str]) -> Dict:
+        """
+        Последние цены по всем figi одним запросом: figi -> Decimal.
+        """
+        if not figis:
+            return {}
+        with self.get_client() as client:
+            response = client.market_data.get_last_prices(figi=list(figis))
+        return {last_price.figi: quotation_to_decimal(last_price.price) for last_price in response.last_prices}
+
+    def get_order_book_top(self, figi: str) -> Dict:
+        with self.get_client() as client:
+            order_book = client.market_data.get_order_book(figi=figi, depth=1)
+        if not order_book.asks:
+            return {'ask_price': None, 'ask_quantity': 0}
+        return {'ask_price': quotation_to_decimal(order_book.asks[0].price), 'ask_quantity': order_book.asks[0].quantity}
+
+    def get_quotes(self, figis: List[str]) -> Dict:
+        """
+        Котировки по нескольким инструментам: последние цены одним запросом,
+        верх стакана -- параллельными запросами.
+        figi -> {'last_price', 'ask_price', 'ask_quantity'}
+        """
+        figis = list(dict.fromkeys(figis))
+        if not figis:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(QUOTES_MAX_WORKERS, len(figis)) + 1) as executor:
+            last_prices = executor.submit(self.get_last_prices, figis)
+            order_books = list(executor.map(self.get_order_book_top, figis))
+            last_prices = last_prices.result()
+        return {
+            figi: {'last_price': last_prices.get(figi), **order_book}
+            for figi, order_book in zip(figis, order_books)
+        }
+
+    def buy_stocks_for_amount(self, amounts: Dict[str, float]) -> Dict:
+        """
+        Покупка нескольких тикеров (ticker -> сумма) с общим запросом котировок.
+        Возвращает ticker -> результат buy_stock_for_amount.
+        """
+        figis = {ticker: self.get_figi_by_ticker(ticker) for ticker in amounts}
+        try:
+            quotes = self.get_quotes([figi for figi in figis.values() if figi])
+        except Exception as e:
+            print(e)
+            quotes = {}
+        return {
+            ticker: self.buy_stock_for_amount(ticker, amount, quotes.get(figis[ticker]))
+            for ticker, amount in amounts.items()
+        }
+
+    def get_candles(self, figi, days, interval):
+        """
+        Свечи за последние days дней из локального хранилища.
+        У API запрашиваются только бары, которых нет в хранилище.
+        """
+        return self.candles.sync(figi, interval, now() - timedelta(days=days), lambda from_, to=None: self._fetch_candles(figi, from_, interval, to))
+
+    def _fetch_candles(self, figi, from_, interval, to=None):
+        """
+        Бары с from_ по to (по умолчанию -- по текущий момент).
+        Если запрос не удался, возвращает None: неполный ответ не записывается,
+        и следующая синхронизация повторит запрос с того же места.
+        """
+        columns = {column: [] for column in CandleStore.COLUMNS}
+        self.candles_rate_limiter.acquire()
+        try:
+            with self.get_client() as cl:
+                for candle in cl.get_all_candles(
+                    figi=figi,
+                    from_=from_,
+                    to=to,
+                    interval=interval,
+                    ):
+                    columns['time'].append(int(candle.time.timestamp()))
+                    columns['open'].append(float(quotation_to_decimal(candle.open)))
+                    columns['high'].append(float(quotation_to_decimal(candle.high)))
+                    columns['low'].append(float(quotation_to_decimal(candle.low)))
+                    columns['close'].append(float(quotation_to_decimal(candle.close)))
+                    columns['volume'].append(candle.volume)
+        except RequestError as e:
+            print(e)
+            return None
+        return columns
+
+    def get_info_by_ticker(self, ticker: str) -> Dict:
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return self.get_info_by_figi(figi)
+
+    def get_info_by_figi(self, figi: str) -> Dict:
+        stock_info = self.instruments.get(figi)
+        if stock_info:
+            return stock_info
+        with self.get_client() as client:
+            try:
+                share_response = client.instruments.share_by(
+                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI,
+                    id=figi
+                )
+            except:
+                return {}
+        stock_info = get_stock_info(share_response.instrument)
+        self.instruments.update(figi, stock_info)
+        return stock_info
+
+    def get_figi_by_ticker(self, ticker: str):
+        return self.db.get_info_by_ticker(ticker)
+
+    def get_ticker_by_figi(self, figi: str):
+        return self.db.get_ticker_by_info(figi)
+
+    def get_tickers_by_figis(self, figis: List[str]) -> Dict:
+        return self.db.get_tickers_by_infos(figis)
+
+    def reload_ticker_figi_db(self, instruments, force=False):
+        current_time = datetime.now()
+
+        last_update_time = self.db.get_last_update_time()
+        if not force and last_update_time and (current_time - last_update_time) < timedelta(days=1) \
+                and not self.instruments.is_expired(current_time):
+            return
+
+        shares = instruments.shares(
+            instrument_status=InstrumentStatus.INSTRUMENT_STATUS_BASE
+        )
+
+        russian_shares = [
+            share
+            for share in shares.instruments
+            if share.currency == "rub"
+        ]
+
+        for share in russian_shares:
+            self.db.update_data(share.ticker, share.figi)
+            self.instruments.update(share.figi, get_stock_info(share))
+
+        self.db.save_last_update_time(current_time)
+        self.db.save_data_to_file()
+        self.instruments.save(current_time)
+
+    def refresh_instruments(self, force=True):
+        """
+        Перезагружает базу тикер -> figi и кэш инструментов.
+        :param force: Если False, перезагружает только устаревший кэш.
+        """
+        if not force and not self.instruments.is_expired():
+            return
+        with self.get_client() as client:
+            self.reload_ticker_figi_db(client.instruments, force=force)
+
     @abc.abstractmethod
     def get_client(self):
         """
@@ -77,9 +269,11 @@ class BaseOrderManager(abc.ABC):
         pass
 
 class TinkoffOrderManager(BaseOrderManager):
-    def __init__(self, db_filepath, capital=Config.CAPITAL, api_key=Config.TINKOFF_REAL_TOKEN):
-        super().__init__(api_key)
+    def __init__(self, db_filepath, capital=Config.CAPITAL, api_key=Config.TINKOFF_REAL_TOKEN, candles_path=Config.CANDLES_PATH, client_pool=None):
+        super().__init__(api_key, client_pool)
         self.db = JsonDBHandler(db_filepath)
+        self.instruments = InstrumentCache(get_instruments_filepath(db_filepath), ttl=INSTRUMENTS_CACHE_TTL)
+        self.candles = CandleStore(candles_path)
         self.capital = capital
         
         with self.get_client() as client:
@@ -88,7 +282,7 @@ class TinkoffOrderManager(BaseOrderManager):
             self.load_balance(client)
 
     def get_client(self):
-        return Client(self.api_key)
+        return self.client_pool.get_client()
 
     def open_account(self, client):
         accounts = client.users.get_accounts().accounts
@@ -152,12 +346,7 @@ class TinkoffOrderManager(BaseOrderManager):
         return round(money_to_decimal(post_order_response.total_order_amount),2)
 
     def set_take_profit(self, client, figi, executed_order_price, quantity, stock_info, atr=None):
-        price_step = stock_info['price_step']
-        if atr:
-            take_profit_price = round((executed_order_price + Decimal(atr))/price_step, 0) * price_step
-        else: 
-            take_profit_price = executed_order_price * Decimal(1 + TAKE_PROFIT_PERCENTAGE)
-            take_profit_price -= take_profit_price % price_step
+        take_profit_price = get_take_profit_price(executed_order_price, stock_info['price_step'], atr)
         client.stop_orders.post_stop_order(
             quantity=quantity,
             price=decimal_to_quotation(take_profit_price),
@@ -171,12 +360,7 @@ class TinkoffOrderManager(BaseOrderManager):
         )
 
     def set_stop_loss(self, client, figi, executed_order_price, quantity, stock_info, atr=None):
-        price_step = stock_info['price_step']
-        if atr:
-            stop_loss_price = round((executed_order_price - Decimal(atr))/price_step, 0) * price_step
-        else:
-            stop_loss_price = executed_order_price * Decimal(1 + STOP_LOSS_PERCENTAGE)
-            stop_loss_price -= stop_loss_price % price_step
+        stop_loss_price = get_stop_loss_price(executed_order_price, stock_info['price_step'], atr)
         client.stop_orders.post_stop_order(
             quantity=quantity,
             stop_price=decimal_to_quotation(stop_loss_price),
@@ -188,7 +372,7 @@ class TinkoffOrderManager(BaseOrderManager):
             expiration_type=StopOrderExpirationType.STOP_ORDER_EXPIRATION_TYPE_GOOD_TILL_DATE,
         )  
     
-    def buy_stock_for_amount(self, ticker: str, amount: float) -> Decimal:
+    def buy_stock_for_amount(self, ticker: str, amount: float, quote=None) -> Decimal:
         with self.get_client() as client:
             order_id = uuid.uuid4().hex
             figi = self.get_figi_by_ticker(ticker)
@@ -198,9 +382,10 @@ class TinkoffOrderManager(BaseOrderManager):
                 tink_info = self.get_info_by_figi(figi)
                 if not tink_info:
                     return Decimal(0)
-                last_price = (client.market_data.get_last_prices(figi=[figi])).last_prices[0].price
-                quantity = int(int(amount)//(quotation_to_decimal(last_price) * tink_info['lot']))
-                quantity = min(client.market_data.get_order_book(figi=figi, depth=1).asks[0].quantity, quantity)
+                if quote is None:
+                    quote = self.get_quotes([figi])[figi]
+                quantity = int(int(amount)//(quote['last_price'] * tink_info['lot']))
+                quantity = min(quote['ask_quantity'], quantity)
                 if quantity == 0:
                     return 0.0
                 post_order_response = client.orders.post_order(
@@ -225,129 +410,36 @@ class TinkoffOrderManager(BaseOrderManager):
     def get_portfolio_stocks(self) -> List[Dict]:
         with self.get_client() as client:
             stocks = [] 
-            for position in client.operations.get_portfolio(account_id=self.account_id).positions:
+            positions = client.operations.get_portfolio(account_id=self.account_id).positions
+            tickers = self.get_tickers_by_figis([position.figi for position in positions])
+            for position in positions:
                 stock = {}
-                stock['ticker'] = self.get_ticker_by_figi(position.figi)
+                stock['ticker'] = tickers[position.figi]
                 stock['worth_current'] = round(money_to_decimal(position.current_price) * quotation_to_decimal(position.quantity),2)
                 stock['quantity'] = int(quotation_to_decimal(position.quantity_lots))
                 stock['profit_current'] = round(quotation_to_decimal(position.expected_yield)/stock['worth_current'] * 100, 2)
                 stocks.append(stock)
             return stocks
     
-    def get_info_by_ticker(self, ticker: str) -> Dict:
-        with self.get_client() as client:
-            figi = self.get_figi_by_ticker(ticker)
-            if not figi:
-                return Decimal(0)
-            try:
-                share_response = client.instruments.share_by(
-                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, 
-                    id=figi
-                )
-            except:
-                return {}
-        stock_info = {}
-        stock_info['lot'] = share_response.instrument.lot
-        stock_info['ticker'] = share_response.instrument.ticker
-        stock_info['price_step'] = quotation_to_decimal(share_response.instrument.min_price_increment)
-        return stock_info
-    
-    def get_info_by_figi(self, figi: str) -> Dict:
-        with self.get_client() as client:
-            try:
-                share_response = client.instruments.share_by(
-                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, 
-                    id=figi
-                )
-            except:
-                return {}
-        stock_info = {}
-        stock_info['lot'] = share_response.instrument.lot
-        stock_info['ticker'] = share_response.instrument.ticker
-        stock_info['price_step'] = quotation_to_decimal(share_response.instrument.min_price_increment)
-        return stock_info
-
-    def get_figi_by_ticker(self, ticker: str):
-        return self.db.get_info_by_ticker(ticker)
-
-    def get_ticker_by_figi(self, figi: str):
-        return self.db.get_ticker_by_info(figi)
-
-    def reload_ticker_figi_db(self, instruments):
-        current_time = datetime.now()
-        
-        last_update_time = self.db.get_last_update_time()
-        if last_update_time and (current_time - last_update_time) < timedelta(days=1):
-            return
-        
-        shares = instruments.shares(
-            instrument_status=InstrumentStatus.INSTRUMENT_STATUS_BASE
-        )
-        
-        russian_shares = [
-            share
-            for share in shares.instruments
-            if share.currency == "rub" 
-        ]
-        
-        figi_ticker_df = pd.DataFrame(
-            russian_shares,
-            columns=['ticker', 'figi']
-        )
-        for pair in figi_ticker_df.to_dict(orient="records"):
-            self.db.update_data(pair['ticker'], pair['figi'])
-        
-        self.db.save_last_update_time(current_time)
-        self.db.save_data_to_file()
-
     def get_close_prices(self, ticker, days) -> List:
-        with self.get_client() as cl:
-            close_prices = []
-            figi = self.get_figi_by_ticker(ticker)
-            if not figi:
-                return Decimal(0)
-            try:
-                for candle in cl.get_all_candles(
-                    figi=figi,
-                    from_= now() - timedelta(days=days),
-                    interval=CandleInterval.CANDLE_INTERVAL_15_MIN,
-                    ):
-                    close_prices.append(float(quotation_to_decimal(candle.close)))
-            except:
-                pass
-            return close_prices
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return self.get_candles(figi, days, CandleInterval.CANDLE_INTERVAL_15_MIN)['close'].tolist()
         
     def get_historical_data(self, ticker, days) -> List:
-        with self.get_client() as cl:
-            historical_data = []
-            figi = self.get_figi_by_ticker(ticker)
-            if not figi:
-                return Decimal(0)
-
-            try:
-                for candle in cl.get_all_candles(
-                    figi=figi,
-                    from_= now() - timedelta(days=days),
-                    interval=CandleInterval.CANDLE_INTERVAL_2_MIN,
-                    ):
-                    historical_data.append(
-                        {
-                            'close': float(quotation_to_decimal(candle.close)),
-                            'open': float(quotation_to_decimal(candle.open)),
-                            'high': float(quotation_to_decimal(candle.high)),
-                            'low': float(quotation_to_decimal(candle.low)),
-                            'volume': candle.volume
-                        }
-                        )
-            except:
-                pass
-            return historical_data
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return candles_to_records(self.get_candles(figi, days, CandleInterval.CANDLE_INTERVAL_2_MIN))
 
 
 class TinkoffSandboxOrderManager(BaseOrderManager):
-    def __init__(self, db_filepath, capital=Config.CAPITAL, api_key=Config.TINKOFF_REAL_TOKEN):
-        super().__init__(api_key=api_key)
+    def __init__(self, db_filepath, capital=Config.CAPITAL, api_key=Config.TINKOFF_REAL_TOKEN, candles_path=Config.CANDLES_PATH, client_pool=None):
+        super().__init__(api_key=api_key, client_pool=client_pool)
         self.db = JsonDBHandler(db_filepath)
+        self.instruments = InstrumentCache(get_instruments_filepath(db_filepath), ttl=INSTRUMENTS_CACHE_TTL)
+        self.candles = CandleStore(candles_path)
         self.capital = capital
         self.balance = capital
         self.portfolio_stocks = []
@@ -356,7 +448,7 @@ class TinkoffSandboxOrderManager(BaseOrderManager):
             self.reload_ticker_figi_db(client.instruments)
 
     def get_client(self):
-        return Client(self.api_key)
+        return self.client_pool.get_client()
 
     def open_account(self, client):
         pass
@@ -390,9 +482,21 @@ class TinkoffSandboxOrderManager(BaseOrderManager):
                 
     def buy_stock_now(self, ticker: str, quantity: int, atr=None) -> Decimal:
         """
-        TODO
+        Эмулирует покупку quantity лотов по последней цене.
+        Возращается число -- суммарное цена всей заявки
         """
-        pass
+        with self.get_client() as client:
+            figi = self.get_figi_by_ticker(ticker)
+            if not figi:
+                return Decimal(0)
+            tink_info = self.get_info_by_figi(figi)
+            if not tink_info:
+                return Decimal(0)
+            last_price = quotation_to_decimal((client.market_data.get_last_prices(figi=[figi])).last_prices[0].price)
+        worth = quantity * last_price * tink_info['lot']
+        self.balance -= worth
+        self._add_stock_to_portfolio({'ticker': ticker, 'quantity': quantity, 'origin_price': last_price})
+        return round(worth, 2)
     
     def set_take_profit(self, client, figi, executed_order_price, quantity, stock_info, atr=None):
         pass
@@ -400,7 +504,7 @@ class TinkoffSandboxOrderManager(BaseOrderManager):
     def set_stop_loss(self, client, figi, executed_order_price, quantity, stock_info, atr=None):
         pass    
     
-    def buy_stock_for_amount(self, ticker: str, amount: float) -> Decimal:
+    def buy_stock_for_amount(self, ticker: str, amount: float, quote=None) -> Decimal:
         with self.get_client() as client:
             figi = self.get_figi_by_ticker(ticker)
             if not figi:
@@ -409,9 +513,11 @@ class TinkoffSandboxOrderManager(BaseOrderManager):
                 tink_info = self.get_info_by_figi(figi)
                 if not tink_info:
                     return Decimal(0)
-                last_price = quotation_to_decimal((client.market_data.get_last_prices(figi=[figi])).last_prices[0].price)
+                if quote is None:
+                    quote = self.get_quotes([figi])[figi]
+                last_price = quote['last_price']
                 quantity = int(int(amount)//(last_price * tink_info['lot']))
-                quantity = min(client.market_data.get_order_book(figi=figi, depth=1).asks[0].quantity, quantity)
+                quantity = min(quote['ask_quantity'], quantity)
                 if quantity == 0:
                     return Decimal(0)
                 self.balance -= quantity * last_price * tink_info['lot']
@@ -427,21 +533,26 @@ class TinkoffSandboxOrderManager(BaseOrderManager):
         return round(quantity * last_price * tink_info['lot'],2)        
     
     def get_portfolio_stocks(self) -> List[Dict]:
-        with self.get_client() as client:
-            stocks = [] 
-            for stock in self.portfolio_stocks:
-                stock_display = stock
-                figi = self.get_figi_by_ticker(stock['ticker'])
-                if not figi:
-                    return Decimal(0)
-                tink_info = self.get_info_by_figi(figi)
-                if not tink_info:
-                    return Decimal(0)
-                last_price = quotation_to_decimal((client.market_data.get_last_prices(figi=[figi])).last_prices[0].price)
-                stock_display['worth_current'] = round(last_price * stock['quantity'] * tink_info['lot'],2)
-                stock_display['profit_current'] = round((last_price - stock['origin_price'])/stock['origin_price']*100, 2)
-                stocks.append(stock_display)
-            return stocks
+        stocks = [] 
+        figis = {stock['ticker']: self.get_figi_by_ticker(stock['ticker']) for stock in self.portfolio_stocks}
+        if not all(figis.values()):
+            return Decimal(0)
+        last_prices = self.get_last_prices(list(figis.values()))
+        for stock in self.portfolio_stocks:
+            stock_display = stock
+            figi = figis[stock['ticker']]
+            tink_info = self.get_info_by_figi(figi)
+            if not tink_info:
+                return Decimal(0)
+            last_price = last_prices.get(figi)
+            if last_price is None:
+                # API не вернул цену: позиция попадёт в список в следующий раз
+                print(f"Нет последней цены по {stock['ticker']}")
+                continue
+            stock_display['worth_current'] = round(last_price * stock['quantity'] * tink_info['lot'],2)
+            stock_display['profit_current'] = round((last_price - stock['origin_price'])/stock['origin_price']*100, 2)
+            stocks.append(stock_display)
+        return stocks
     
     def _add_stock_to_portfolio(self, stock: Dict):
         # TODO
@@ -452,115 +563,17 @@ class TinkoffSandboxOrderManager(BaseOrderManager):
                 return
         self.portfolio_stocks.append(stock)
     
-    def get_info_by_ticker(self, ticker: str) -> Dict:
-        with self.get_client() as client:
-            figi = self.get_figi_by_ticker(ticker)
-            if not figi:
-                return Decimal(0)
-            try:
-                share_response = client.instruments.share_by(
-                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, 
-                    id=figi
-                )
-            except:
-                return {}
-        stock_info = {}
-        stock_info['lot'] = share_response.instrument.lot
-        stock_info['ticker'] = share_response.instrument.ticker
-        stock_info['price_step'] = quotation_to_decimal(share_response.instrument.min_price_increment)
-        return stock_info
-    
-    def get_info_by_figi(self, figi: str) -> Dict:
-        with self.get_client() as client:
-            try:
-                share_response = client.instruments.share_by(
-                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, 
-                    id=figi
-                )
-            except:
-                return {}
-        stock_info = {}
-        stock_info['lot'] = share_response.instrument.lot
-        stock_info['ticker'] = share_response.instrument.ticker
-        stock_info['price_step'] = quotation_to_decimal(share_response.instrument.min_price_increment)
-        return stock_info
-    
-    def get_figi_by_ticker(self, ticker: str):
-        return self.db.get_info_by_ticker(ticker)
-
-    def get_ticker_by_figi(self, figi: str):
-        return self.db.get_ticker_by_info(figi)
-
-    def reload_ticker_figi_db(self, instruments):
-        current_time = datetime.now()
-        
-        last_update_time = self.db.get_last_update_time()
-        if last_update_time and (current_time - last_update_time) < timedelta(days=1):
-            return
-        
-        shares = instruments.shares(
-            instrument_status=InstrumentStatus.INSTRUMENT_STATUS_BASE
-        )
-        
-        russian_shares = [
-            share
-            for share in shares.instruments
-            if share.currency == "rub" 
-        ]
-        
-        figi_ticker_df = pd.DataFrame(
-            russian_shares,
-            columns=['ticker', 'figi']
-        )
-        for pair in figi_ticker_df.to_dict(orient="records"):
-            self.db.update_data(pair['ticker'], pair['figi'])
-        
-        self.db.save_last_update_time(current_time)
-        self.db.save_data_to_file()
-
     def get_close_prices(self, ticker, days) -> List:
-        with self.get_client() as cl:
-            close_prices = []
-            figi = self.get_figi_by_ticker(ticker)
-            if not figi:
-                return Decimal(0)
-
-            try:
-                for candle in cl.get_all_candles(
-                    figi=figi,
-                    from_= now() - timedelta(days=days),
-                    interval=CandleInterval.CANDLE_INTERVAL_15_MIN,
-                    ):
-                    close_prices.append(float(quotation_to_decimal(candle.close)))
-            except:
-                pass
-            return close_prices
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return self.get_candles(figi, days, CandleInterval.CANDLE_INTERVAL_15_MIN)['close'].tolist()
     
     def get_historical_data(self, ticker, days) -> List:
-        with self.get_client() as cl:
-            historical_data = []
-            figi = self.get_figi_by_ticker(ticker)
-            if not figi:
-                return Decimal(0)
-
-            try:
-                for candle in cl.get_all_candles(
-                    figi=figi,
-                    from_= now() - timedelta(days=days),
-                    interval=CandleInterval.CANDLE_INTERVAL_2_MIN,
-                    ):
-                    historical_data.append(
-                        {
-                            'close': float(quotation_to_decimal(candle.close)),
-                            'open': float(quotation_to_decimal(candle.open)),
-                            'high': float(quotation_to_decimal(candle.high)),
-                            'low': float(quotation_to_decimal(candle.low)),
-                            'volume': candle.volume
-                        }
-                        )
-            except:
-                pass
-            return historical_data
+        figi = self.get_figi_by_ticker(ticker)
+        if not figi:
+            return Decimal(0)
+        return candles_to_records(self.get_candles(figi, days, CandleInterval.CANDLE_INTERVAL_2_MIN))
 
     
 def main():
@@ -1,79 +1,487 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import root_mean_squared_error
 
+from shared_arrays import to_shared, attach_shared
 
-class RFPredictor():
-    def __init__(self, window=7):
-        self.models = {}
+# Гиперпараметры модели, входят в версию снимков
+MODEL_PARAMS = {'n_estimators': 100}
+TEST_SIZE = 0.2
+# Сколько последних свечей RLSPredictor разбирает, если модель уже обучена
+RLS_TAIL_BARS = 32
+
+class BasePredictor():
+    """
+    Общая часть предикторов: признаки и учёт новых баров.
+    """
+    def __init__(self, window=7, n_lags=1):
+        self.features = ['volatility', 'volume_SMA', 'RSI', 'open', 'high', 'low', 'close', 'volume']
+        self.window = window
+        self.n_lags = n_lags
+
+    def _calculate_rsi(self, close):
+        delta = np.diff(close, prepend=np.nan)
+        gain = _rolling_mean(np.where(delta > 0, delta, 0), self.window)
+        loss = _rolling_mean(np.where(delta < 0, -delta, 0), self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100 - 100 / (1 + gain / loss)
+
+    def _build_features(self, historical_data):
+        """
+        Матрица признаков float32 без промежуточных DataFrame.
+        Колонки: open, high, low, volume, volatility, volume_SMA, RSI,
+        затем лаги 1..n_lags всех self.features.
+        :return: (X float32, y float64 -- цены закрытия)
+        """
+        bars = _to_arrays(historical_data)
+        close = bars['close']
+        base = {
+            'open': bars['open'],
+            'high': bars['high'],
+            'low': bars['low'],
+            'close': close,
+            'volume': bars['volume'],
+            'volatility': _rolling_std(close, self.window),
+            'volume_SMA': _rolling_mean(bars['volume'], self.window),
+            'RSI': self._calculate_rsi(close),
+        }
+        columns = ['open', 'high', 'low', 'volume', 'volatility', 'volume_SMA', 'RSI']
+        n_rows = len(close)
+        n_features = len(self.features)
+        X = np.empty((n_rows, len(columns) + n_features * self.n_lags), dtype=np.float32)
+        for i, column in enumerate(columns):
+            X[:, i] = base[column]
+
+        # Лаги: блок признаков, сдвинутый на lag строк вниз
+        lagged = np.column_stack([base[feature] for feature in self.features]).astype(np.float32)
+        for lag in range(1, self.n_lags + 1):
+            start = len(columns) + (lag - 1) * n_features
+            block = X[:, start:start + n_features]
+            block[:lag] = np.nan
+            block[lag:] = lagged[:n_rows - lag]
+        return X, close
+
+    def _get_last_time(self, bars):
+        if 'time' in bars:
+            return bars['time'][-1]
+        return len(bars['close'])
+
+    def _count_new_bars(self, entry, bars):
+        if 'time' in bars:
+            return int((bars['time'] > entry['trained_time']).sum())
+        return len(bars['close']) - entry['trained_time']
+
+    def get_prediction_next_close(self, ticker: str, historical_data: list):
+        raise NotImplementedError("Метод get_prediction_next_close должен быть реализован в подклассах.")
+
+    def get_predictions_next_close(self, stocks_data):
+        """
+        Пакетный прогноз для списка пар (ticker, historical_data).
+        :return: Словарь ticker -> прогноз.
+        """
+        return {ticker: self.get_prediction_next_close(ticker, historical_data) for ticker, historical_data in stocks_data}
+
+    def close(self):
+        pass
+
+
+class RFPredictor(BasePredictor):
+    def __init__(self, window=7, n_lags=1, max_models=50, retrain_bars=5, drift_threshold=2.0, max_workers=None, models_path=None,
+                 max_stale_retrains=None):
+        """
+        :param window: Окно скользящих признаков.
+        :param n_lags: Сколько лагов каждого признака добавлять в матрицу.
+        :param max_models: Сколько моделей держать в памяти, лишние вытесняются по LRU.
+        :param retrain_bars: Через сколько новых баров модель переобучается.
+        :param drift_threshold: Переобучать раньше, если RMSE на новых барах больше RMSE
+            на тестовой выборке в drift_threshold раз.
+        :param max_workers: Число процессов для пакетного обучения, по умолчанию -- число ядер.
+        :param models_path: Каталог снимков моделей. Если задан, обученные модели сохраняются
+            на диск и подгружаются оттуда при первом обращении после перезапуска.
+        :param max_stale_retrains: Сколько моделей, устаревших по retrain_bars, переобучать
+            за один пакетный вызов (по умолчанию -- max_workers, одна волна пула). Остальные
+            пока прогнозируют старой моделью и переобучаются в следующих вызовах: после
+            перезапуска со снимками устаревают все модели сразу.
+        """
+        super().__init__(window, n_lags)
+        self.models = OrderedDict()
         """
         {
             ticker : 
             {
-                hist_data, # Оригинальные данные 'open', 'high', 'low', 'close', 'volume' + значения индикаторов
                 model,
+                rmse, # RMSE на тестовой выборке при обучении
+                trained_time, # Время последнего бара, на котором обучалась модель
+                closes, # Цены закрытия, для которых посчитан prediction
                 prediction # Последнее рассчитанное значение model.predict
             }
         }
         """
-        self.features = ['volatility', 'volume_SMA', 'RSI', 'open', 'high', 'low', 'close', 'volume']
-        self.window = window
+        self.max_models = max_models
+        self.retrain_bars = retrain_bars
+        self.drift_threshold = drift_threshold
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_stale_retrains = self.max_workers if max_stale_retrains is None else max_stale_retrains
+        self.executor = None
+        self.models_path = models_path
+        self.snapshot_version = self._get_snapshot_version()
+        self.stats = {'hits': 0, 'misses': 0, 'retrains': 0, 'deferred': 0, 'evictions': 0, 'loads': 0}
         
     
-    def _create_lags(self, df, n_lags):
-        for col in self.features:
-            for lag in range(1, n_lags + 1):
-                df.loc[:, f'{col}_lag_{lag}'] = df[col].shift(lag)
-        
-        return df
+    def _train_model_predict(self, historical_data, n_jobs=None):
+        X, y = self._build_features(historical_data)
+        return _fit_predict(X, y, n_jobs)
+
+    def _put(self, ticker, entry):
+        self.models[ticker] = entry
+        self.models.move_to_end(ticker)
+        while len(self.models) > self.max_models:
+            self.models.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _store(self, ticker, historical_data, model, pred, rmse):
+        entry = {
+            'model': model,
+            'rmse': rmse,
+            'trained_time': self._get_last_time(historical_data),
+            'closes': historical_data['close'],
+            'prediction': pred,
+        }
+        self._put(ticker, entry)
+        self._save_snapshot(ticker, entry)
+        return pred[-1]
+
+    def _get_snapshot_version(self):
+        """
+        Снимки разных наборов признаков и гиперпараметров лежат в разных каталогах.
+        """
+        params = {
+            'features': self.features,
+            'window': self.window,
+            'n_lags': self.n_lags,
+            'model': MODEL_PARAMS,
+            'test_size': TEST_SIZE,
+            'sklearn': sklearn.__version__,
+        }
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
 
-    def _calculate_rsi(self, data):        
-        delta = data['close'].diff(1)
-        gain = (delta.where(delta > 0, 0)).rolling(window=self.window).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=self.window).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi
+    def _get_snapshot_path(self, ticker):
+        return os.path.join(self.models_path, self.snapshot_version, f"{ticker}.joblib")
 
-    def _train_model_predict(self, historical_data):
-        historical_data['volatility'] = historical_data['close'].rolling(window=self.window).std()
-        historical_data['volume_SMA'] = historical_data['volume'].rolling(window=self.window).mean()
-        historical_data['RSI'] = self._calculate_rsi(historical_data)
+    def _save_snapshot(self, ticker, entry):
+        if not self.models_path:
+            return
+        path = self._get_snapshot_path(ticker)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Пишем во временный файл, чтобы не оставить битый снимок при падении
+            joblib.dump(entry, path + '.tmp')
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            print(e)
 
-        # historical_data = historical_data.dropna()
+    def _load_snapshot(self, ticker):
+        """
+        Лениво подгружает снимок модели с диска. Массивы деревьев отображаются через mmap.
+        """
+        if not self.models_path:
+            return None
+        path = self._get_snapshot_path(ticker)
+        if not os.path.exists(path):
+            return None
+        try:
+            entry = joblib.load(path, mmap_mode='r')
+        except Exception as e:
+            print(e)
+            return None
+        self._put(ticker, entry)
+        self.stats['loads'] += 1
+        return entry
 
-        historical_data = self._create_lags(historical_data, 1)
+    def _train(self, ticker, historical_data, n_jobs=None):
+        model, pred, rmse = self._train_model_predict(historical_data, n_jobs)
+        return self._store(ticker, historical_data, model, pred, rmse)
 
-        # Разделение на признаки и целевую переменную
-        X = historical_data.drop(columns=['close'])
-        y = historical_data['close']
+    def _is_drifted(self, entry, y_true, y_pred):
+        if not len(y_true) or not entry['rmse']:
+            return False
+        return root_mean_squared_error(y_true, y_pred) > entry['rmse'] * self.drift_threshold
 
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
+    def _predict_cached(self, ticker, historical_data):
+        """
+        Прогноз по сохранённой модели: (прогноз, пора ли переобучить).
+        Прогноз None, если модели нет или на новых барах обнаружен дрейф.
+        """
+        entry = self.models.get(ticker)
+        if entry is None:
+            entry = self._load_snapshot(ticker)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None, True
 
-        model = RandomForestRegressor(n_estimators=100)
+        self.models.move_to_end(ticker)
+        closes = historical_data['close']
+        if np.array_equal(entry['closes'], closes):
+            self.stats['hits'] += 1
+            return entry['prediction'][-1], False
 
-        model.fit(X_train, y_train)
+        # Пересчитываем признаки и прогнозируем без обучения.
+        # Новые бары заодно служат проверкой на дрейф.
+        new_bars = self._count_new_bars(entry, historical_data)
+        X, y = self._build_features(historical_data)
+        y_pred = entry['model'].predict(X[-max(new_bars, 1):])
+        if new_bars and self._is_drifted(entry, y[-new_bars:], y_pred[-new_bars:]):
+            self.stats['retrains'] += 1
+            return None, True
+        if new_bars >= self.retrain_bars:
+            return y_pred[-1], True
 
-        y_pred = model.predict(X_test)
-        
-        return model, y_pred
+        self.stats['hits'] += 1
+        entry['closes'] = closes
+        entry['prediction'] = y_pred
+        return y_pred[-1], False
     
     def get_prediction_next_close(self, ticker: str, historical_data: list):
-        historical_data = pd.DataFrame(historical_data)
-        if ticker in self.models:
-            if self.models['ticker']['hist_data']['close'].equals(historical_data['close']):
-               return self.models['ticker']['prediction'][-1]
-            else:
-                self.models['ticker']['model'], self.models['ticker']['prediction'] = self._train_model_predict(historical_data)
-                return self.models['ticker']['prediction'][-1]
-        else:
-            model, pred = self._train_model_predict(historical_data)
-            self.models['ticker'] = {
-                'model' : model,
-                'prediction': pred,
-                'hist_data': historical_data
+        historical_data = _to_arrays(historical_data)
+        prediction, is_stale = self._predict_cached(ticker, historical_data)
+        if is_stale:
+            if prediction is not None:
+                self.stats['retrains'] += 1
+            prediction = self._train(ticker, historical_data)
+        return prediction
+
+    def get_predictions_next_close(self, stocks_data):
+        """
+        Пакетный прогноз для списка пар (ticker, historical_data).
+        Модели, которые нужно обучить, обучаются параллельно в пуле процессов;
+        матрицы признаков передаются через shared memory.
+        Устаревших моделей переобучается не больше max_stale_retrains, начиная
+        с самых старых, остальные дают прогноз без переобучения.
+        :return: Словарь ticker -> прогноз.
+        """
+        predictions = {}
+        to_train = []
+        stale = []
+        for ticker, historical_data in stocks_data:
+            historical_data = _to_arrays(historical_data)
+            prediction, is_stale = self._predict_cached(ticker, historical_data)
+            if prediction is None:
+                to_train.append((ticker, historical_data))
+                continue
+            predictions[ticker] = prediction
+            if is_stale:
+                stale.append((self.models[ticker]['trained_time'], ticker, historical_data))
+
+        stale.sort(key=lambda item: item[0])
+        for _, ticker, historical_data in stale[:self.max_stale_retrains]:
+            to_train.append((ticker, historical_data))
+        self.stats['retrains'] += min(len(stale), self.max_stale_retrains)
+        self.stats['deferred'] += max(len(stale) - self.max_stale_retrains, 0)
+
+        if len(to_train) == 1 or self.max_workers == 1:
+            for ticker, historical_data in to_train:
+                predictions[ticker] = self._train(ticker, historical_data, n_jobs=self.max_workers)
+            return predictions
+        if not to_train:
+            return predictions
+
+        # Процессов не больше, чем моделей; оставшиеся ядра уходят на деревья внутри модели
+        processes = min(len(to_train), self.max_workers)
+        n_jobs = max(1, self.max_workers // processes)
+        executor = self._get_executor()
+        blocks = []
+        try:
+            futures = []
+            for ticker, historical_data in to_train:
+                X, y = self._build_features(historical_data)
+                x_block, y_block = to_shared(X), to_shared(y)
+                blocks += [x_block, y_block]
+                futures.append(executor.submit(_fit_predict_shared, x_block.name, y_block.name, X.shape, n_jobs))
+            for (ticker, historical_data), future in zip(to_train, futures):
+                model, pred, rmse = future.result()
+                predictions[ticker] = self._store(ticker, historical_data, model, pred, rmse)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        return predictions
+
+    def _get_executor(self):
+        if self.executor is None:
+            # Бот многопоточный: fork скопировал бы в процессы чужие захваченные блокировки
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(method))
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+
+class RLSPredictor(BasePredictor):
+    """
+    Онлайн-предиктор: рекурсивный МНК (RLS) по тем же признакам, что и RFPredictor.
+    Модель дообучается только на новых закрытых барах, за O(d^2) на бар;
+    последний (формирующийся) бар используется лишь для прогноза.
+    """
+    def __init__(self, window=7, n_lags=1, forgetting=0.995, delta=100.0):
+        """
+        :param forgetting: Коэффициент забывания, чем меньше -- тем быстрее модель забывает старые бары.
+        :param delta: Начальная дисперсия весов.
+        """
+        super().__init__(window, n_lags)
+        self.forgetting = forgetting
+        self.delta = delta
+        self.models = {}
+        """
+        {
+            ticker :
+            {
+                weights, # Веса признаков + свободный член
+                P, # Обратная ковариационная матрица
+                scale, # Масштаб признаков, фиксируется по первой строке
+                trained_time # Время последнего бара, на котором обучалась модель
             }
-            return pred[-1]
+        }
+        """
+        self.stats = {'misses': 0, 'updates': 0}
+
+    def _get_recent_bars(self, historical_data, model):
+        """
+        Для обученной модели в массивы переводится только хвост списка свечей.
+        """
+        size = self.window + self.n_lags + RLS_TAIL_BARS
+        if model is None or not isinstance(historical_data, list) or len(historical_data) <= size:
+            return _to_arrays(historical_data)
+        bars = _to_arrays(historical_data[-size:])
+        if 'time' not in bars or self._count_new_bars(model, bars) >= RLS_TAIL_BARS:
+            return _to_arrays(historical_data)
+        return bars
+
+    def _get_tail(self, bars, n_rows):
+        # Для признаков последних n_rows строк хватает window + n_lags предыдущих баров
+        size = n_rows + self.window + self.n_lags + 1
+        return {column: values[-size:] for column, values in bars.items()}
+
+    def _create_model(self, x):
+        n_features = len(x) + 1
+        return {
+            'weights': np.zeros(n_features),
+            'P': np.eye(n_features) * self.delta,
+            'scale': 1 / np.maximum(np.abs(x), 1),
+            'trained_time': None,
+        }
+
+    def _update(self, model, x, y):
+        x = np.append(x * model['scale'], 1.0)
+        Px = model['P'] @ x
+        gain = Px / (self.forgetting + x @ Px)
+        model['weights'] += gain * (y - model['weights'] @ x)
+        model['P'] = (model['P'] - np.outer(gain, Px)) / self.forgetting
+        self.stats['updates'] += 1
+
+    def _predict(self, model, x):
+        return np.append(x * model['scale'], 1.0) @ model['weights']
+
+    def get_prediction_next_close(self, ticker: str, historical_data: list):
+        model = self.models.get(ticker)
+        bars = self._get_recent_bars(historical_data, model)
+        completed = {column: values[:-1] for column, values in bars.items()}
+        if model is None:
+            self.stats['misses'] += 1
+            new_bars = len(completed['close'])
+        else:
+            new_bars = max(self._count_new_bars(model, completed), 0)
+
+        X, y = self._build_features(self._get_tail(bars, new_bars + 1))
+        X = X.astype(np.float64)
+        for x, close in zip(X[len(X) - 1 - new_bars:-1], y[len(y) - 1 - new_bars:-1]):
+            if np.isnan(x).any():
+                continue
+            if model is None:
+                model = self._create_model(x)
+                self.models[ticker] = model
+            self._update(model, x, close)
+        if model is not None and len(completed['close']):
+            model['trained_time'] = self._get_last_time(completed)
+
+        # Без обученной модели или полных признаков прогноз -- последняя цена
+        if model is None or np.isnan(X[-1]).any():
+            return y[-1]
+        return self._predict(model, X[-1])
+
+
+def _fit_predict(X, y, n_jobs=None):
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, shuffle=False)
+
+    model = RandomForestRegressor(**MODEL_PARAMS, n_jobs=n_jobs)
+
+    model.fit(X_train, y_train)
+
+    y_pred = model.predict(X_test)
+    rmse = root_mean_squared_error(y_test, y_pred)
+    
+    return model, y_pred, rmse
+
+def _fit_predict_shared(x_name, y_name, shape, n_jobs):
+    """
+    Обучение в дочернем процессе: признаки (float32) и цель (float64) читаются из shared memory.
+    """
+    x_block, X = attach_shared(x_name, shape, np.float32)
+    y_block, y = attach_shared(y_name, shape[:1], np.float64)
+    try:
+        result = _fit_predict(X, y, n_jobs)
+        del X, y
+        return result
+    finally:
+        x_block.close()
+        y_block.close()
+
+def _to_arrays(historical_data):
+    """
+    Свечи (список словарей или DataFrame) -> словарь колонок numpy.
+    """
+    if isinstance(historical_data, dict):
+        return historical_data
+    if isinstance(historical_data, pd.DataFrame):
+        bars = {column: historical_data[column].to_numpy() for column in historical_data.columns}
+    else:
+        bars = {column: np.array([bar[column] for bar in historical_data]) for column in historical_data[0]}
+    for column in ('open', 'high', 'low', 'close', 'volume'):
+        bars[column] = bars[column].astype(np.float64)
+    return bars
+
+def _rolling_mean(values, window):
+    """
+    Скользящее среднее через кумулятивную сумму, первые window - 1 значений -- NaN.
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+    cumsum = np.cumsum(np.insert(values.astype(np.float64), 0, 0))
+    result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
 
-    
\ No newline at end of file
+def _rolling_std(values, window):
+    """
+    Скользящее стандартное отклонение (ddof=1), как у pandas rolling().std().
+    """
+    # Центрирование уменьшает потерю точности в разности сумм квадратов
+    centered = values - np.nanmean(values) if len(values) else values
+    mean = _rolling_mean(centered, window)
+    mean_sq = _rolling_mean(centered ** 2, window)
+    variance = np.maximum(mean_sq - mean ** 2, 0) * window / (window - 1)
+    return np.sqrt(variance)
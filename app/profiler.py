@@ -0,0 +1,103 @@
+import cProfile
+import os
+import pstats
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# Сколько функций показывать в ответе бота
+TOP_FUNCTIONS = 20
+
+
+class CycleProfiler:
+    """
+    Профилирование cProfile следующих N циклов опроса по команде.
+
+    cProfile видит только свой поток, поэтому профилей два вида: cycle() -- код
+    цикла в event loop (брокер, Telegram, ожидание сети в select), run() -- вызовы
+    стратегии в потоках. Пока профилирование выключено, это одна проверка счётчика.
+    Включённое профилирование собирает статистику до конца N-го цикла
+    и сохраняет её в pstats-файл (смотреть через snakeviz, flameprof или `python -m pstats`).
+    """
+    def __init__(self, path="profiles"):
+        self.path = path
+        self.remaining = 0
+        self.chat_id = None
+        self.stats = None
+        self.lock = threading.Lock()
+
+    def start(self, n_cycles, chat_id=None):
+        with self.lock:
+            self.remaining = n_cycles
+            self.chat_id = chat_id
+            self.stats = None
+
+    def run(self, func, *args):
+        if not self.remaining:
+            return func(*args)
+        with self._profile():
+            return func(*args)
+
+    @contextmanager
+    def cycle(self):
+        """
+        Профилирует код цикла в текущем потоке: with profiler.cycle(): await job().
+        Пока цикл ждёт сеть, в профиль попадают и другие задачи event loop.
+        """
+        if not self.remaining:
+            yield
+            return
+        with self._profile():
+            yield
+
+    @contextmanager
+    def _profile(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Уже работает другой профилировщик
+            print(e)
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def end_cycle(self):
+        """
+        Отмечает конец цикла опроса. После N-го цикла сохраняет профиль
+        и возвращает (путь к файлу, id чата, текст с топом функций), иначе None.
+        """
+        if not self.remaining:
+            return None
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining:
+                return None
+            stats, self.stats = self.stats, None
+            chat_id = self.chat_id
+        if stats is None:
+            return None, chat_id, "Профиль пуст: за эти циклы ничего не выполнялось."
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"profile_{datetime.now():%Y%m%d_%H%M%S}.pstats")
+        stats.dump_stats(path)
+        return path, chat_id, get_top_functions(stats)
+
+
+def get_top_functions(stats, limit=TOP_FUNCTIONS):
+    """
+    Топ функций по кумулятивному времени: время, число вызовов, функция.
+    """
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    lines = [f"Всего {stats.total_tt:.2f} с"]
+    for (file_name, line, function), (_, n_calls, _, cumulative_time, _) in rows:
+        location = f"{os.path.basename(file_name)}:{line}" if line else file_name
+        lines.append(f"{cumulative_time:8.3f} {n_calls:>8} {function} ({location})")
+    return "\n".join(lines)
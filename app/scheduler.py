@@ -0,0 +1,176 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone, time as day_time
+
+from metrics import metrics
+
+MOSCOW_TZ = timezone(timedelta(hours=3))
+# Основная и вечерняя сессии MOEX по акциям, московское время
+TRADING_SESSIONS = (
+    (day_time(10, 0), day_time(18, 40)),
+    (day_time(19, 5), day_time(23, 50)),
+)
+# Торговые дни недели: пн-пт
+TRADING_WEEKDAYS = (0, 1, 2, 3, 4)
+# Наибольшая пауза планировщика: чаще проверяется конец сессии и остановка
+MAX_SLEEP = 60
+
+
+def get_session_end(moment, sessions=TRADING_SESSIONS, weekdays=TRADING_WEEKDAYS, holidays=()):
+    """
+    Конец текущей торговой сессии или None, если рынок закрыт.
+    """
+    moment = moment.astimezone(MOSCOW_TZ)
+    if moment.weekday() not in weekdays or moment.date() in holidays:
+        return None
+    for start, end in sessions:
+        if start <= moment.time() < end:
+            return datetime.combine(moment.date(), end, tzinfo=MOSCOW_TZ)
+    return None
+
+
+def get_next_session_start(moment, sessions=TRADING_SESSIONS, weekdays=TRADING_WEEKDAYS, holidays=()):
+    """
+    Начало ближайшей сессии после moment.
+    """
+    moment = moment.astimezone(MOSCOW_TZ)
+    for days in range(15):
+        date = moment.date() + timedelta(days=days)
+        if date.weekday() not in weekdays or date in holidays:
+            continue
+        for start, _ in sessions:
+            session_start = datetime.combine(date, start, tzinfo=MOSCOW_TZ)
+            if session_start > moment:
+                return session_start
+    raise ValueError("Нет торговых сессий в ближайшие две недели")
+
+
+class Job:
+    """
+    Периодическая задача планировщика.
+
+    :param func: Корутина-функция. Может вернуть паузу до следующего запуска, секунд,
+        иначе задача идёт по сетке interval без дрейфа.
+    :param interval: Период запуска, секунд.
+    :param deadline: Насколько можно опоздать со стартом, секунд. Если задача не успела
+        начаться (ждала другую задачу), этот запуск пропускается. По умолчанию -- interval.
+    :param priority: Из готовых к запуску задач первой идёт задача с большим приоритетом.
+    """
+    def __init__(self, name, func, interval, deadline=None, priority=0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.deadline = interval if deadline is None else deadline
+        self.priority = priority
+        self.next_run = 0.0
+        self.stats = {'runs': 0, 'late': 0, 'overrun': 0, 'errors': 0, 'last_duration': None}
+
+    def skip_to(self, current_time):
+        """
+        Переносит запуск на первый слот сетки после current_time. Возвращает число пропущенных слотов.
+        """
+        missed = int((current_time - self.next_run) // self.interval) + 1
+        self.next_run += missed * self.interval
+        return missed
+
+
+class Scheduler:
+    """
+    Один исполнитель для задач опроса: задачи не пересекаются, поэтому
+    не делают одновременных запросов к брокеру.
+
+    Готовые задачи запускаются по приоритету. Запуски, опоздавшие больше
+    deadline, и слоты, пропущенные из-за долгого выполнения, не догоняются,
+    а пропускаются. Вне торговых сессий MOEX задачи не запускаются,
+    после открытия сессии все задачи стартуют сразу.
+
+    Выполняющаяся задача не прерывается: отмена посреди выставления заявок
+    оставила бы позицию без стоп-заявок.
+    """
+    def __init__(self, jobs=(), sessions=TRADING_SESSIONS, weekdays=TRADING_WEEKDAYS, holidays=()):
+        self.jobs = list(jobs)
+        self.sessions = sessions
+        self.weekdays = weekdays
+        self.holidays = set(holidays)
+        self.running = False
+        self.stopped = None
+        self.market_open = False
+
+    def add(self, job):
+        self.jobs.append(job)
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def _sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self.stopped.wait(), timeout=max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, *args):
+        """
+        Выполняет задачи до stop(). args передаются в каждую задачу.
+        """
+        self.running = True
+        self.stopped = asyncio.Event()
+        try:
+            while not self.stopped.is_set():
+                moment = datetime.now(MOSCOW_TZ)
+                session_end = get_session_end(moment, self.sessions, self.weekdays, self.holidays)
+                if session_end is None:
+                    self.market_open = False
+                    next_start = get_next_session_start(moment, self.sessions, self.weekdays, self.holidays)
+                    await self._sleep(min((next_start - moment).total_seconds(), MAX_SLEEP))
+                    continue
+                if not self.market_open:
+                    self.market_open = True
+                    for job in self.jobs:
+                        job.next_run = time.monotonic()
+
+                job = self._get_due_job(time.monotonic())
+                if job is None:
+                    wait_time = min(job.next_run for job in self.jobs) - time.monotonic()
+                    await self._sleep(min(wait_time, (session_end - moment).total_seconds(), MAX_SLEEP))
+                    continue
+                await self._run_job(job, args)
+        finally:
+            self.running = False
+
+    def _get_due_job(self, current_time):
+        due = []
+        for job in self.jobs:
+            if job.next_run > current_time:
+                continue
+            if current_time - job.next_run > job.deadline:
+                missed = job.skip_to(current_time)
+                job.stats['late'] += missed
+                metrics.count('scheduler_skipped', missed, job=job.name, reason='late')
+                continue
+            due.append(job)
+        if not due:
+            return None
+        return max(due, key=lambda job: (job.priority, -job.next_run))
+
+    async def _run_job(self, job, args):
+        scheduled = job.next_run
+        start = time.monotonic()
+        metrics.observe('scheduler_lateness_seconds', start - scheduled, job=job.name)
+        delay = None
+        try:
+            delay = await job.func(*args)
+        except Exception as e:
+            print(e)
+            job.stats['errors'] += 1
+        finish = time.monotonic()
+        job.stats['runs'] += 1
+        job.stats['last_duration'] = finish - start
+        if delay is not None:
+            job.next_run = finish + delay
+            return
+        job.next_run = scheduled + job.interval
+        if job.next_run <= finish:
+            missed = job.skip_to(finish)
+            job.stats['overrun'] += missed
+            metrics.count('scheduler_skipped', missed, job=job.name, reason='overrun')
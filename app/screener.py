@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import pandas as pd
+
+
+class LiveScreener:
+    """
+    Обычный режим: запрос уходит в TradingView.
+    Стратегии собирают Query и передают его в get_scanner_data бэкенда.
+    """
+    def get_scanner_data(self, query):
+        return query.get_scanner_data()
+
+
+class RecordingScreener(LiveScreener):
+    """
+    Выполняет запросы через screener (по умолчанию LiveScreener) и сохраняет
+    каждый ответ в отдельный сжатый снимок: path/<время в мс>_<ключ запроса>.joblib.
+    """
+    def __init__(self, path, screener=None, compress=3):
+        self.path = path
+        self.screener = screener or LiveScreener()
+        self.compress = compress
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_scanner_data(self, query):
+        count, data = self.screener.get_scanner_data(query)
+        self._save(query, count, data)
+        return count, data
+
+    def _save(self, query, count, data):
+        snapshot_time = time.time()
+        key = get_query_key(query)
+        path = os.path.join(self.path, f"{int(snapshot_time * 1000):013d}_{key}.joblib")
+        snapshot = {'time': snapshot_time, 'key': key, 'query': getattr(query, 'query', None), 'count': count, 'data': data}
+        try:
+            # Пишем во временный файл, чтобы при падении не остался битый снимок
+            joblib.dump(snapshot, path + '.tmp', compress=self.compress)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            print(e)
+
+
+class ReplayScreener:
+    """
+    Воспроизводит снимки RecordingScreener без сети.
+
+    Ответы на одинаковые запросы выдаются в порядке записи. speed задаёт темп:
+    1.0 -- как при записи, 10 -- в 10 раз быстрее, None -- без ожидания.
+    Если запрос по списку тикеров (col('name').isin) не записывался, ответ
+    собирается из последних выданных снимков с нужными колонками.
+    """
+    def __init__(self, path, speed=None, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.snapshots = {}
+        for file_name in sorted(os.listdir(path)):
+            if not file_name.endswith('.joblib'):
+                continue
+            stamp, key = file_name[:-len('.joblib')].split('_', 1)
+            self.snapshots.setdefault(key, []).append((int(stamp) / 1000, os.path.join(path, file_name)))
+        self.positions = dict.fromkeys(self.snapshots, 0)
+        self.start = None
+        # Последний выданный ответ на каждый запрос, для запросов по тикерам
+        self.last_data = {}
+
+    def reset(self):
+        self.positions = dict.fromkeys(self.snapshots, 0)
+        self.start = None
+        self.last_data = {}
+
+    def get_scanner_data(self, query):
+        key = get_query_key(query)
+        snapshots = self.snapshots.get(key)
+        if not snapshots:
+            return self._get_by_names(query)
+        if self.positions[key] >= len(snapshots):
+            if not self.loop:
+                raise LookupError(f"Записанные ответы на запрос {key} закончились")
+            self.reset()
+        snapshot_time, path = snapshots[self.positions[key]]
+        self.positions[key] += 1
+        self._wait(snapshot_time)
+        snapshot = joblib.load(path)
+        self.last_data.pop(key, None)
+        self.last_data[key] = snapshot['data']
+        # Стратегии дописывают колонки в ответ, запись не должна меняться
+        return snapshot['count'], snapshot['data'].copy()
+
+    def _wait(self, snapshot_time):
+        if self.start is None:
+            self.start = (time.monotonic(), snapshot_time)
+            return
+        if not self.speed:
+            return
+        delay = self.start[0] + (snapshot_time - self.start[1]) / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _get_by_names(self, query):
+        names = _get_names_filter(query)
+        if names is None:
+            raise LookupError(f"Нет записанного ответа на запрос {get_query_key(query)}")
+        columns = ['ticker', *getattr(query, 'query', {}).get('columns', [])]
+        frames = [
+            data[data['name'].isin(names)][columns]
+            for data in reversed(self.last_data.values())
+            if set(columns) <= set(data.columns)
+        ]
+        if not frames:
+            raise LookupError(f"Нет записанного ответа на запрос {get_query_key(query)}")
+        # Более свежие снимки идут первыми
+        data = pd.concat(frames).drop_duplicates('name').reset_index(drop=True)
+        return len(data), data
+
+
+def get_query_key(query):
+    """
+    Ключ запроса: хэш тела запроса и адреса скринера.
+    """
+    params = {'query': getattr(query, 'query', None), 'url': getattr(query, 'url', None)}
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def _get_names_filter(query):
+    for condition in getattr(query, 'query', {}).get('filter', []):
+        if condition.get('left') == 'name' and condition.get('operation') == 'in_range':
+            return condition['right']
+    return None
@@ -0,0 +1,22 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def to_shared(array):
+    """
+    Копирует массив в новый блок shared memory.
+    Блок закрывает и удаляет (close, unlink) создавший его процесс.
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block
+
+
+def attach_shared(name, shape, dtype):
+    """
+    Подключается к блоку из to_shared: (блок, массив поверх него без копирования).
+    Массив валиден, пока блок не закрыт.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
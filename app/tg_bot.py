@@ -3,7 +3,6 @@ import os
 import asyncio
 from datetime import datetime
 from typing import Dict
-import time
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -25,16 +24,53 @@ from config import Config
 from data_reciever import MoneyFlowStrategy, NadarayaWatsonStrategy
 # from data_handler import JsonDBHandler
 from portfolio_manager import TinkoffOrderManager, TinkoffSandboxOrderManager
+from async_portfolio_manager import AsyncTinkoffOrderManager, AsyncTinkoffSandboxOrderManager
+from screener import RecordingScreener
+from client_pool import ClientPool, AsyncClientPool
+from metrics import metrics
+from profiler import CycleProfiler
+from scheduler import Job, Scheduler
 
 bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
 # strategy = LorentzianClassificationStrategy(query_limit=10)
-stop_trading_flag = False
-stocks_broker = TinkoffOrderManager(capital=Config.CAPITAL, db_filepath="TickersToFigiRus.json",api_key=Config.TINKOFF_REAL_TOKEN)
+stocks_broker = TinkoffOrderManager(capital=Config.CAPITAL, db_filepath="TickersToFigiRus.json",api_key=Config.TINKOFF_REAL_TOKEN,
+                                    client_pool=ClientPool(Config.TINKOFF_REAL_TOKEN, metrics=metrics))
 # stocks_broker = TinkoffSandboxOrderManager(capital=Config.CAPITAL, db_filepath="TickersToFigiRus.json",api_key=Config.TINKOFF_REAL_TOKEN)
+async_broker = AsyncTinkoffOrderManager(stocks_broker, client_pool=AsyncClientPool(Config.TINKOFF_REAL_TOKEN, metrics=metrics))
+# async_broker = AsyncTinkoffSandboxOrderManager(stocks_broker)
 # strategy = MoneyFlowStrategy(query_limit=100)
-strategy = NadarayaWatsonStrategy(tinkObj=stocks_broker, query_limit=100)
+screener = RecordingScreener(Config.SCREENER_RECORD_PATH) if Config.SCREENER_RECORD_PATH else None
+strategy = NadarayaWatsonStrategy(tinkObj=stocks_broker, query_limit=100, screener=screener)
 stocks_processed = {}
 stocks_bought = {}
+# Стратегия синхронная, её вызовы выполняются в отдельном потоке, не блокируя event loop.
+# Скан и проверка продаж меняют состояние стратегии (данные скана, потоковые сигналы),
+# поэтому идут по одному; запросы данных по тикерам только читают скринер и выполняются сразу
+strategy_lock = asyncio.Lock()
+profiler = CycleProfiler(Config.PROFILES_PATH)
+
+async def run_strategy(func, *args):
+    async with strategy_lock:
+        return await run_lookup(func, *args)
+
+async def run_lookup(func, *args):
+    return await asyncio.to_thread(profiler.run, func, *args)
+
+def export_metrics():
+    if Config.METRICS_PATH:
+        metrics.write(Config.METRICS_PATH)
+
+async def end_cycle(bot):
+    export_metrics()
+    result = profiler.end_cycle()
+    if result is None:
+        return
+    path, chat_id, top = result
+    chat_id = chat_id or Config.TEST_CHAT_ID
+    await bot.send_message(chat_id=chat_id, text=f"```\n{top}\n```", parse_mode=ParseMode.MARKDOWN)
+    if path:
+        with open(path, 'rb') as file:
+            await bot.send_document(chat_id=chat_id, document=file, filename=os.path.basename(path))
 
 def get_pretty_from_stock(stock_info: Dict) -> str:
     name = stock_info.get('name')
@@ -72,19 +108,20 @@ def get_recomendation_str(percantage):
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = await update.message.reply_text('Инициализация...')
-    asyncio.create_task(poll_new_actives(context))
+    if not scheduler.running:
+        asyncio.create_task(scheduler.run(context.bot))
 
 async def list_portfolio_stocks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    start = time.time()
     global stocks_bought
-    stocks_bought = stocks_broker.get_portfolio_stocks()
-    print(f"Get portfolio: {time.time() - start}")
+    with metrics.span('portfolio'):
+        stocks_bought = await async_broker.get_portfolio_stocks()
     if not stocks_bought:
         await update.message.reply_text("У вас нет активов в портфеле.")
         return 
 
     msg_text = "Ваши активы:\n\n"
     keyboard = []
+    stocks_info = await run_lookup(strategy.get_data_stocks, [stock['ticker'] for stock in stocks_bought if stock['ticker']])
     
     for index, stock in enumerate(stocks_bought):
         if stock['ticker'] == None:
@@ -99,7 +136,7 @@ async def list_portfolio_stocks_command(update: Update, context: ContextTypes.DE
         if stock['ticker'] == "Rub":
             continue
         
-        stock_info = strategy.get_data_stock(stock['ticker'])
+        stock_info = stocks_info.get(stock['ticker'])
         if stock_info:
             stock_info_str += get_msg_from_stock(stock_info)
         msg_text += stock_info_str + "------------------------\n\n"
@@ -118,7 +155,7 @@ async def list_portfolio_stocks_command(update: Update, context: ContextTypes.DE
     await update.message.reply_text(text=msg_text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN,)
 
 async def get_balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(text=f"Баланс: {stocks_broker.get_balance()}")
+    await update.message.reply_text(text=f"Баланс: {async_broker.get_balance()}")
 async def reset_processed_stocks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global stocks_processed
     stocks_processed = {}
@@ -127,77 +164,116 @@ async def reset_processed_stocks_command(update: Update, context: ContextTypes.D
 
 async def get_potential_actives_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg_text = ""
-    for stock in strategy.get_data():
+    for stock in await run_strategy(strategy.get_data):
         msg_text += get_msg_from_stock(stock)
     if not msg_text:
         msg_text = "Нет подходящих активов для покупки."
     await update.message.reply_text(text=msg_text, parse_mode=ParseMode.MARKDOWN) 
 
 async def stop_trading_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global stop_trading_flag
-    stop_trading_flag = True
+    scheduler.stop()
     await update.message.reply_text(text="Торговля остоновлена.", parse_mode=ParseMode.MARKDOWN) 
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        n_cycles = int(context.args[0]) if context.args else 1
+    except ValueError:
+        await update.message.reply_text("Использование: /profile N -- профилировать следующие N циклов.")
+        return
+    profiler.start(max(n_cycles, 1), chat_id=update.effective_chat.id)
+    await update.message.reply_text(f"Профилирую следующие {max(n_cycles, 1)} циклов.")
+
 async def poll_bought_actives(bot):
+    with metrics.cycle('poll_bought_actives'), profiler.cycle():
+        await check_bought_actives(bot)
+    await end_cycle(bot)
+
+async def check_bought_actives(bot):
     chat_id = Config.TEST_CHAT_ID
-    while True:
-        if stop_trading_flag:
-            return
-        await asyncio.sleep(30)
-        
-        global stocks_bought
-        stocks_bought = stocks_broker.get_portfolio_stocks()
-        
-        if not stocks_bought:
+    global stocks_bought
+    with metrics.span('portfolio'):
+        stocks_bought = await async_broker.get_portfolio_stocks()
+    
+    if not stocks_bought:
+        return
+    
+    # Один запрос скринера на все позиции, check_sell возьмёт данные из кэша
+    await run_lookup(strategy.get_data_stocks, [stock['ticker'] for stock in stocks_bought if stock['ticker']])
+    for index, stock in enumerate(stocks_bought):
+        if stock['ticker'] is None:
             continue
-        
-        for index, stock in enumerate(stocks_bought):
-            if stock['ticker'] is None:
-                continue
-            # print(stock, strategy.check_sell(stock['ticker']))
-            if strategy.check_sell(stock['ticker']):
-                order_worth = stocks_broker.sell_stock_now(stock['ticker'], stocks_bought[index]['quantity'])
+        # print(stock, strategy.check_sell(stock['ticker']))
+        if await run_strategy(strategy.check_sell, stock['ticker']):
+            with metrics.span('orders'):
+                order_worth = await async_broker.sell_stock_now(stock['ticker'], stocks_bought[index]['quantity'])
+            with metrics.span('telegram'):
                 await bot.send_message(chat_id=chat_id, text=f"Продана {stock['ticker']} на {order_worth} с прибылью *{stock['profit_current']}*", parse_mode=ParseMode.MARKDOWN)
 
 async def poll_new_actives(bot):
+    with metrics.cycle('poll_new_actives'), profiler.cycle():
+        delay = await check_new_actives(bot)
+    await end_cycle(bot)
+    return delay
+
+async def check_new_actives(bot):
+    """
+    Один цикл поиска новых активов. Если портфель заполнен, возвращает увеличенную паузу до следующего цикла, секунд.
+    """
     chat_id = Config.TEST_CHAT_ID
-    while True:
-        if stop_trading_flag:
-            return
-        
-        data = strategy.get_data()
+    data = await run_strategy(strategy.get_data)
+    
+    global stocks_bought
+    with metrics.span('portfolio'):
+        stocks_bought = await async_broker.get_portfolio_stocks()
+    if data and len(stocks_bought) >= 12:
+        return 120
+
+    # Сначала собираем заявки, затем покупаем их с одним запросом котировок
+    amounts = {}
+    balance = async_broker.get_balance()
+    for stock_info in data:
+        if len(stocks_bought) + len(amounts) >= 12:
+            break
+        stock_info['ticker'] = stock_info['ticker'].split(":")[-1]
+        ticker = stock_info['ticker']
+
+        keyboard = [
+        [InlineKeyboardButton("Купить", callback_data=f"ask_buy_stock_{ticker}")],
+        [InlineKeyboardButton("Отмена", callback_data="cancel_button")],]   
         
-        for stock_info in data:
-            global stocks_bought
-            stocks_bought = stocks_broker.get_portfolio_stocks()
-            if len(stocks_bought) >= 12:
-                await asyncio.sleep(120)
-                continue
-            stock_info['ticker'] = stock_info['ticker'].split(":")[-1]
-            ticker = stock_info['ticker']
-
-            keyboard = [
-            [InlineKeyboardButton("Купить", callback_data=f"ask_buy_stock_{ticker}")],
-            [InlineKeyboardButton("Отмена", callback_data="cancel_button")],]   
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            msg_text = f"📊 *Сигнал на покупку акции*\n\n" + get_msg_from_stock(stock_info)
-
-            if stock_info['score'] >= strategy.get_border_score():
-                if not is_enough_in_portfolio(ticker):
-                    amount = min(stocks_broker.get_balance(), stocks_broker.capital//5)
-                    # amount = min(stocks_broker.get_balance(), 2000)
-                    print(f"Buying {stock_info['ticker']} {amount}")
-                    order_worth = stocks_broker.buy_stock_for_amount(stock_info['ticker'], amount)
-                    if type(order_worth) == str:
-                        pass
-                    elif order_worth > 0:
-                        await bot.send_message(chat_id=chat_id, text=f"Куплена {stock_info['ticker']} на {order_worth}", parse_mode=ParseMode.MARKDOWN)
-                else:
-                    # await bot.send_message(chat_id=chat_id, text=msg_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
-                    pass
-                        
-        await asyncio.sleep(30)
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        msg_text = f"📊 *Сигнал на покупку акции*\n\n" + get_msg_from_stock(stock_info)
+
+        if stock_info['score'] >= strategy.get_border_score():
+            if not is_enough_in_portfolio(ticker) and ticker not in amounts:
+                amount = min(balance, async_broker.capital//5)
+                # amount = min(stocks_broker.get_balance(), 2000)
+                print(f"Buying {stock_info['ticker']} {amount}")
+                amounts[ticker] = amount
+                balance -= amount
+            else:
+                # await bot.send_message(chat_id=chat_id, text=msg_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+                pass
+
+    with metrics.span('orders'):
+        orders = await async_broker.buy_stocks_for_amount(amounts)
+    for ticker, order_worth in orders.items():
+        if type(order_worth) == str:
+            pass
+        elif order_worth > 0:
+            with metrics.span('telegram'):
+                await bot.send_message(chat_id=chat_id, text=f"Куплена {ticker} на {order_worth}", parse_mode=ParseMode.MARKDOWN)
+
+async def refresh_instruments(bot):
+    # Кэш инструментов проверяется на устаревание только здесь, поиск по нему не ходит в API
+    await asyncio.to_thread(stocks_broker.refresh_instruments, False)
+
+# Проверка продаж и поиск покупок выполняются по очереди, продажи -- в первую очередь
+scheduler = Scheduler([
+    Job('poll_bought_actives', poll_bought_actives, interval=30, deadline=15, priority=1),
+    Job('poll_new_actives', poll_new_actives, interval=30, deadline=15),
+    Job('refresh_instruments', refresh_instruments, interval=3600, priority=-1),
+])
 
 def is_enough_in_portfolio(ticker):
     curr = 0
@@ -213,9 +289,9 @@ async def ask_buy_stock_button(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     ticker = query.data.split("_")[-1]
-    for stock_info in strategy.get_data():
+    for stock_info in await run_strategy(strategy.get_data):
         if ticker == stock_info['name']:
-            ticker_info = stocks_broker.get_info_by_ticker(ticker)
+            ticker_info = await async_broker.get_info_by_ticker(ticker)
             if not ticker_info:
                 await query.edit_message_text(text=f"Нет информации об инструменте *{ticker}*", parse_mode=ParseMode.MARKDOWN)
                 return
@@ -242,7 +318,7 @@ async def buy_stock_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ticker = context.user_data["ticker"]
     atr = stocks_processed[ticker]['ATR']
     # money_spent = stocks_broker.buy_stock_now(ticker, quantity, atr)
-    money_spent = stocks_broker.buy_stock_for_amount(ticker, 300)
+    money_spent = await async_broker.buy_stock_for_amount(ticker, 300)
     msg_text = (
         "*КУПЛЕНО*\n"
         f"Тикер: *{ticker}*\n"
@@ -296,7 +372,7 @@ async def sell_stock_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     stock_index = int(query.data.split("_")[-1])
-    money_spent = stocks_broker.sell_stock_now(stocks_bought[stock_index]['ticker'], stocks_bought[stock_index]['quantity'])
+    money_spent = await async_broker.sell_stock_now(stocks_bought[stock_index]['ticker'], stocks_bought[stock_index]['quantity'])
 
     if money_spent:
         await query.edit_message_text(f"Продажа *{stocks_bought[stock_index]['ticker']}* на сумму *{money_spent}* (руб) успешна совершена.",  parse_mode=ParseMode.MARKDOWN)
@@ -317,16 +393,22 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await buy_stock_button(update, context)
             return
     print("Handling")
-    stock_data = strategy.get_data_stock(update.message.text.upper())
+    stock_data = await run_lookup(strategy.get_data_stock, update.message.text.upper())
     if stock_data:
-        await update.message.reply_text(text=get_msg_from_stock(stock_data[0]), parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(text=get_msg_from_stock(stock_data), parse_mode=ParseMode.MARKDOWN)
     else:
         await update.message.reply_text(text=f"Не найден тикер {update.message.text}", parse_mode=ParseMode.MARKDOWN)
 
     
 
+async def shutdown(application: Application):
+    scheduler.stop()
+    await async_broker.close()
+    # Дожидается процессов обучения моделей, чтобы они не остались висеть
+    await asyncio.to_thread(strategy.predictor.close)
+
 def main():
-    application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+    application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).post_shutdown(shutdown).build()
     
     
     application.add_handler(CommandHandler('start', start_command))
@@ -335,6 +417,7 @@ def main():
     application.add_handler(CommandHandler('info', get_potential_actives_command))
     application.add_handler(CommandHandler('stop', stop_trading_command))
     application.add_handler(CommandHandler('balance', get_balance_command))
+    application.add_handler(CommandHandler('profile', profile_command))
 
 
     application.add_handler(CallbackQueryHandler(ask_sell_stock_button, pattern='^ask_sell_stock_'))
@@ -347,12 +430,12 @@ def main():
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     global stocks_bought
     stocks_bought = stocks_broker.get_portfolio_stocks()
-
+    if Config.METRICS_PORT:
+        metrics.serve(int(Config.METRICS_PORT))
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.create_task(poll_bought_actives(application.bot))
-    loop.create_task(poll_new_actives(application.bot))
+    loop.create_task(scheduler.run(application.bot))
     application.run_polling()
 
 if __name__ == "__main__":
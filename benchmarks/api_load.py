@@ -0,0 +1,113 @@
+"""
+Нагрузочный прогон менеджеров заявок на FakeTinkoffAPI, без сети и токена.
+
+Для каждой задержки API меряется пропускная способность и хвосты времени
+операций, которые делают циклы бота: свечи по кандидатам (синхронно и
+через asyncio.gather), котировки и заявки.
+
+    python benchmarks/api_load.py --latency 0.02 0.1 --jitter 0.02 --tickers 50
+    python benchmarks/api_load.py --error-rate 0.05 --rate-limit market_data=600
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'app'))
+
+from async_portfolio_manager import AsyncTinkoffOrderManager
+from client_pool import AsyncClientPool, ClientPool
+from fake_api import FakeTinkoffAPI
+from portfolio_manager import TinkoffOrderManager
+
+
+def run_sync(manager, tickers, days):
+    timings = []
+    start = time.perf_counter()
+    for ticker in tickers:
+        call_start = time.perf_counter()
+        manager.get_historical_data(ticker, days)
+        timings.append(time.perf_counter() - call_start)
+    return time.perf_counter() - start, timings
+
+
+async def run_async(manager, tickers, days):
+    async def timed(ticker):
+        call_start = time.perf_counter()
+        await manager.get_historical_data(ticker, days)
+        return time.perf_counter() - call_start
+
+    start = time.perf_counter()
+    timings = await asyncio.gather(*(timed(ticker) for ticker in tickers))
+    return time.perf_counter() - start, list(timings)
+
+
+def run_orders(manager, tickers, amount):
+    timings = []
+    start = time.perf_counter()
+    for ticker in tickers:
+        call_start = time.perf_counter()
+        manager.buy_stock_for_amount(ticker, amount)
+        timings.append(time.perf_counter() - call_start)
+    return time.perf_counter() - start, timings
+
+
+def report(name, total, timings):
+    timings = np.array(timings) * 1e3
+    print(f"{name:<32}{len(timings) / total:>10.1f}{np.percentile(timings, 50):>10.1f}"
+          f"{np.percentile(timings, 95):>10.1f}{np.percentile(timings, 99):>10.1f}{timings.max():>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.0, 0.02, 0.1], help="Задержка вызова API, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Средняя случайная добавка к задержке, с")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', nargs='*', default=[], help="Лимиты вида сервис=запросов_в_минуту")
+    parser.add_argument('--tickers', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rate_limits = {service: int(rate) for service, rate in (item.split('=') for item in args.rate_limit)}
+    print(f"{'case':<32}{'ops/s':>10}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}{'max, ms':>10}")
+    for latency in args.latency:
+        print(f"latency {latency * 1e3:.0f} ms, jitter {args.jitter * 1e3:.0f} ms, errors {args.error_rate:.0%}")
+        api = FakeTinkoffAPI.synthetic(args.tickers, args.bars, seed=args.seed, latency=latency, jitter=args.jitter,
+                                       error_rate=args.error_rate, rate_limits=rate_limits)
+        temp_dir = tempfile.mkdtemp(prefix='api_load_')
+        try:
+            # Менеджеры печатают ошибки API, в отчёт это не выводим
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager = TinkoffOrderManager(
+                    os.path.join(temp_dir, 'db.json'), api_key=None, candles_path=os.path.join(temp_dir, 'candles'),
+                    client_pool=ClientPool(None, services_factory=api.get_services),
+                )
+                tickers = list(manager.db.get_data().keys() - {'last_update_time'})
+                cold = run_sync(manager, tickers, args.days)
+                warm = run_sync(manager, tickers, args.days)
+                async_manager = AsyncTinkoffOrderManager(manager, client_pool=AsyncClientPool(None, services_factory=api.get_async_services))
+                api.step()
+                gathered = asyncio.run(run_async(async_manager, tickers, args.days))
+                orders = run_orders(manager, tickers[:12], manager.capital // 20)
+            report('candles, sync, cold', *cold)
+            report('candles, sync, warm', *warm)
+            report('candles, asyncio.gather, +1 bar', *gathered)
+            report('buy_stock_for_amount', *orders)
+            print(f"  api: {api.stats}")
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Сравнение RFPredictor и RLSPredictor на синтетических свечах.
+
+Прогон идёт бар за баром, как в боте: на каждом шаге в предиктор
+передаётся история до текущего бара включительно. Печатается задержка
+вызова (среднее, p50, p99) и MAE прогноза цены закрытия последнего бара.
+
+    python benchmarks/predictors.py --bars 600 --steps 200 --tickers 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from predictor import RFPredictor, RLSPredictor
+from synthetic import make_candles
+
+
+def run(predictor, histories, warmup, steps):
+    latencies = []
+    errors = []
+    for ticker, candles in histories.items():
+        predictor.get_prediction_next_close(ticker, candles[:warmup])
+        for end in range(warmup + 1, warmup + steps + 1):
+            history = candles[:end]
+            start = time.perf_counter()
+            prediction = predictor.get_prediction_next_close(ticker, history)
+            latencies.append(time.perf_counter() - start)
+            errors.append(abs(prediction - history[-1]['close']))
+    latencies = np.array(latencies) * 1e3
+    return {
+        'mean_ms': latencies.mean(),
+        'p50_ms': np.percentile(latencies, 50),
+        'p99_ms': np.percentile(latencies, 99),
+        'mae': np.mean(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bars', type=int, default=600, help='Баров на разогрев')
+    parser.add_argument('--steps', type=int, default=200, help='Шагов прогона на тикер')
+    parser.add_argument('--tickers', type=int, default=3)
+    parser.add_argument('--window', type=int, default=23)
+    args = parser.parse_args()
+
+    histories = {f'T{i}': make_candles(args.bars + args.steps + 1, seed=i) for i in range(args.tickers)}
+    predictors = {
+        'RFPredictor': RFPredictor(args.window, max_workers=1),
+        'RLSPredictor': RLSPredictor(args.window),
+    }
+    print(f"{'predictor':<14}{'mean, ms':>10}{'p50, ms':>10}{'p99, ms':>10}{'MAE':>10}")
+    for name, predictor in predictors.items():
+        result = run(predictor, histories, args.bars, args.steps)
+        print(f"{name:<14}{result['mean_ms']:>10.3f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['mae']:>10.4f}")
+        predictor.close()
+
+
+if __name__ == '__main__':
+    main()
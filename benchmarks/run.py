@@ -0,0 +1,354 @@
+"""
+Бенчмарки горячих путей бота на синтетических данных, без сети.
+
+Для каждого случая печатается время вызова (среднее, минимум, p95) и пик
+памяти (tracemalloc, отдельный прогон). Результаты сохраняются в JSON;
+с --compare сравниваются с прошлым прогоном, замедление больше --threshold
+считается регрессией и даёт код выхода 1. Цикл poll_new_actives дополнительно
+проверяется на укладывание в 30-секундный интервал опроса.
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --compare bench.json --filter signals
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'app'))
+
+import data_reciever
+from data_handler import JsonDBHandler
+from data_reciever import (
+    MoneyFlowStrategy, NadarayaWatsonStrategy, NadarayaWatsonSignal,
+    generate_signals, generate_signals_batch, kernel_regression,
+)
+from predictor import RFPredictor, RLSPredictor
+from synthetic import StandInQuery, make_candles, make_close_panel, make_screener_frame, make_tickers
+
+# Интервал опроса в poll_new_actives, секунд
+POLL_BUDGET = 30
+
+CASES = {}
+
+
+def case(name):
+    """
+    Регистрирует случай. Функция готовит данные и возвращает вызываемый объект,
+    время которого измеряется.
+    """
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+class StandInBroker:
+    """
+    Брокер без сети: свечи синтетические, заявки исполняются по последней цене.
+    latency -- искусственная задержка каждого обращения к API, секунд.
+    """
+    def __init__(self, tickers, n_bars=300, capital=50000, latency=0.0):
+        self.candles = {ticker: make_candles(n_bars, seed=i) for i, ticker in enumerate(tickers)}
+        self.capital = capital
+        self.balance = capital
+        self.latency = latency
+        self.portfolio_stocks = []
+
+    def _call_api(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_historical_data(self, ticker, days):
+        self._call_api()
+        return self.candles.get(ticker, [])
+
+    def get_balance(self):
+        return self.balance
+
+    def get_portfolio_stocks(self):
+        self._call_api()
+        return [
+            {**stock, 'worth_current': stock['quantity'] * self.candles[stock['ticker']][-1]['close']}
+            for stock in self.portfolio_stocks
+        ]
+
+    def buy_stocks_for_amount(self, amounts):
+        self._call_api()
+        orders = {}
+        for ticker, amount in amounts.items():
+            price = self.candles[ticker][-1]['close']
+            quantity = int(amount // price)
+            self.portfolio_stocks.append({'ticker': ticker, 'quantity': quantity, 'origin_price': price})
+            self.balance -= quantity * price
+            orders[ticker] = quantity * price
+        return orders
+
+
+def _use_screener(tickers):
+    StandInQuery.frame = make_screener_frame(tickers)
+    data_reciever.Query = StandInQuery
+
+
+@case('signals.generate_signals[1000 bars]')
+def _():
+    close = [bar['close'] for bar in make_candles(1000)]
+    return lambda: generate_signals(close, h=23, r=20, x_0=25, smooth_colors=True, lag=2)
+
+
+@case('signals.kernel_regression[reference, 1000 windows]')
+def _():
+    close = np.array([bar['close'] for bar in make_candles(1022)])
+    windows = np.lib.stride_tricks.sliding_window_view(close, 23)
+    return lambda: [kernel_regression(window, 23, 25, 20) for window in windows]
+
+
+@case('signals.generate_signals_batch[100 tickers x 1000 bars]')
+def _():
+    panel = make_close_panel(100, 1000)
+    return lambda: generate_signals_batch(panel, h=23, r=20, x_0=25, smooth_colors=True, lag=2)
+
+
+@case('signals.streaming_update[1 bar]')
+def _():
+    candles = make_candles(1000)
+    signal = NadarayaWatsonSignal(h=23, r=20, x_0=25, smooth_colors=True, lag=2)
+    signal.update_bars(candles[:-1])
+    return lambda: signal.update_bars(candles)
+
+
+@case('predictor.rf_train[300 bars]')
+def _():
+    candles = make_candles(300)
+    def run():
+        RFPredictor(23, max_workers=1).get_prediction_next_close('T0000', candles)
+    return run
+
+
+@case('predictor.rf_cached[300 bars]')
+def _():
+    candles = make_candles(300)
+    predictor = RFPredictor(23, max_workers=1)
+    predictor.get_prediction_next_close('T0000', candles)
+    return lambda: predictor.get_prediction_next_close('T0000', candles)
+
+
+@case('predictor.rls_update[300 bars, +1 bar]')
+def _():
+    candles = make_candles(2300)
+    predictor = RLSPredictor(23)
+    predictor.get_prediction_next_close('T0000', candles[:300])
+    state = {'end': 300}
+    def run():
+        # Каждый вызов приносит один новый бар
+        state['end'] = min(state['end'] + 1, len(candles))
+        predictor.get_prediction_next_close('T0000', candles[:state['end']])
+    return run
+
+
+@case('moneyflow.get_data[1000 rows]')
+def _():
+    _use_screener(make_tickers(1000))
+    strategy = MoneyFlowStrategy(query_limit=1000)
+    return strategy.get_data
+
+
+@case('json_db.load[5000 tickers]')
+def _():
+    path = _make_db(5000)
+    return lambda: JsonDBHandler(path)
+
+
+@case('json_db.save[5000 tickers]')
+def _():
+    db = JsonDBHandler(_make_db(5000))
+    return db.save_data_to_file
+
+
+@case('json_db.lookup[5000 tickers, 1000 lookups]')
+def _():
+    db = JsonDBHandler(_make_db(5000))
+    figis = [f"FIGI{i:08d}" for i in range(0, 5000, 5)]
+    def run():
+        for figi in figis:
+            db.get_ticker_by_info(figi)
+            db.get_info_by_ticker(figi)
+    return run
+
+
+@case('cycle.poll_new_actives[100 candidates, warm]')
+def _():
+    tickers = make_tickers(100)
+    _use_screener(tickers)
+    broker = StandInBroker(tickers)
+    strategy = NadarayaWatsonStrategy(tinkObj=broker, query_limit=100)
+    strategy.predictor = RFPredictor(strategy.bandwith)
+    # Первый цикл обучает модели, измеряется установившийся режим
+    strategy.get_data()
+    return lambda: _poll_new_actives(strategy, broker)
+
+
+@case('cycle.poll_new_actives[100 candidates, rls]')
+def _():
+    tickers = make_tickers(100)
+    _use_screener(tickers)
+    broker = StandInBroker(tickers)
+    strategy = NadarayaWatsonStrategy(tinkObj=broker, query_limit=100, predictor='rls')
+    return lambda: _poll_new_actives(strategy, broker)
+
+
+@case('cycle.poll_bought_actives[12 positions]')
+def _():
+    tickers = make_tickers(12)
+    _use_screener(tickers)
+    broker = StandInBroker(tickers)
+    broker.buy_stocks_for_amount({ticker: 1000 for ticker in tickers})
+    strategy = NadarayaWatsonStrategy(tinkObj=broker, query_limit=100)
+    def run():
+        strategy.stocks_cache.clear()
+        stocks_bought = broker.get_portfolio_stocks()
+        strategy.get_data_stocks([stock['ticker'] for stock in stocks_bought])
+        return [strategy.check_sell(stock['ticker']) for stock in stocks_bought]
+    return run
+
+
+def _poll_new_actives(strategy, broker):
+    """
+    Один цикл poll_new_actives из tg_bot без Telegram и без ожидания.
+    """
+    data = strategy.get_data()
+    stocks_bought = broker.get_portfolio_stocks()
+    amounts = {}
+    balance = broker.get_balance()
+    for stock_info in data:
+        if len(stocks_bought) + len(amounts) >= 12:
+            break
+        ticker = stock_info['ticker'].split(":")[-1]
+        if stock_info['score'] >= strategy.get_border_score() and ticker not in amounts:
+            amount = min(balance, broker.capital // 5)
+            amounts[ticker] = amount
+            balance -= amount
+    broker.portfolio_stocks = []
+    broker.balance = broker.capital
+    return broker.buy_stocks_for_amount(amounts)
+
+
+_temp_dir = None
+
+def _make_db(n_tickers):
+    global _temp_dir
+    if _temp_dir is None:
+        _temp_dir = tempfile.mkdtemp(prefix='bench_')
+    path = os.path.join(_temp_dir, f"db_{n_tickers}.json")
+    with open(path, 'w') as file:
+        json.dump({f"T{i:04d}": f"FIGI{i:08d}" for i in range(n_tickers)}, file, indent=4)
+    return path
+
+
+def measure(setup, repeat):
+    # Стратегии печатают ответы скринера, в отчёт это не выводим
+    with contextlib.redirect_stdout(io.StringIO()):
+        func = setup()
+        func()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    timings = np.array(timings) * 1e3
+    return {
+        'repeat': repeat,
+        'mean_ms': float(timings.mean()),
+        'min_ms': float(timings.min()),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'peak_kib': peak / 1024,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'case':<58}{'before, ms':>12}{'after, ms':>12}{'ratio':>8}")
+    for name, result in results['cases'].items():
+        before = baseline.get('cases', {}).get(name)
+        if not before:
+            continue
+        ratio = result['min_ms'] / before['min_ms'] if before['min_ms'] else float('inf')
+        flag = '  <-- regression' if ratio > 1 + threshold else ''
+        print(f"{name:<58}{before['min_ms']:>12.3f}{result['min_ms']:>12.3f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="Куда сохранить результаты (JSON)")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Допустимое замедление, доля")
+    parser.add_argument('--filter', default='', help="Запускать только случаи, содержащие подстроку")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {
+        'commit': get_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'cases': {},
+    }
+    failed = []
+    try:
+        print(f"{'case':<58}{'mean, ms':>12}{'min, ms':>12}{'p95, ms':>12}{'peak, KiB':>12}")
+        for name, setup in CASES.items():
+            if args.filter not in name:
+                continue
+            result = measure(setup, args.repeat)
+            results['cases'][name] = result
+            print(f"{name:<58}{result['mean_ms']:>12.3f}{result['min_ms']:>12.3f}{result['p95_ms']:>12.3f}{result['peak_kib']:>12.1f}")
+            if name.startswith('cycle.poll_new_actives') and result['p95_ms'] > POLL_BUDGET * 1000:
+                print(f"  <-- дольше интервала опроса ({POLL_BUDGET} с)")
+                failed.append(name)
+    finally:
+        if _temp_dir:
+            shutil.rmtree(_temp_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    if args.compare:
+        with open(args.compare) as file:
+            failed += compare(results, json.load(file), args.threshold)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Генераторы синтетических данных для бенчмарков: свечи, панели цен,
+ответы скринера. Все генераторы детерминированы при заданном seed.
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+
+def make_candles(n_bars, seed=0, start=datetime(2024, 1, 1, 10, tzinfo=timezone.utc), interval=timedelta(minutes=2)):
+    """
+    Свечи в формате get_historical_data: список словарей time/open/high/low/close/volume.
+    Цена -- геометрическое случайное блуждание около 100.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, n_bars)) * close
+    volume = rng.integers(1000, 10000, n_bars)
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    return [
+        {
+            'time': start + interval * i,
+            'open': open_[i],
+            'high': high[i],
+            'low': low[i],
+            'close': close[i],
+            'volume': int(volume[i]),
+        }
+        for i in range(n_bars)
+    ]
+
+
+def make_close_panel(n_tickers, n_bars, seed=0):
+    """
+    Матрица цен закрытия (тикеры x бары).
+    """
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.002, (n_tickers, n_bars)), axis=1))
+
+
+def make_tickers(n_tickers):
+    return [f"T{i:04d}" for i in range(n_tickers)]
+
+
+def make_screener_frame(tickers, seed=0):
+    """
+    Ответ скринера со всеми колонками, которые запрашивают стратегии.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(tickers)
+    close = 100 * np.exp(rng.normal(0, 0.5, n))
+    average_volume = rng.integers(20000, 500000, n).astype(float)
+    return pd.DataFrame({
+        'ticker': [f"MOEX:{ticker}" for ticker in tickers],
+        'name': tickers,
+        'close': close,
+        'average_volume_30d_calc|30': average_volume,
+        'average_volume_10d_calc|30': average_volume * rng.uniform(0.8, 1.2, n),
+        'relative_volume_10d_calc|30': rng.uniform(0, 5, n),
+        'volume|30': average_volume * rng.uniform(0.2, 3, n),
+        'RSI|30': rng.uniform(10, 90, n),
+        'MACD.macd|30': rng.normal(0, 1, n),
+        'MACD.signal|30': rng.normal(0, 1, n),
+        'VWAP|30': close * rng.uniform(0.97, 1.03, n),
+        'ChaikinMoneyFlow|30': rng.uniform(-0.5, 0.5, n),
+        'ADX|30': rng.uniform(5, 60, n),
+        'MoneyFlow|30': rng.uniform(0, 100, n),
+        'relative_volume_10d_calc|15': rng.uniform(0, 5, n),
+        'volume|15': rng.integers(10000, 500000, n).astype(float),
+        'MACD.macd|15': rng.normal(0, 1, n),
+        'MACD.signal|15': rng.normal(0, 1, n),
+        'MoneyFlow|15': rng.uniform(0, 100, n),
+        'ATR': close * rng.uniform(0.005, 0.03, n),
+    })
+
+
+class StandInQuery:
+    """
+    Замена tradingview_screener.Query: тот же цепочечный интерфейс,
+    ответ -- из заранее сгенерированного фрейма. Фильтр по name.isin учитывается,
+    остальные условия игнорируются.
+    """
+    frame = None
+
+    def __init__(self):
+        self.columns = None
+        self.filters = []
+        self.row_limit = 50
+
+    def select(self, *columns):
+        self.columns = list(columns)
+        return self
+
+    def where(self, *filters):
+        self.filters = list(filters)
+        return self
+
+    def limit(self, row_limit):
+        self.row_limit = row_limit
+        return self
+
+    def set_markets(self, *markets):
+        return self
+
+    def get_scanner_data(self):
+        data = self.frame
+        for condition in self.filters:
+            if isinstance(condition, dict) and condition.get('left') == 'name' and condition.get('operation') == 'in_range':
+                data = data[data['name'].isin(condition['right'])]
+        data = data.head(self.row_limit)
+        columns = ['ticker'] + [column for column in (self.columns or data.columns) if column != 'ticker']
+        return len(data), data[columns].reset_index(drop=True)
@@ -11,3 +11,11 @@ class Config:
     CAPITAL = 50000
     TEST_CHAT_ID = 6166420250
     DB_FILE_PATH = "data.json"
+    CANDLES_PATH = "candles"
+    MODELS_PATH = "models"
+    # Каталог для записи ответов скринера (RecordingScreener), пусто -- не записывать
+    SCREENER_RECORD_PATH = os.getenv('SCREENER_RECORD_PATH')
+    # Метрики циклов: файл (.json -- JSON, иначе формат Prometheus) и порт HTTP-эндпоинта /metrics
+    METRICS_PATH = os.getenv('METRICS_PATH')
+    METRICS_PORT = os.getenv('METRICS_PORT')
+    PROFILES_PATH = "profiles"
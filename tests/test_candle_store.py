@@ -0,0 +1,223 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from candle_store import CandleStore
+
+FIGI = 'FIGI'
+INTERVAL = 1
+
+
+def make_columns(times, close=None):
+    times = np.asarray(times, dtype=np.int64)
+    close = np.asarray(times if close is None else close, dtype=np.float64)
+    return {
+        'time': times,
+        'open': close,
+        'high': close + 1,
+        'low': close - 1,
+        'close': close,
+        'volume': np.ones(len(times), dtype=np.int64),
+    }
+
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+class FakeFetch:
+    """
+    API свечей: бары с шагом 60 с от start до end, запросы запоминаются.
+    """
+    def __init__(self, start, end, fail=False):
+        self.times = np.arange(start, end + 1, 60)
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, from_time, to_time=None):
+        self.calls.append((int(from_time.timestamp()), None if to_time is None else int(to_time.timestamp())))
+        if self.fail:
+            return None
+        selected = self.times[self.times >= from_time.timestamp()]
+        if to_time is not None:
+            selected = selected[selected < to_time.timestamp()]
+        return make_columns(selected)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CandleStore(str(tmp_path))
+
+
+def test_write_replaces_tail(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 160, 220]))
+    store.write(FIGI, INTERVAL, make_columns([220, 280], close=[5, 6]))
+
+    data = store.read(FIGI, INTERVAL)
+
+    assert data['time'].tolist() == [100, 160, 220, 280]
+    assert data['close'].tolist() == [100, 160, 5, 6]
+    assert store.get_last_time(FIGI, INTERVAL) == 280
+
+
+def test_write_before_stored_bars_merges(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 220, 340, 460]))
+    store.write(FIGI, INTERVAL, make_columns([10]))
+
+    assert store.read(FIGI, INTERVAL)['time'].tolist() == [10, 100, 220, 340, 460]
+    assert store.get_first_time(FIGI, INTERVAL) == 10
+    assert store.get_last_time(FIGI, INTERVAL) == 460
+
+
+def test_write_inside_stored_bars_keeps_new_values(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 160, 220, 280]))
+    store.write(FIGI, INTERVAL, make_columns([130, 160], close=[1, 2]))
+
+    data = store.read(FIGI, INTERVAL)
+
+    assert data['time'].tolist() == [100, 130, 160, 220, 280]
+    assert data['close'].tolist() == [100, 1, 2, 220, 280]
+    assert {len(values) for values in data.values()} == {5}
+
+
+def test_read_window(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 160, 220, 280]))
+
+    assert store.read(FIGI, INTERVAL, to_datetime(160))['time'].tolist() == [160, 220, 280]
+    assert store.read(FIGI, INTERVAL, 1000)['time'].tolist() == []
+
+
+def test_sync_fetches_only_new_bars(store):
+    fetch = FakeFetch(600, 1200)
+    store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+    fetch.times = np.arange(600, 1500 + 1, 60)
+
+    data = store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+
+    assert fetch.calls == [(600, None), (1200, None)]
+    assert data['time'].tolist() == list(range(600, 1501, 60))
+
+
+def test_sync_backfills_window_start_once(store):
+    fetch = FakeFetch(600, 1200)
+    store.sync(FIGI, INTERVAL, to_datetime(900), fetch)
+    fetch.calls = []
+
+    data = store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+
+    assert fetch.calls == [(600, 900), (1200, None)]
+    assert data['time'].tolist() == list(range(600, 1201, 60))
+
+
+def test_sync_remembers_empty_window_start(store):
+    # В начале окна баров нет (рынок закрыт): повторно его не запрашиваем
+    fetch = FakeFetch(900, 1200)
+    store.sync(FIGI, INTERVAL, to_datetime(900), fetch)
+    store.sync(FIGI, INTERVAL, to_datetime(300), fetch)
+    fetch.calls = []
+
+    store.sync(FIGI, INTERVAL, to_datetime(300), fetch)
+    store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+
+    assert fetch.calls == [(1200, None), (1200, None)]
+
+
+def test_failed_fetch_is_retried(store):
+    fetch = FakeFetch(600, 1200, fail=True)
+
+    data = store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+    assert data['time'].tolist() == []
+
+    fetch.fail = False
+    data = store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+    assert fetch.calls == [(600, None), (600, None)]
+    assert data['time'].tolist() == list(range(600, 1201, 60))
+
+
+def test_failed_backfill_is_retried(store):
+    fetch = FakeFetch(600, 1200)
+    store.sync(FIGI, INTERVAL, to_datetime(900), fetch)
+    fetch.fail = True
+    store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+    fetch.fail = False
+    fetch.calls = []
+
+    store.sync(FIGI, INTERVAL, to_datetime(600), fetch)
+
+    assert fetch.calls[0] == (600, 900)
+
+
+def test_read_ignores_partly_written_bars(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 160]))
+    # Падение посреди дозаписи: бар успел попасть только в часть колонок
+    for column in ('time', 'open'):
+        with open(store._get_column_path(FIGI, INTERVAL, column), 'ab') as file:
+            file.write(np.array([220], dtype=store.COLUMNS[column]).tobytes()[:5])
+    with open(store._get_column_path(FIGI, INTERVAL, 'close'), 'ab') as file:
+        file.write(np.array([220], dtype=np.float64).tobytes())
+
+    data = store.read(FIGI, INTERVAL)
+    assert {column: values.tolist() for column, values in data.items() if column in ('time', 'close')} == {
+        'time': [100, 160], 'close': [100, 160],
+    }
+
+    store.write(FIGI, INTERVAL, make_columns([160, 220]))
+    data = store.read(FIGI, INTERVAL)
+    assert data['time'].tolist() == [100, 160, 220]
+    assert {len(values) for values in data.values()} == {3}
+
+
+
+def test_interrupted_merge_is_completed(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 160]))
+    merged = make_columns([40, 100, 160])
+    for column, dtype in store.COLUMNS.items():
+        with open(store._get_column_path(FIGI, INTERVAL, column) + '.tmp', 'wb') as file:
+            file.write(np.asarray(merged[column], dtype=dtype).tobytes())
+    open(store._get_merge_marker_path(FIGI, INTERVAL), 'wb').close()
+    # Падение после отметки: часть колонок уже подменена
+    os.replace(store._get_column_path(FIGI, INTERVAL, 'time') + '.tmp', store._get_column_path(FIGI, INTERVAL, 'time'))
+
+    data = CandleStore(store.root_dir).read(FIGI, INTERVAL)
+
+    assert data['time'].tolist() == [40, 100, 160]
+    assert data['close'].tolist() == [40, 100, 160]
+    assert not os.path.exists(store._get_merge_marker_path(FIGI, INTERVAL))
+
+
+def test_unfinished_merge_is_discarded(store):
+    store.write(FIGI, INTERVAL, make_columns([100, 160]))
+    with open(store._get_column_path(FIGI, INTERVAL, 'time') + '.tmp', 'wb') as file:
+        file.write(np.array([40, 100, 160], dtype=np.int64).tobytes())
+
+    data = CandleStore(store.root_dir).read(FIGI, INTERVAL)
+
+    assert data['time'].tolist() == [100, 160]
+    assert not os.path.exists(store._get_column_path(FIGI, INTERVAL, 'time') + '.tmp')
+
+
+def test_concurrent_syncs_keep_columns_aligned(store):
+    fetch = FakeFetch(0, 60 * 500)
+    errors = []
+
+    def run(offset):
+        try:
+            for i in range(30):
+                store.sync(FIGI, INTERVAL, to_datetime(60 * (offset + 10 * (30 - i))), fetch)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    data = store.read(FIGI, INTERVAL)
+    assert not errors
+    assert {len(values) for values in data.values()} == {len(data['time'])}
+    assert (np.diff(data['time']) > 0).all()
+    assert (data['close'] == data['time']).all()
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+grpc = pytest.importorskip('grpc')
+pytest.importorskip('tinkoff.invest')
+
+from tinkoff.invest.exceptions import RequestError
+
+from client_pool import AsyncClientPool, ClientPool
+from fake_api import FakeTinkoffAPI
+from metrics import Metrics
+
+
+@pytest.fixture
+def api():
+    return FakeTinkoffAPI.synthetic(n_instruments=3, n_bars=10)
+
+
+def test_get_client_reuses_services(api):
+    pool = ClientPool(None, services_factory=api.get_services)
+
+    with pool.get_client() as client:
+        accounts = client.users.get_accounts().accounts
+    with pool.get_client() as other:
+        pass
+
+    assert accounts
+    assert other is client
+    assert pool.reconnects == 0
+
+
+def test_api_calls_are_counted(api):
+    metrics = Metrics()
+    pool = ClientPool(None, services_factory=api.get_services, metrics=metrics)
+
+    with pool.get_client() as client:
+        client.users.get_accounts()
+        client.users.get_accounts()
+
+    assert metrics.counters[('api_calls', (('method', 'get_accounts'), ('service', 'users')))] == 2
+
+
+def test_unavailable_error_reconnects(api):
+    pool = ClientPool(None, services_factory=api.get_services)
+    with pool.get_client() as client:
+        pass
+
+    api.error_rate = 1.0
+    with pytest.raises(RequestError):
+        with pool.get_client() as broken:
+            broken.users.get_accounts()
+    api.error_rate = 0.0
+
+    assert pool.reconnects == 1
+    with pool.get_client() as new_client:
+        assert new_client.users.get_accounts().accounts
+    assert new_client is not client
+
+
+class SlowCheckPool(ClientPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.check_started = threading.Event()
+        self.check_finished = threading.Event()
+        self.healthy = True
+
+    def _is_healthy(self, channel):
+        self.check_started.set()
+        self.check_finished.wait(5)
+        return self.healthy
+
+
+@pytest.mark.parametrize('healthy', [True, False])
+def test_health_check_does_not_block_other_threads(api, healthy):
+    pool = SlowCheckPool(None, services_factory=api.get_services, health_check_interval=0)
+    pool.healthy = healthy
+    services = pool.acquire()
+
+    checker = threading.Thread(target=pool.acquire)
+    checker.start()
+    assert pool.check_started.wait(5)
+
+    # Пока идёт проверка, другие потоки получают текущий клиент без ожидания
+    pool.last_check_time = float('inf')
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    thread.join(1)
+    assert acquired == [services]
+
+    pool.check_finished.set()
+    checker.join(5)
+    assert pool.reconnects == (0 if healthy else 1)
+
+
+def test_async_pool(api):
+    metrics = Metrics()
+    pool = AsyncClientPool(None, services_factory=api.get_async_services, metrics=metrics)
+
+    async def run():
+        async with pool.get_client() as client:
+            await client.users.get_accounts()
+        api.error_rate = 1.0
+        with pytest.raises(RequestError):
+            async with pool.get_client() as client:
+                await client.users.get_accounts()
+        api.error_rate = 0.0
+        async with pool.get_client() as client:
+            await client.users.get_accounts()
+        await pool.close()
+
+    asyncio.run(run())
+    assert pool.reconnects == 1
+    assert metrics.counters[('api_calls', (('method', 'get_accounts'), ('service', 'users')))] == 3
+
+
+PING = '/test.Echo/Ping'
+
+
+def start_server(port=0):
+    """
+    Локальный gRPC-сервер с одним методом, отвечающим эхом.
+    """
+    handler = grpc.method_handlers_generic_handler('test.Echo', {
+        'Ping': grpc.unary_unary_rpc_method_handler(lambda request, context: request),
+    })
+    server = grpc.server(ThreadPoolExecutor(max_workers=2), handlers=[handler])
+    port = server.add_insecure_port(f'localhost:{port}')
+    server.start()
+    return server, port
+
+
+def ping(pool):
+    with pool.get_client():
+        return pool.channel.unary_unary(PING)(b'ping', timeout=2)
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(port=0):
+        server, port = start_server(port)
+        servers.append(server)
+        return server, port
+
+    yield start
+    for server in servers:
+        server.stop(None)
+
+
+def test_health_check_replaces_dead_channel(server):
+    grpc_server, port = server()
+    pool = ClientPool(None, target=f'localhost:{port}', secure=False, health_check_interval=0, connect_timeout=0.5)
+    assert ping(pool) == b'ping'
+    channel = pool.channel
+    disconnected = threading.Event()
+    channel.subscribe(lambda state: state != grpc.ChannelConnectivity.READY and disconnected.set())
+
+    grpc_server.stop(None).wait()
+    # Клиент узнаёт об остановке сервера асинхронно, по GOAWAY
+    assert disconnected.wait(5)
+    pool.acquire()
+    assert pool.reconnects == 1
+    assert pool.channel is not channel
+
+    server(port)
+    assert ping(pool) == b'ping'
+    assert pool.reconnects == 1
+    pool.close()
+
+
+def test_unavailable_call_invalidates_channel(server):
+    grpc_server, port = server()
+    pool = ClientPool(None, target=f'localhost:{port}', secure=False, connect_timeout=0.5)
+    assert ping(pool) == b'ping'
+    channel = pool.channel
+
+    grpc_server.stop(None).wait()
+    with pytest.raises(grpc.RpcError) as error:
+        ping(pool)
+    assert error.value.code() == grpc.StatusCode.UNAVAILABLE
+    assert pool.channel is None
+    assert pool.reconnects == 1
+
+    server(port)
+    assert ping(pool) == b'ping'
+    assert pool.channel is not channel
+    pool.close()
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from data_handler import InstrumentCache, JsonDBHandler
+
+
+STOCK_INFO = {'lot': 10, 'ticker': 'SBER', 'price_step': Decimal('0.01')}
+
+
+def make_cache(tmp_path, ttl=timedelta(days=1)):
+    return InstrumentCache(str(tmp_path / 'instruments.json'), ttl=ttl)
+
+
+def test_instrument_cache_empty_is_expired(tmp_path):
+    cache = make_cache(tmp_path)
+
+    assert cache.is_expired()
+    assert cache.get('FIGI1') is None
+
+
+def test_instrument_cache_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl=timedelta(hours=1))
+    updated = datetime(2024, 1, 1, 12, 0, 0)
+    cache.update('FIGI1', STOCK_INFO)
+    cache.save(updated)
+
+    assert not cache.is_expired(updated + timedelta(minutes=59))
+    assert cache.is_expired(updated + timedelta(hours=1))
+    # Устаревший кэш продолжает отдавать значения до обновления
+    assert cache.get('FIGI1') == STOCK_INFO
+
+
+def test_instrument_cache_persists(tmp_path):
+    updated = datetime(2024, 1, 1, 12, 0, 0)
+    cache = make_cache(tmp_path)
+    cache.update('FIGI1', STOCK_INFO)
+    cache.save(updated)
+
+    reloaded = make_cache(tmp_path)
+
+    assert reloaded.get('FIGI1') == STOCK_INFO
+    assert isinstance(reloaded.get('FIGI1')['price_step'], Decimal)
+    assert not reloaded.is_expired(updated + timedelta(hours=1))
+
+
+def test_instrument_cache_refresh_updates_time(tmp_path):
+    cache = make_cache(tmp_path, ttl=timedelta(hours=1))
+    updated = datetime(2024, 1, 1, 12, 0, 0)
+    cache.update('FIGI1', STOCK_INFO)
+    cache.save(updated)
+
+    refreshed = updated + timedelta(hours=2)
+    cache.update('FIGI1', dict(STOCK_INFO, lot=1))
+    cache.save(refreshed)
+
+    assert not cache.is_expired(refreshed + timedelta(minutes=30))
+    assert make_cache(tmp_path).get('FIGI1')['lot'] == 1
+
+
+def test_instrument_cache_clean(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.update('FIGI1', STOCK_INFO)
+    cache.save(datetime.now())
+
+    cache.clean()
+
+    assert cache.get('FIGI1') is None
+    assert cache.is_expired()
+    assert make_cache(tmp_path).get('FIGI1') is None
+
+
+def make_db(tmp_path, data=None):
+    db = JsonDBHandler(str(tmp_path / 'db.json'))
+    for ticker, info in (data or {}).items():
+        db.update_data(ticker, info)
+    return db
+
+
+def linear_search(db, stock_info):
+    return next((ticker for ticker, info in db.get_data().items() if info == stock_info), None)
+
+
+def test_reverse_index_lookup(tmp_path):
+    db = make_db(tmp_path, {'SBER': 'FIGI1', 'GAZP': 'FIGI2'})
+
+    assert db.get_ticker_by_info('FIGI1') == 'SBER'
+    assert db.get_ticker_by_info('FIGI3') is None
+    assert db.get_tickers_by_infos(['FIGI2', 'FIGI3']) == {'FIGI2': 'GAZP', 'FIGI3': None}
+
+
+def test_reverse_index_rebuilt_on_load(tmp_path):
+    db = make_db(tmp_path, {'SBER': 'FIGI1', 'SBERP': 'FIGI1', 'GAZP': 'FIGI2'})
+    db.save_data_to_file()
+
+    reloaded = make_db(tmp_path)
+
+    assert reloaded.reverse_index == {'FIGI1': 'SBER', 'FIGI2': 'GAZP'}
+
+
+def test_reverse_index_update_moves_entry(tmp_path):
+    db = make_db(tmp_path, {'SBER': 'FIGI1'})
+
+    db.update_data('SBER', 'FIGI2')
+
+    assert db.get_ticker_by_info('FIGI1') is None
+    assert db.get_ticker_by_info('FIGI2') == 'SBER'
+
+
+def test_reverse_index_keeps_shared_info(tmp_path):
+    db = make_db(tmp_path, {'SBER': 'FIGI1', 'SBERP': 'FIGI1'})
+
+    db.update_data('SBER', 'FIGI2')
+
+    assert db.get_ticker_by_info('FIGI1') == 'SBERP'
+    assert db.get_ticker_by_info('FIGI2') == 'SBER'
+
+
+def test_reverse_index_matches_linear_search(tmp_path):
+    db = make_db(tmp_path)
+    updates = [('A', 'X'), ('B', 'Y'), ('C', 'X'), ('A', 'Y'), ('B', 'Z'), ('C', 'Y'), ('A', 'X'),
+               ('B', 'X'), ('D', 'Z'), ('A', {'lot': 1}), ('C', 'Z')]
+
+    for ticker, info in updates:
+        db.update_data(ticker, info)
+        for value in ['X', 'Y', 'Z', 'W']:
+            assert db.get_ticker_by_info(value) == linear_search(db, value)
@@ -0,0 +1,63 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tinkoff.invest')
+pytest.importorskip('tradingview_screener')
+
+import param_sweep
+from param_sweep import _run_task, _split_tasks, build_grid, random_grid
+
+
+def make_panel(n_tickers=30, n_bars=500, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, (n_tickers, n_bars)), axis=1)
+    return {
+        'tickers': [f"T{i}" for i in range(n_tickers)],
+        'time': 1_700_000_000 + 120 * np.arange(n_bars),
+        'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+        'volume': np.full((n_tickers, n_bars), 1000.0),
+        'mask': rng.random((n_tickers, n_bars)) > 0.05,
+    }
+
+
+def get_peak_memory(params_list):
+    param_sweep._worker.update(panel=make_panel(), backtester_kwargs={}, cache={})
+    # Индикаторы и порядок баров кэшируются на весь процесс, прогреваем их заранее
+    _run_task(params_list[:1])
+    tracemalloc.start()
+    try:
+        _run_task(params_list)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_peak_memory_does_not_grow_with_chunk_size():
+    grid = [{'bandwith': 23, 'r': r, 'x0': x0, 'lag': 2} for r, x0 in zip(range(2, 18), range(5, 21))]
+
+    small = get_peak_memory(grid[:4])
+    large = get_peak_memory(grid)
+
+    assert large < small * 1.5
+    yhat_keys = [key for key in param_sweep._worker['cache'] if isinstance(key, tuple) and key[0] == 'yhat']
+    assert len(yhat_keys) <= 2
+
+
+def test_split_tasks_keeps_bandwith_and_orders_by_kernel():
+    grid = random_grid(200, seed=0)
+
+    tasks = _split_tasks(grid, max_workers=4)
+
+    assert sorted(map(str, (params for task in tasks for params in task))) == sorted(map(str, grid))
+    for task in tasks:
+        assert len({params['bandwith'] for params in task}) == 1
+        keys = [(params['x0'], params['r'], params['lag']) for params in task]
+        assert keys == sorted(keys)
+
+
+def test_build_grid_skips_lag_not_less_than_bandwith():
+    grid = build_grid(bandwith=(2, 8), lag=(1, 2, 3))
+
+    assert {(params['bandwith'], params['lag']) for params in grid} == {(2, 1), (8, 1), (8, 2), (8, 3)}
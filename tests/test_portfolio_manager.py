@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('tinkoff.invest')
+
+from async_portfolio_manager import AsyncTinkoffSandboxOrderManager
+from client_pool import AsyncClientPool, ClientPool
+from fake_api import FakeTinkoffAPI
+from portfolio_manager import TinkoffOrderManager, TinkoffSandboxOrderManager
+
+
+@pytest.fixture
+def api():
+    return FakeTinkoffAPI.synthetic(n_instruments=3, n_bars=10)
+
+
+def make_manager(api, tmp_path, manager_class=TinkoffOrderManager):
+    return manager_class(
+        str(tmp_path / 'db.json'),
+        api_key=None,
+        candles_path=str(tmp_path / 'candles'),
+        client_pool=ClientPool(None, services_factory=api.get_services),
+    )
+
+
+def test_instruments_loaded_once(api, tmp_path):
+    make_manager(api, tmp_path)
+    calls = api.stats['instruments']['calls']
+
+    manager = make_manager(api, tmp_path)
+    manager.refresh_instruments(force=False)
+
+    assert api.stats['instruments']['calls'] == calls
+    ticker = next(iter(api.instruments.values()))['ticker']
+    figi = manager.get_figi_by_ticker(ticker)
+    assert manager.get_info_by_figi(figi)['ticker'] == ticker
+    assert api.stats['instruments']['calls'] == calls
+
+
+def test_expired_instruments_refreshed(api, tmp_path):
+    manager = make_manager(api, tmp_path)
+    calls = api.stats['instruments']['calls']
+    expired = datetime.now() - timedelta(days=2)
+    manager.db.save_last_update_time(expired)
+    manager.instruments.db.save_last_update_time(expired)
+
+    manager.refresh_instruments(force=False)
+
+    assert api.stats['instruments']['calls'] == calls + 1
+    assert not manager.instruments.is_expired()
+
+
+def test_forced_refresh(api, tmp_path):
+    manager = make_manager(api, tmp_path)
+    calls = api.stats['instruments']['calls']
+
+    manager.refresh_instruments()
+
+    assert api.stats['instruments']['calls'] == calls + 1
+
+
+def test_sandbox_buy_stock_now_matches_async(api, tmp_path):
+    instrument = next(iter(api.instruments.values()))
+    (tmp_path / 'sync').mkdir()
+    (tmp_path / 'async').mkdir()
+    sync_sandbox = make_manager(api, tmp_path / 'sync', TinkoffSandboxOrderManager)
+    async_sandbox = AsyncTinkoffSandboxOrderManager(
+        make_manager(api, tmp_path / 'async', TinkoffSandboxOrderManager),
+        AsyncClientPool(None, services_factory=api.get_async_services),
+    )
+
+    worth = sync_sandbox.buy_stock_now(instrument['ticker'], 3)
+    async_worth = asyncio.run(async_sandbox.buy_stock_now(instrument['ticker'], 3))
+
+    assert worth > 0
+    assert worth == async_worth
+    assert sync_sandbox.get_balance() == async_sandbox.get_balance() == sync_sandbox.capital - worth
+    assert sync_sandbox.portfolio_stocks == async_sandbox.order_manager.portfolio_stocks
+    assert sync_sandbox.portfolio_stocks[0]['quantity'] == 3
+
+
+def test_sandbox_buy_stock_now_unknown_ticker(api, tmp_path):
+    sandbox = make_manager(api, tmp_path, TinkoffSandboxOrderManager)
+
+    assert sandbox.buy_stock_now('UNKNOWN', 1) == 0
+    assert sandbox.get_balance() == sandbox.capital
+    assert sandbox.portfolio_stocks == []
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+
+from predictor import RFPredictor
+
+
+def make_bars(n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n_bars))
+    start = datetime(2026, 1, 5, 7, tzinfo=timezone.utc)
+    return [
+        {'open': price, 'high': price + 1, 'low': price - 1, 'close': price, 'volume': 100, 'time': start + timedelta(minutes=2 * i)}
+        for i, price in enumerate(close)
+    ]
+
+
+def make_predictor(models_path, **kwargs):
+    return RFPredictor(23, max_workers=1, models_path=str(models_path), **kwargs)
+
+
+def test_snapshot_load_predict_retrain(tmp_path):
+    bars = make_bars(400)
+    make_predictor(tmp_path).get_predictions_next_close([('A', bars[:300])])
+
+    predictor = make_predictor(tmp_path)
+    predictor.get_predictions_next_close([('A', bars[:302])])
+    assert predictor.stats['loads'] == 1
+    assert predictor.stats['hits'] == 1
+    assert predictor.stats['retrains'] == 0
+
+    predictor.get_predictions_next_close([('A', bars[:330])])
+    assert predictor.stats['retrains'] == 1
+    assert predictor.models['A']['trained_time'] == bars[329]['time']
+
+    # Переобученная модель сохранена в снимок
+    reloaded = make_predictor(tmp_path)
+    reloaded.get_predictions_next_close([('A', bars[:330])])
+    assert reloaded.stats['hits'] == 1
+    assert reloaded.stats['retrains'] == 0
+
+
+def test_stale_retrains_are_spread_over_calls(tmp_path):
+    tickers = ['A', 'B', 'C', 'D', 'E']
+    data = {ticker: make_bars(400, seed=seed) for seed, ticker in enumerate(tickers)}
+    make_predictor(tmp_path).get_predictions_next_close([(ticker, bars[:300]) for ticker, bars in data.items()])
+
+    predictor = make_predictor(tmp_path, max_stale_retrains=2, drift_threshold=float('inf'))
+    predictions = predictor.get_predictions_next_close([(ticker, bars[:330]) for ticker, bars in data.items()])
+    assert set(predictions) == set(tickers)
+    assert predictor.stats['retrains'] == 2
+    assert predictor.stats['deferred'] == 3
+
+    predictor.get_predictions_next_close([(ticker, bars[:331]) for ticker, bars in data.items()])
+    predictor.get_predictions_next_close([(ticker, bars[:332]) for ticker, bars in data.items()])
+    assert predictor.stats['retrains'] == 5
+    assert all(predictor.models[ticker]['trained_time'] >= data[ticker][329]['time'] for ticker in tickers)
+
+
+def test_drifted_model_is_retrained_regardless_of_limit(tmp_path):
+    bars = make_bars(400)
+    predictor = make_predictor(tmp_path, max_stale_retrains=0)
+    predictor.get_predictions_next_close([('A', bars[:300])])
+
+    shifted = [dict(bar, **{column: bar[column] * 3 for column in ('open', 'high', 'low', 'close')}) if i >= 298 else bar
+               for i, bar in enumerate(bars[:302])]
+    predictor.get_predictions_next_close([('A', shifted)])
+
+    assert predictor.stats['retrains'] == 1
+    assert predictor.models['A']['trained_time'] == shifted[-1]['time']
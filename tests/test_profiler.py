@@ -0,0 +1,43 @@
+import asyncio
+import pstats
+
+from profiler import CycleProfiler
+
+
+def strategy_step():
+    return sum(range(10000))
+
+
+async def broker_call():
+    await asyncio.sleep(0)
+    return sum(range(10000))
+
+
+async def poll(profiler):
+    with profiler.cycle():
+        await broker_call()
+        await asyncio.to_thread(profiler.run, strategy_step)
+
+
+def test_profile_covers_event_loop_and_strategy_threads(tmp_path):
+    profiler = CycleProfiler(str(tmp_path))
+    profiler.start(2, chat_id=1)
+
+    asyncio.run(poll(profiler))
+    assert profiler.end_cycle() is None
+    asyncio.run(poll(profiler))
+    path, chat_id, top = profiler.end_cycle()
+
+    functions = {function for _, _, function in pstats.Stats(path).stats}
+    assert {'broker_call', 'strategy_step'} <= functions
+    assert chat_id == 1
+    assert top.startswith("Всего")
+
+
+def test_disabled_profiler_is_transparent(tmp_path):
+    profiler = CycleProfiler(str(tmp_path))
+
+    asyncio.run(poll(profiler))
+
+    assert profiler.stats is None
+    assert profiler.end_cycle() is None
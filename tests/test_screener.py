@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tinkoff.invest')
+pytest.importorskip('tradingview_screener')
+
+import data_reciever
+from data_reciever import MoneyFlowStrategy
+from screener import RecordingScreener, ReplayScreener, _get_names_filter
+
+
+class TableScreener:
+    """
+    Скринер без сети: отвечает строками таблицы, отфильтрованными по name.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.queries = []
+
+    def get_scanner_data(self, query):
+        self.queries.append(query.query)
+        names = _get_names_filter(query)
+        data = self.table if names is None else self.table[self.table['name'].isin(names)]
+        data = data[['ticker', *query.query['columns']]].head(query.query['range'][1]).reset_index(drop=True)
+        return len(data), data
+
+
+def make_table(names, columns=None, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = columns or MoneyFlowStrategy().indicators[1:]
+    table = pd.DataFrame(rng.uniform(1, 100, (len(names), len(columns))), columns=columns)
+    table.insert(0, 'name', names)
+    table.insert(0, 'ticker', [f"MOEX:{name}" for name in names])
+    return table
+
+
+@pytest.fixture
+def screener():
+    return TableScreener(make_table([f"T{i}" for i in range(80)]))
+
+
+def test_get_data_stocks_makes_one_request(screener):
+    strategy = MoneyFlowStrategy(screener=screener)
+
+    stocks = strategy.get_data_stocks(['T1', 'T2', 'T1'])
+
+    assert list(stocks) == ['T1', 'T2']
+    assert len(screener.queries) == 1
+    assert screener.queries[0]['filter'][0]['right'] == ['T1', 'T2']
+    assert stocks['T1']['close'] == round(screener.table.loc[1, 'close'], 3)
+
+
+@pytest.mark.parametrize('n_tickers, limit', [(3, 50), (50, 50), (70, 70)])
+def test_query_limit_covers_all_tickers(screener, n_tickers, limit):
+    strategy = MoneyFlowStrategy(screener=screener)
+
+    stocks = strategy.get_data_stocks([f"T{i}" for i in range(n_tickers)])
+
+    assert screener.queries[0]['range'][1] == limit
+    assert len(stocks) == n_tickers
+
+
+def test_missing_ticker_is_skipped(screener):
+    strategy = MoneyFlowStrategy(screener=screener)
+
+    assert list(strategy.get_data_stocks(['T1', 'NOPE'])) == ['T1']
+    assert strategy.get_data_stock('NOPE') is None
+    assert strategy.check_sell('NOPE') is False
+
+
+def test_cache_ttl(screener, monkeypatch):
+    current_time = [1000.0]
+    monkeypatch.setattr(data_reciever.time, 'monotonic', lambda: current_time[0])
+    strategy = MoneyFlowStrategy(screener=screener)
+    strategy.cache_ttl = 15
+
+    strategy.get_data_stocks(['T1', 'T2'])
+    current_time[0] += 10
+    strategy.get_data_stocks(['T1', 'T2', 'T3'])
+    assert [query['filter'][0]['right'] for query in screener.queries] == [['T1', 'T2'], ['T3']]
+
+    current_time[0] += 10
+    strategy.get_data_stocks(['T1', 'T2', 'T3'])
+    assert screener.queries[-1]['filter'][0]['right'] == ['T1', 'T2']
+
+
+def test_cached_data_is_copied(screener):
+    strategy = MoneyFlowStrategy(screener=screener)
+
+    strategy.get_data_stock('T1')['close'] = -1
+
+    assert strategy.get_data_stock('T1')['close'] != -1
+
+
+def test_replay_matches_recording(screener, tmp_path):
+    recorded = MoneyFlowStrategy(screener=RecordingScreener(str(tmp_path), screener))
+    recorded.cache_ttl = 0
+    expected = [recorded.get_data_stocks(['T1', 'T2', 'T3']), recorded.get_data_stocks(['T1', 'T2', 'T3'])]
+
+    replayed = MoneyFlowStrategy(screener=ReplayScreener(str(tmp_path)))
+    replayed.cache_ttl = 0
+    result = [replayed.get_data_stocks(['T1', 'T2', 'T3']), replayed.get_data_stocks(['T1', 'T2', 'T3'])]
+
+    assert result == expected
+    with pytest.raises(LookupError):
+        replayed.get_data_stocks(['T1', 'T2', 'T3'])
+
+
+def test_replay_answers_unrecorded_names_from_last_response(screener, tmp_path):
+    recorded = MoneyFlowStrategy(screener=RecordingScreener(str(tmp_path), screener))
+    expected = recorded.get_data_stocks(['T1', 'T2', 'T3'])
+
+    replayed = MoneyFlowStrategy(screener=ReplayScreener(str(tmp_path)))
+    replayed.get_data_stocks(['T1', 'T2', 'T3'])
+    replayed.stocks_cache = {}
+
+    assert replayed.get_data_stocks(['T2', 'NOPE']) == {'T2': expected['T2']}
+
+
+class FakeBroker:
+    def __init__(self, closes):
+        self.closes = closes
+
+    def get_historical_data(self, ticker, days):
+        if ticker not in self.closes:
+            return 0
+        return [{'open': close, 'high': close, 'low': close, 'close': close, 'volume': 1} for close in self.closes[ticker]]
+
+
+def test_nadaraya_lookup_does_not_touch_signals():
+    table = make_table(['T1', 'T2'], columns=['relative_volume_10d_calc|15', 'MACD.macd|15', 'MACD.signal|15', 'MoneyFlow|15'])
+    strategy = data_reciever.NadarayaWatsonStrategy(FakeBroker({'T1': [1.0, 2.0, 3.0]}), screener=TableScreener(table), predictor='rls')
+
+    stocks = strategy.get_data_stocks(['T1', 'T2'])
+
+    assert stocks['T1']['close'] == 3.0
+    assert 'close' not in stocks['T2']
+    assert strategy.signals == {}
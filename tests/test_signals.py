@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tinkoff.invest')
+pytest.importorskip('tradingview_screener')
+
+from data_reciever import (NadarayaWatsonSignal, build_close_panel, generate_signals, generate_signals_batch,
+                           generate_signals_panel, kernel_regression)
+
+
+def generate_signals_rolling(data_array, h=8, r=8, x_0=25, smooth_colors=False, lag=2):
+    """
+    Прежняя реализация: rolling().apply с kernel_regression на каждом окне.
+    """
+    df = pd.DataFrame(data_array)
+    df['yhat1'] = df['close'].rolling(window=h).apply(lambda x: kernel_regression(src=x, h=h, x_0=x_0, r=r), raw=True)
+    df['yhat2'] = df['close'].rolling(window=h - lag).apply(lambda x: kernel_regression(x, h=h - lag, x_0=x_0, r=r), raw=True)
+
+    was_bearish = df['yhat1'].shift(2) > df['yhat1'].shift(1)
+    was_bullish = df['yhat1'].shift(2) < df['yhat1'].shift(1)
+    is_bearish = df['yhat1'].shift(1) > df['yhat1']
+    is_bullish = df['yhat1'].shift(1) < df['yhat1']
+    is_bullish_change = is_bullish & was_bearish
+
+    is_bullish_cross = (df['yhat2'].shift(1) < df['yhat1'].shift(1)) & (df['yhat2'] > df['yhat1'])
+    is_bearish_cross = (df['yhat2'].shift(1) > df['yhat1'].shift(1)) & (df['yhat2'] < df['yhat1'])
+
+    color_by_cross = np.where(df['yhat2'] > df['yhat1'], 'green', 'red')
+    color_by_rate = np.where(is_bullish, 'green', 'red')
+    df['plotColor'] = np.where(smooth_colors, color_by_cross, color_by_rate)
+    df['alertBullish'] = np.where(smooth_colors, is_bearish_cross, is_bullish_change)
+    df['alertBearish'] = np.where(smooth_colors, is_bullish_cross, is_bullish_change)
+    return df[['close', 'yhat1', 'yhat2', 'plotColor', 'alertBullish', 'alertBearish']]
+
+
+def random_walk(size, seed):
+    rng = np.random.default_rng(seed)
+    return 100 + np.cumsum(rng.normal(0, 1, size))
+
+
+@pytest.mark.parametrize('h, r, x_0, lag', [(23, 20, 25, 2), (8, 8, 25, 2), (30, 5, 10, 3), (12, 1.5, 0, 4), (5, 8, 25, 1)])
+@pytest.mark.parametrize('smooth_colors', [False, True])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_generate_signals_matches_rolling(h, r, x_0, lag, smooth_colors, seed):
+    data = [{'close': close} for close in random_walk(300, seed)]
+
+    expected = generate_signals_rolling(data, h=h, r=r, x_0=x_0, smooth_colors=smooth_colors, lag=lag)
+    result = generate_signals(data, h=h, r=r, x_0=x_0, smooth_colors=smooth_colors, lag=lag)
+
+    for column in ['close', 'yhat1', 'yhat2']:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-9, equal_nan=True)
+    for column in ['plotColor', 'alertBullish', 'alertBearish']:
+        np.testing.assert_array_equal(result[column].to_numpy(), expected[column].to_numpy())
+
+
+def test_generate_signals_short_series():
+    data = [{'close': close} for close in random_walk(5, 0)]
+
+    result = generate_signals(data, h=8, lag=2)
+
+    assert result['yhat1'].isna().all()
+    assert result['yhat2'].isna().all()
+    assert not result['alertBullish'].any()
+
+
+def assert_signal_matches(signal, expected):
+    for column in ['close', 'yhat1', 'yhat2']:
+        np.testing.assert_allclose(signal[column], expected[column], rtol=1e-9, equal_nan=True)
+    for column in ['plotColor', 'alertBullish', 'alertBearish']:
+        assert signal[column] == expected[column], column
+
+
+@pytest.mark.parametrize('h, r, x_0, lag', [(8, 8, 25, 2), (23, 20, 25, 2), (12, 1.5, 0, 4)])
+@pytest.mark.parametrize('smooth_colors', [False, True])
+def test_streaming_matches_generate_signals(h, r, x_0, lag, smooth_colors):
+    closes = random_walk(120, 3)
+    stream = NadarayaWatsonSignal(h=h, r=r, x_0=x_0, smooth_colors=smooth_colors, lag=lag)
+
+    for i, close in enumerate(closes):
+        signal = stream.update(close, time=i)
+        expected = generate_signals(closes[:i + 1], h=h, r=r, x_0=x_0, smooth_colors=smooth_colors, lag=lag)
+        assert_signal_matches(signal, expected.iloc[-1])
+
+
+@pytest.mark.parametrize('smooth_colors', [False, True])
+def test_streaming_replaces_forming_candle(smooth_colors):
+    closes = random_walk(80, 4)
+    forming = random_walk(80, 5)
+    stream = NadarayaWatsonSignal(h=8, smooth_colors=smooth_colors)
+
+    for i in range(len(closes)):
+        # Сначала незакрытая свеча, затем её финальная цена с тем же time
+        stream.update(forming[i], time=i)
+        signal = stream.update(closes[i], time=i)
+        expected = generate_signals(closes[:i + 1], h=8, smooth_colors=smooth_colors)
+        assert_signal_matches(signal, expected.iloc[-1])
+
+
+def test_streaming_update_bars_incremental():
+    closes = random_walk(100, 6)
+    forming = random_walk(100, 7)
+    stream = NadarayaWatsonSignal(h=8)
+
+    for i in range(1, len(closes) + 1, 3):
+        # Последний бар истории ещё формируется и при следующем вызове будет заменён
+        history = [{'close': close, 'time': t} for t, close in enumerate(closes[:i])]
+        history[-1] = {'close': forming[i - 1], 'time': i - 1}
+        signal = stream.update_bars(history)
+        expected = generate_signals(history, h=8)
+        assert_signal_matches(signal, expected.iloc[-1])
+
+
+def test_streaming_update_bars_without_time_recomputes():
+    closes = random_walk(50, 8)
+    stream = NadarayaWatsonSignal(h=8)
+    stream.update_bars([{'close': close} for close in random_walk(50, 9)])
+
+    signal = stream.update_bars([{'close': close} for close in closes])
+
+    assert_signal_matches(signal, generate_signals(closes, h=8).iloc[-1])
+
+
+def assert_batch_row_matches(result, i, expected):
+    signal = {column: result[column][i] for column in ['close', 'yhat1', 'yhat2', 'plotColor', 'alertBullish', 'alertBearish']}
+    assert_signal_matches(signal, expected)
+
+
+@pytest.mark.parametrize('smooth_colors', [False, True])
+def test_batch_matches_generate_signals_uneven_lengths(smooth_colors):
+    lengths = [200, 60, 11, 9, 3, 1]
+    histories = [[{'close': close} for close in random_walk(n, seed)] for seed, n in enumerate(lengths)]
+
+    result = generate_signals_batch(build_close_panel(histories), h=8, smooth_colors=smooth_colors)
+
+    np.testing.assert_array_equal(result['length'], lengths)
+    for i, history in enumerate(histories):
+        expected = generate_signals(history, h=8, smooth_colors=smooth_colors)
+        assert_batch_row_matches(result, i, expected.iloc[-1])
+
+
+def make_gapped_panel(n_tickers=5, n_bars=150, seed=10):
+    rng = np.random.default_rng(seed)
+    panel = np.stack([random_walk(n_bars, seed + i) for i in range(n_tickers)])
+    mask = rng.random(panel.shape) > 0.2
+    # Разная длина истории: первые бары части тикеров отсутствуют
+    mask[1, :40] = False
+    mask[2, :n_bars - 12] = False
+    return panel, mask
+
+
+@pytest.mark.parametrize('smooth_colors', [False, True])
+def test_batch_skips_gaps(smooth_colors):
+    panel, mask = make_gapped_panel()
+
+    result = generate_signals_batch(panel, h=8, smooth_colors=smooth_colors, mask=mask)
+    result_nan = generate_signals_batch(np.where(mask, panel, np.nan), h=8, smooth_colors=smooth_colors)
+
+    for i in range(panel.shape[0]):
+        expected = generate_signals(panel[i][mask[i]], h=8, smooth_colors=smooth_colors)
+        assert result['length'][i] == mask[i].sum()
+        assert_batch_row_matches(result, i, expected.iloc[-1])
+        assert_batch_row_matches(result_nan, i, expected.iloc[-1])
+
+
+@pytest.mark.parametrize('smooth_colors', [False, True])
+def test_panel_matches_generate_signals_with_gaps(smooth_colors):
+    panel, mask = make_gapped_panel()
+
+    result = generate_signals_panel(panel, h=8, smooth_colors=smooth_colors, mask=mask)
+
+    for i in range(panel.shape[0]):
+        expected = generate_signals(panel[i][mask[i]], h=8, smooth_colors=smooth_colors)
+        for column in ['yhat1', 'yhat2']:
+            np.testing.assert_allclose(result[column][i][mask[i]], expected[column], rtol=1e-9, equal_nan=True)
+        for column in ['plotColor', 'alertBullish', 'alertBearish']:
+            np.testing.assert_array_equal(result[column][i][mask[i]], expected[column].to_numpy())
+        assert all(color is None for color in result['plotColor'][i][~mask[i]])
+        assert not result['alertBullish'][i][~mask[i]].any()
+        assert not result['alertBearish'][i][~mask[i]].any()
+
+
+def test_panel_cache_matches_fresh_result():
+    panel, mask = make_gapped_panel()
+    cache = {}
+
+    for h, x_0, r in [(8, 25, 8), (12, 25, 8), (8, 10, 3), (8, 25, 8)]:
+        cached = generate_signals_panel(panel, h=h, x_0=x_0, r=r, mask=mask, cache=cache)
+        fresh = generate_signals_panel(panel, h=h, x_0=x_0, r=r, mask=mask)
+        for column in ['yhat1', 'yhat2']:
+            np.testing.assert_allclose(cached[column], fresh[column], rtol=1e-12, equal_nan=True)
+        for column in ['plotColor', 'alertBullish', 'alertBearish']:
+            np.testing.assert_array_equal(cached[column], fresh[column])